@@ -1,37 +1,65 @@
+from __future__ import annotations
+
+# Imported first: its clock is the script's start time
+from startup import STARTUP
 import os
 import streamlit as st
-from groq import Groq
 from streamlit_tags import st_tags
+from core import (
+    CANDIDATES,
+    COMPLEXITY_LEVELS,
+    LANGUAGES,
+    PRIMARY_MODEL,
+    CandidateSet,
+    Optimization,
+    apply_patch_response,
+    build_code_request,
+    build_explanation_request,
+    build_prefetch_jobs,
+    build_optimization_request,
+    build_patch_optimization_request,
+    complete,
+    explain_chunked,
+    extract_code_block,
+    find_similar_generation,
+    get_archive,
+    get_client,
+    get_highlighter,
+    get_history_store,
+    get_metrics,
+    get_output_budget,
+    get_prefetcher,
+    get_sandbox,
+    open_completion,
+    optimize_chunked,
+    remember_generation,
+    start_metrics_endpoint
+)
+from archive import ArchivedGeneration
+from chunking import plan_chunks
+from history import HistoryEntry
+from patching import PatchError, uses_patches
+from prefetch import PREFETCH_DEFAULT
+from sandbox import BenchmarkComparison
+from themes import THEMES, compiled_theme
+from ratelimit import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, PRIORITY_NORMAL, estimate_tokens
+from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import closing
+import difflib
+import threading
 import time
-from typing import Optional
+import uuid
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, Union
+
+if TYPE_CHECKING:
+    from groq import Groq
 
 # Configuration
-PRIMARY_MODEL = "qwen-2.5-coder-32b"
-BACKUP_MODEL = "llama3-70b-8192"
-LANGUAGES = ["Python", "JavaScript", "Java", "C++", "Go", "Rust", "TypeScript", "Swift", "Kotlin", "C#"]
-THEMES = ["Neon", "Cyberpunk", "Solarized", "Dracula", "Monokai", "Nord", "Ocean", "Matrix"]
-COMPLEXITY_LEVELS = {
-    "Basic": {
-        "description": "Simple implementation with minimal features",
-        "icon": "🌱",
-        "temperature": 0.3
-    },
-    "Medium": {
-        "description": "Well-structured code with comments and basic error handling",
-        "icon": "🚀",
-        "temperature": 0.5
-    },
-    "Advanced": {
-        "description": "Production-ready with tests, documentation, and robust error handling",
-        "icon": "💎",
-        "temperature": 0.7
-    },
-    "Expert": {
-        "description": "Optimized solution with advanced patterns, benchmarks, and scalability",
-        "icon": "🧠",
-        "temperature": 0.9
-    }
-}
+STREAM_RENDER_INTERVAL = 0.05  # seconds between partial re-renders while streaming
+ANALYSIS_WORKERS = 4  # concurrent LLM calls in the full analysis pipeline
+ADMIN_PANEL = os.getenv("ASTRACODE_ADMIN_PANEL", "0") == "1"  # telemetry panel in the sidebar
 
 # Streamlit UI Config
 st.set_page_config(
@@ -40,225 +68,102 @@ st.set_page_config(
     layout="wide",
     initial_sidebar_state="expanded"
 )
+STARTUP.mark("page_config")
 
 # Custom CSS for Modern Theme with advanced styling
 def inject_custom_css(theme="Neon"):
-    theme_properties = {
-        "Neon": {
-            "primary": "#4fffb0",
-            "secondary": "#ff4fd8",
-            "bg": "#1a1a2e",
-            "text": "#ffffff",
-            "accent": "#00ff88",
-            "gradient": "linear-gradient(135deg, #1a1a2e 0%, #16213e 100%)"
-        },
-        "Cyberpunk": {
-            "primary": "#ff2a6d",
-            "secondary": "#05d9e8",
-            "bg": "#1a1a2e",
-            "text": "#d1f7ff",
-            "accent": "#ff9a00",
-            "gradient": "linear-gradient(135deg, #1a1a2e 0%, #0d1b2a 100%)"
-        },
-        "Solarized": {
-            "primary": "#268bd2",
-            "secondary": "#d33682",
-            "bg": "#fdf6e3",
-            "text": "#073642",
-            "accent": "#cb4b16",
-            "gradient": "linear-gradient(135deg, #fdf6e3 0%, #eee8d5 100%)"
-        },
-        "Dracula": {
-            "primary": "#bd93f9",
-            "secondary": "#ff79c6",
-            "bg": "#282a36",
-            "text": "#f8f8f2",
-            "accent": "#50fa7b",
-            "gradient": "linear-gradient(135deg, #282a36 0%, #44475a 100%)"
-        },
-        "Monokai": {
-            "primary": "#a6e22e",
-            "secondary": "#fd971f",
-            "bg": "#272822",
-            "text": "#f8f8f2",
-            "accent": "#f92672",
-            "gradient": "linear-gradient(135deg, #272822 0%, #1e1f1c 100%)"
-        },
-        "Nord": {
-            "primary": "#81a1c1",
-            "secondary": "#d08770",
-            "bg": "#2e3440",
-            "text": "#d8dee9",
-            "accent": "#5e81ac",
-            "gradient": "linear-gradient(135deg, #2e3440 0%, #3b4252 100%)"
-        },
-        "Ocean": {
-            "primary": "#7fdbff",
-            "secondary": "#ff851b",
-            "bg": "#001f3f",
-            "text": "#ffffff",
-            "accent": "#2ecc40",
-            "gradient": "linear-gradient(135deg, #001f3f 0%, #0074d9 100%)"
-        },
-        "Matrix": {
-            "primary": "#00ff41",
-            "secondary": "#008f11",
-            "bg": "#000000",
-            "text": "#00ff41",
-            "accent": "#00ff41",
-            "gradient": "linear-gradient(135deg, #000000 0%, #003b00 100%)"
-        }
-    }
-    
-    colors = theme_properties.get(theme, theme_properties["Neon"])
-    
-    st.markdown(f"""
-    <style>
-        /* Base styles */
-        .main {{
-            background: {colors['gradient']} !important;
-            color: {colors['text']} !important;
-        }}
-        
-        /* Input fields */
-        .stTextInput input, .stSelectbox select, .stTextArea textarea {{
-            color: {colors['primary']} !important;
-            background: rgba(0,0,0,0.2) !important;
-            border-radius: 12px !important;
-            border: 1px solid {colors['secondary']} !important;
-            padding: 10px 15px !important;
-            box-shadow: 0 2px 10px rgba(0,0,0,0.1) !important;
-            transition: all 0.3s ease !important;
-        }}
-        
-        .stTextInput input:focus, .stSelectbox select:focus, .stTextArea textarea:focus {{
-            border-color: {colors['accent']} !important;
-            box-shadow: 0 0 0 2px {colors['accent']}33 !important;
-        }}
-        
-        /* Buttons */
-        .stButton>button {{
-            background: rgba(0,0,0,0.3) !important;
-            border: 2px solid {colors['primary']} !important;
-            color: {colors['primary']} !important;
-            border-radius: 12px !important;
-            padding: 8px 16px !important;
-            transition: all 0.3s ease !important;
-            font-weight: 600 !important;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1) !important;
-        }}
-        
-        .stButton>button:hover {{
-            background: {colors['primary']}22 !important;
-            transform: translateY(-2px) !important;
-            box-shadow: 0 6px 12px {colors['primary']}33 !important;
-        }}
-        
-        /* Code blocks */
-        .code-block {{
-            border: 2px solid {colors['secondary']};
-            border-radius: 15px;
-            padding: 1rem;
-            background: rgba(0,0,0,0.3);
-            margin-bottom: 1rem;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.2);
-        }}
-        
-        /* Sidebar */
-        .sidebar .sidebar-content {{
-            background: rgba(0,0,0,0.3) !important;
-            backdrop-filter: blur(10px) !important;
-            border-right: 1px solid {colors['secondary']}33 !important;
-        }}
-        
-        /* Headers */
-        h1, h2, h3, h4, h5, h6 {{
-            color: {colors['primary']} !important;
-            text-shadow: 0 2px 4px rgba(0,0,0,0.3);
-        }}
-        
-        /* Expander */
-        .st-expander {{
-            background: rgba(0,0,0,0.2) !important;
-            border: 1px solid {colors['secondary']} !important;
-            border-radius: 12px !important;
-        }}
-        
-        .st-expander .st-expanderHeader {{
-            color: {colors['primary']} !important;
-            font-weight: 600 !important;
-        }}
-        
-        /* Progress bar */
-        .stProgress > div > div > div {{
-            background: {colors['accent']} !important;
-        }}
-        
-        /* Custom scrollbar */
-        ::-webkit-scrollbar {{
-            width: 8px;
-            height: 8px;
-        }}
-        
-        ::-webkit-scrollbar-track {{
-            background: rgba(0,0,0,0.1);
-        }}
-        
-        ::-webkit-scrollbar-thumb {{
-            background: {colors['secondary']};
-            border-radius: 4px;
-        }}
-        
-        ::-webkit-scrollbar-thumb:hover {{
-            background: {colors['primary']};
-        }}
-        
-        /* Custom cards */
-        .custom-card {{
-            background: rgba(0,0,0,0.2) !important;
-            border-radius: 16px !important;
-            padding: 20px !important;
-            border: 1px solid {colors['secondary']}33 !important;
-            box-shadow: 0 8px 16px rgba(0,0,0,0.1) !important;
-            margin-bottom: 20px !important;
-        }}
-        
-        /* Tooltips */
-        .stTooltip {{
-            background: {colors['bg']} !important;
-            color: {colors['text']} !important;
-            border: 1px solid {colors['secondary']} !important;
-            border-radius: 8px !important;
-        }}
-        
-        /* Tabs */
-        .stTabs [data-baseweb="tab-list"] {{
-            gap: 8px;
-        }}
-        
-        .stTabs [data-baseweb="tab"] {{
-            background: rgba(0,0,0,0.2) !important;
-            border-radius: 12px !important;
-            padding: 8px 16px !important;
-            transition: all 0.3s ease !important;
-        }}
-        
-        .stTabs [aria-selected="true"] {{
-            background: {colors['primary']}22 !important;
-            color: {colors['primary']} !important;
-            font-weight: 600 !important;
-            border: 1px solid {colors['primary']} !important;
-        }}
-    </style>
-    """, unsafe_allow_html=True)
+    # Streamlit drops elements a rerun doesn't re-emit, so the theme has to be
+    # sent every time: inline, as the minified stylesheet compiled once per
+    # process (Streamlit's static route serves .css as text/plain on the
+    # Tornado server, which browsers then ignore)
+    st.markdown(f"<style>{compiled_theme(theme).css}</style>", unsafe_allow_html=True)
 
 # Initialize Groq Client
-def get_groq_client():
+def get_groq_client() -> Optional[Groq]:
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         st.error("GROQ_API_KEY not found! Please set it in environment variables or secrets.")
         return None
-    return Groq(api_key=api_key)
+    # Built on first use, so the first script run doesn't wait for groq and httpx
+    return get_client(api_key, lazy=True)
+
+# Streamed Completion Helper
+def stream_completion(
+    deltas: Iterable[str],
+    max_tokens: int,
+    render: Optional[Callable[[str], None]] = None,
+    progress_bar: Optional[DeltaGenerator] = None
+) -> str:
+    """Consume streamed text deltas, re-rendering the partial text as it grows.
+
+    Progress is reported from the number of streamed chunks received so far
+    (each about one token) against ``max_tokens``; re-renders are throttled
+    to ``STREAM_RENDER_INTERVAL``.
+    """
+    parts = []
+    last_render = 0.0
+    for delta in deltas:
+        parts.append(delta)
+        now = time.monotonic()
+        if now - last_render >= STREAM_RENDER_INTERVAL:
+            last_render = now
+            if render:
+                render("".join(parts))
+            if progress_bar:
+                progress_bar.progress(min(len(parts) / max_tokens, 1.0), text=f"{len(parts)} chunks received")
+    content = "".join(parts)
+    if render:
+        render(content)
+    return content
+
+# Current Streamlit session (used for fair scheduling across sessions)
+def current_session_id() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else ""
+
+# Status line of a call waiting in the rate-limit queue (from its on_idle status), or None
+def queue_status(status: dict) -> Optional[str]:
+    if status.get("queue_position"):
+        return f"Rate limit reached: queued for {status['model']} (position {status['queue_position']})"
+    return None
+
+# Completion Helper
+def run_completion(
+    client: Groq,
+    request: dict,
+    stream: bool = False,
+    render: Optional[Callable[[str], None]] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    stop_after_code: Optional[str] = None,
+    action: str = "completion",
+    complexity: Optional[str] = None
+) -> str:
+    # Streamed calls show their progress; any call shows its place in the rate-limit queue
+    status_slot = st.empty()
+    progress_bar = status_slot.progress(0.0, text="Waiting for first token...") if stream else None
+    
+    def show_queue_position(status: dict) -> None:
+        text = queue_status(status)
+        if text:
+            status_slot.progress(0.0, text=text)
+    
+    deltas = open_completion(
+        client,
+        request,
+        use_cache=use_cache,
+        priority=priority,
+        session_id=current_session_id(),
+        on_idle=show_queue_position,
+        stop_after_code=stop_after_code,
+        action=action,
+        complexity=complexity
+    )
+    try:
+        with closing(deltas):
+            return stream_completion(deltas, request["max_tokens"], render=render, progress_bar=progress_bar)
+    finally:
+        status_slot.empty()
 
 # Enhanced Code Generation Function
 def generate_code(
@@ -268,183 +173,799 @@ def generate_code(
     client: Groq, 
     complexity: str,
     keywords: Optional[list] = None,
-    style: Optional[str] = None
+    style: Optional[str] = None,
+    stream: bool = False,
+    placeholder: Optional[DeltaGenerator] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_INTERACTIVE,
+    action: str = "generate",
+    candidates: int = 1
 ) -> Optional[str]:
-    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
-    
-    prompt = f"""
-    {complexity_config['description']} in {language}:
-    {query}
-    
-    Requirements:
-    - Use {language} best practices
-    - Include appropriate comments
-    - Follow clean code principles
-    """
-    
-    if keywords:
-        prompt += f"\nKeywords to consider: {', '.join(keywords)}"
-    if style:
-        prompt += f"\nCoding style: {style}"
-    
-    if complexity == "Expert":
-        prompt += """
-        Additional requirements:
-        - Include performance benchmarks if applicable
-        - Add scalability considerations
-        - Document trade-offs and alternatives
-        - Include unit tests
-        """
-    
-    prompt += """
-    IMPORTANT: Return ONLY the raw executable code with comments, 
-    without any additional explanation before or after the code block.
-    """
+    request = build_code_request(query, language, model, complexity, keywords, style)
     
     try:
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }],
-            temperature=complexity_config['temperature'],
-            max_tokens=4096,
-            top_p=0.95
+        if candidates > 1:
+            return generate_best_of(
+                client, request, language, complexity, candidates, stream, placeholder, use_cache, priority, action
+            )
+        render = None
+        if stream and placeholder is not None:
+            render = lambda text: placeholder.code(extract_code_block(text, language), language=language.lower())
+        raw_content = run_completion(
+            client,
+            request,
+            stream=stream,
+            render=render,
+            use_cache=use_cache,
+            priority=priority,
+            stop_after_code=language,
+            action=action,
+            complexity=complexity
         )
-        
-        # Extract just the code block if it's wrapped in markdown
-        raw_content = completion.choices[0].message.content
-        if '```' in raw_content:
-            code = raw_content.split('```')[1]
-            if code.startswith(language.lower()):
-                code = code[len(language.lower()):]
-            return code.strip()
-        return raw_content.strip()
+        return extract_code_block(raw_content, language)
     except Exception as e:
         st.error(f"Error generating code: {str(e)}")
         return None
 
-# Code Explanation Function
-def generate_explanation(code: str, language: str, client: Groq, complexity: str) -> Optional[str]:
-    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
+# Best-of-N Generation: samples race, the first valid one is returned; the set is left in
+# `pending_candidates` for the caller to attach to its history entry
+CANDIDATE_BADGES = {
+    "streaming": "⏳ generating",
+    "valid": "✅ valid",
+    "invalid": "❌ invalid",
+    "error": "⚠️ failed",
+    "cancelled": "⏹️ cancelled"
+}
+
+def generate_best_of(
+    client: Groq,
+    request: dict,
+    language: str,
+    complexity: str,
+    candidates: int,
+    stream: bool,
+    placeholder: Optional[DeltaGenerator],
+    use_cache: bool,
+    priority: int,
+    action: str
+) -> Optional[str]:
+    candidate_set = CandidateSet(
+        client,
+        request,
+        language,
+        candidates,
+        use_cache=use_cache,
+        priority=priority,
+        session_id=current_session_id(),
+        complexity=complexity,
+        action=action
+    )
+    
+    def render(candidate_set: CandidateSet) -> None:
+        live = [candidate for candidate in candidate_set.candidates if candidate.status in ("streaming", "valid")]
+        leader = max(live, key=lambda candidate: len(candidate.code), default=None)
+        with placeholder.container():
+            st.caption(" · ".join(
+                f"#{candidate.index + 1} {CANDIDATE_BADGES[candidate.status]}" for candidate in candidate_set.candidates
+            ))
+            if leader is not None:
+                st.code(leader.code, language=language.lower())
     
+    winner = candidate_set.first_valid(on_progress=render if stream and placeholder is not None else None)
+    if winner is None:
+        winner = candidate_set.fallback()
+        if winner is None:
+            reasons = "; ".join(sorted({candidate.error for candidate in candidate_set.candidates if candidate.error}))
+            st.error(f"Error generating code: none of the {candidates} samples produced code ({reasons})")
+            return None
+        st.warning(f"No sample passed validation; showing the longest one ({winner.error})")
+    st.session_state.pending_candidates = {"set": candidate_set, "winner": winner.index, "shown": {winner.index}}
+    return winner.code
+
+# Code Explanation Function
+def generate_explanation(
+    code: str,
+    language: str,
+    client: Groq,
+    complexity: str,
+    stream: bool = False,
+    placeholder: Optional[DeltaGenerator] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BACKGROUND
+) -> Optional[str]:
     try:
-        explanation = client.chat.completions.create(
-            model=PRIMARY_MODEL,
-            messages=[{
-                "role": "user",
-                "content": f"""
-                Explain this {language} code in {complexity.lower()} terms:
-                {code}
-                
-                Structure your explanation:
-                1. Overview of what the code does
-                2. Key components/functions
-                3. Flow of execution
-                4. {complexity_config['description']} considerations
-                """
-            }],
-            temperature=0.3,
-            max_tokens=1024
+        render = placeholder.markdown if stream and placeholder is not None else None
+        # Large inputs are explained part by part, concurrently
+        chunks = plan_chunks(code, language)
+        if chunks:
+            return explain_chunked(
+                client,
+                chunks,
+                language,
+                complexity,
+                use_cache=use_cache,
+                priority=priority,
+                session_id=current_session_id(),
+                on_progress=render
+            )
+        request = build_explanation_request(code, language, complexity)
+        return run_completion(
+            client,
+            request,
+            stream=stream,
+            render=render,
+            use_cache=use_cache,
+            priority=priority,
+            action="explain",
+            complexity=complexity
         )
-        return explanation.choices[0].message.content
     except Exception as e:
         st.error(f"Error generating explanation: {str(e)}")
         return None
 
 # Code Optimization Function
-def optimize_code(code: str, language: str, client: Groq) -> Optional[str]:
+def optimize_code(
+    code: str,
+    language: str,
+    client: Groq,
+    stream: bool = False,
+    placeholder: Optional[DeltaGenerator] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL
+) -> Optional[Optimization]:
     try:
-        optimized = client.chat.completions.create(
-            model=PRIMARY_MODEL,
-            messages=[{
-                "role": "user",
-                "content": f"""
-                Optimize this {language} code for performance and readability:
-                {code}
-                
-                Return:
-                1. Optimized code with comments explaining changes
-                2. Performance benchmarks if applicable
-                3. Memory usage considerations
-                
-                IMPORTANT: Return ONLY the raw executable code with comments, 
-                without any additional explanation before or after the code block.
-                """
-            }],
-            temperature=0.5,
-            max_tokens=4096
-        )
+        # Edits first: the answer then scales with the change, not the file
+        fallback = None
+        if uses_patches(code):
+            render = None
+            if stream and placeholder is not None:
+                render = lambda text: placeholder.code(text, language="text")
+            try:
+                raw_content = run_completion(
+                    client,
+                    build_patch_optimization_request(code, language),
+                    stream=stream,
+                    render=render,
+                    use_cache=use_cache,
+                    priority=priority,
+                    action="optimize_patch"
+                )
+                optimized, edits = apply_patch_response(code, raw_content, language)
+                return Optimization(optimized, edits, estimate_tokens(raw_content), estimate_tokens(code))
+            except PatchError as e:
+                fallback = str(e)
         
-        raw_content = optimized.choices[0].message.content
-        if '```' in raw_content:
-            optimized_code = raw_content.split('```')[1]
-            if optimized_code.startswith(language.lower()):
-                optimized_code = optimized_code[len(language.lower()):]
-            return optimized_code.strip()
-        return raw_content.strip()
+        render = None
+        if stream and placeholder is not None:
+            render = lambda text: placeholder.code(extract_code_block(text, language), language=language.lower())
+        # Large inputs are optimized part by part, concurrently
+        chunks = plan_chunks(code, language)
+        if chunks:
+            optimized = optimize_chunked(
+                client,
+                chunks,
+                language,
+                use_cache=use_cache,
+                priority=priority,
+                session_id=current_session_id(),
+                on_progress=render
+            )
+        else:
+            request = build_optimization_request(code, language)
+            raw_content = run_completion(
+                client,
+                request,
+                stream=stream,
+                render=render,
+                use_cache=use_cache,
+                priority=priority,
+                stop_after_code=language,
+                action="optimize"
+            )
+            optimized = extract_code_block(raw_content, language)
+        return Optimization(optimized, fallback=fallback)
     except Exception as e:
         st.error(f"Error optimizing code: {str(e)}")
         return None
 
-# Main App Interface
-def main():
-    client = get_groq_client()
-    if not client:
-        return
+# Full Analysis Pipeline
+ANALYSIS_RESULTS = {
+    # result name: (session_state key, tab label, is code)
+    "code": ("generated_code", "Generated Code", True),
+    "optimized": ("optimized_code", "Optimized Code", True),
+    "explanation": ("explanation", "Explanation", False),
+    "alternative": ("alternative_code", "Alternative", True)
+}
 
-    # Sidebar for settings
-    with st.sidebar:
-        st.title("⚙️ AstraCode Pro Settings")
-        
-        # Theme selection with preview
-        selected_theme = st.selectbox("Theme", THEMES, index=0, key="theme_select")
-        inject_custom_css(selected_theme)
+ANALYSIS_PRIORITIES = {
+    "code": PRIORITY_INTERACTIVE,
+    "alternative": PRIORITY_NORMAL,
+    "optimized": PRIORITY_NORMAL,
+    "explanation": PRIORITY_BACKGROUND
+}
+
+ANALYSIS_ACTIONS = {
+    "code": "generate",
+    "alternative": "alternative",
+    "optimized": "optimize",
+    "explanation": "explain"
+}
+
+def run_full_analysis(
+    client: Groq,
+    query: str,
+    language: str,
+    complexity: str,
+    keywords: Optional[list],
+    style: Optional[str],
+    area: DeltaGenerator,
+    use_cache: bool = True
+) -> None:
+    """Generate code, then fan out explanation and optimization concurrently.
+
+    The alternative solution does not depend on the generated code, so it is
+    started alongside the primary generation. Each tab is filled in as its
+    result lands and finished results are stored in session state straight
+    away. Any interaction (including the Cancel button) reruns the action
+    bar, which cancels whatever is still outstanding.
+    """
+    ctx = get_script_run_ctx()
+    session_id = current_session_id()
+    cancel = threading.Event()
+    partial = {name: [] for name in ANALYSIS_RESULTS}
+    rendered = {name: 0 for name in ANALYSIS_RESULTS}
+    waiting = {name: None for name in ANALYSIS_RESULTS}  # queue status of tasks with no text yet
+    shown = {}
+    futures = {}
+    submitted = {}
+    executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="analysis")
+    
+    def submit_task(name: str, run: Callable[[], str]) -> Future:
+        def task() -> str:
+            add_script_run_ctx(threading.current_thread(), ctx)
+            return run()
+        future = executor.submit(task)
+        futures[future] = name
+        submitted[future] = time.monotonic()
+        return future
+    
+    def submit(name: str, request: dict) -> Future:
+        return submit_task(name, lambda: complete(
+            client,
+            request,
+            use_cache=use_cache,
+            priority=ANALYSIS_PRIORITIES[name],
+            session_id=session_id,
+            parts=partial[name],
+            cancel=cancel,
+            stop_after_code=language if ANALYSIS_RESULTS[name][2] else None,
+            action=ANALYSIS_ACTIONS[name],
+            complexity=complexity,
+            on_idle=watch_queue(name)
+        ))
+    
+    def watch_queue(name: str) -> Callable[[dict], None]:
+        # Called on the task's thread; the loop below renders it
+        def update(status: dict) -> None:
+            waiting[name] = queue_status(status)
+        return update
+    
+    def progress(name: str) -> Callable[[str], None]:
+        # Map-reduce reports whole documents rather than deltas
+        def update(text: str) -> None:
+            partial[name][:] = [text]
+        return update
+    
+    def render(name: str, text: str) -> None:
+        if ANALYSIS_RESULTS[name][2]:
+            slots[name].code(extract_code_block(text, language), language=language.lower())
+        else:
+            slots[name].markdown(text)
+    
+    with area.container():
+        st.button("⏹ Cancel", key="cancel_analysis", help="Stop the outstanding analysis requests")
+        tabs = st.tabs([label for _, label, _ in ANALYSIS_RESULTS.values()])
+        slots = {name: tab.empty() for name, tab in zip(ANALYSIS_RESULTS, tabs)}
+    for slot in slots.values():
+        slot.info("Waiting for the model...")
+    
+    pending = {
+        submit("code", build_code_request(query, language, PRIMARY_MODEL, complexity, keywords, style)),
+        submit("alternative", build_code_request(
+            f"Alternative approach for: {query}", language, PRIMARY_MODEL, complexity, keywords, style
+        ))
+    }
+    
+    try:
+        while pending:
+            done, pending = wait(pending, timeout=STREAM_RENDER_INTERVAL * 2, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                state_key, label, is_code = ANALYSIS_RESULTS[name]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    slots[name].error(f"Error generating {label.lower()}: {str(e)}")
+                    continue
+                
+                result = extract_code_block(content, language) if is_code else content
+                set_result(state_key, result, time.monotonic() - submitted[future])
+                render(name, content)
+                
+                if name == "code":
+                    # Large generated code is explained and optimized part by part
+                    chunks = plan_chunks(result, language)
+                    if chunks:
+                        pending |= {
+                            submit_task("explanation", lambda: explain_chunked(
+                                client,
+                                chunks,
+                                language,
+                                complexity,
+                                use_cache=use_cache,
+                                priority=ANALYSIS_PRIORITIES["explanation"],
+                                session_id=session_id,
+                                cancel=cancel,
+                                on_progress=progress("explanation"),
+                                on_idle=watch_queue("explanation")
+                            )),
+                            submit_task("optimized", lambda: optimize_chunked(
+                                client,
+                                chunks,
+                                language,
+                                use_cache=use_cache,
+                                priority=ANALYSIS_PRIORITIES["optimized"],
+                                session_id=session_id,
+                                cancel=cancel,
+                                on_progress=progress("optimized"),
+                                on_idle=watch_queue("optimized")
+                            ))
+                        }
+                    else:
+                        pending |= {
+                            submit("explanation", build_explanation_request(result, language, complexity)),
+                            submit("optimized", build_optimization_request(result, language))
+                        }
+            
+            for future in pending:
+                name = futures[future]
+                size = sum(len(part) for part in partial[name])
+                if size != rendered[name]:
+                    rendered[name] = size
+                    render(name, "".join(partial[name]))
+                elif not size and shown.get(name) != waiting[name]:
+                    shown[name] = waiting[name]
+                    slots[name].info(waiting[name] or "Waiting for the model...")
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+# Language Comparison (one query generated in several languages at once)
+COMPARISON_PREFIX = "comparison:"  # result name prefix of each compared language
+
+def run_language_fanout(
+    client: Groq,
+    query: str,
+    languages: list,
+    complexity: str,
+    keywords: Optional[list],
+    style: Optional[str],
+    area: DeltaGenerator,
+    use_cache: bool = True
+) -> dict:
+    """Generate ``query`` in every language concurrently, streaming each into its own tab.
+
+    The requests go through the shared rate limiter, so the fan-out can't
+    exceed the model budgets; otherwise the whole comparison takes about as
+    long as its slowest language. Returns each finished language's code and
+    call statistics.
+    """
+    ctx = get_script_run_ctx()
+    session_id = current_session_id()
+    cancel = threading.Event()
+    partial = {language: [] for language in languages}
+    rendered = {language: 0 for language in languages}
+    stats = {language: {} for language in languages}
+    waiting = {language: None for language in languages}  # queue status of languages with no text yet
+    shown = {}
+    futures = {}
+    executor = ThreadPoolExecutor(max_workers=len(languages), thread_name_prefix="fanout")
+    
+    def task(language: str) -> str:
+        add_script_run_ctx(threading.current_thread(), ctx)
         
-        # Language selection
-        selected_language = st.selectbox("Programming Language", LANGUAGES, index=0)
+        def update(status: dict) -> None:
+            waiting[language] = queue_status(status)
         
-        # Complexity selection with icons and descriptions
-        complexity = st.selectbox(
-            "Code Complexity",
-            options=list(COMPLEXITY_LEVELS.keys()),
-            format_func=lambda x: f"{COMPLEXITY_LEVELS[x]['icon']} {x}",
-            index=1,
-            help="Select the level of complexity for the generated code"
+        return complete(
+            client,
+            build_code_request(query, language, PRIMARY_MODEL, complexity, keywords, style),
+            use_cache=use_cache,
+            priority=PRIORITY_INTERACTIVE,
+            session_id=session_id,
+            parts=partial[language],
+            cancel=cancel,
+            stop_after_code=language,
+            action="compare",
+            complexity=complexity,
+            stats=stats[language],
+            on_idle=update
+        )
+    
+    with area.container():
+        st.button("⏹ Cancel", key="cancel_fanout", help="Stop the outstanding comparison requests")
+        tabs = st.tabs(languages)
+        slots = {language: tab.empty() for language, tab in zip(languages, tabs)}
+    for slot in slots.values():
+        slot.info("Waiting for the model...")
+    
+    started = time.monotonic()
+    for language in languages:
+        futures[executor.submit(task, language)] = language
+    results = {}
+    
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=STREAM_RENDER_INTERVAL * 2, return_when=FIRST_COMPLETED)
+            for future in done:
+                language = futures[future]
+                try:
+                    content = future.result()
+                except Exception as e:
+                    slots[language].error(f"Error generating {language} code: {str(e)}")
+                    continue
+                
+                code = extract_code_block(content, language)
+                call = stats[language]
+                results[language] = {
+                    "code": code,
+                    "latency": time.monotonic() - started,
+                    "ttft": call.get("ttft"),
+                    # Usage doesn't arrive when the stream is closed after the code block
+                    "tokens": call.get("completion_tokens") or estimate_tokens(content),
+                    "cache": call.get("cache")
+                }
+                slots[language].code(code, language=language.lower())
+            
+            for future in pending:
+                language = futures[future]
+                if len(partial[language]) != rendered[language]:
+                    rendered[language] = len(partial[language])
+                    slots[language].code(
+                        extract_code_block("".join(partial[language]), language), language=language.lower()
+                    )
+                elif not partial[language] and shown.get(language) != waiting[language]:
+                    shown[language] = waiting[language]
+                    slots[language].info(waiting[language] or "Waiting for the model...")
+    finally:
+        cancel.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+    return results
+
+# Highlight code server-side (memoized); large uncached blocks show their first screen first
+def render_code(code: str, language: str) -> None:
+    highlighter = get_highlighter()
+    html = highlighter.cached(code, language)
+    if html is None:
+        area = st.empty()
+        head = highlighter.render_head(code, language)
+        if head is not None:
+            area.html(head)
+        area.html(highlighter.highlight(code, language))
+    else:
+        st.html(html)
+
+# Archive column of each result
+RESULT_ARCHIVE_COLUMNS = {
+    "generated_code": "code",
+    "explanation": "explanation",
+    "optimized_code": "optimized",
+    "alternative_code": "alternative"
+}
+
+# Clear every result pane (the history and the archive keep them)
+def reset_results() -> None:
+    st.session_state.results = {}
+    st.session_state.history_entry = None
+    st.session_state.archive_key = None
+    st.session_state.similar_match = None
+    st.session_state.comparison = {}
+    drop_background_work()
+
+# Spare samples and prefetched results only belong to their own generation; stop any still running
+def drop_background_work() -> None:
+    candidates = st.session_state.get("candidates")
+    if candidates:
+        candidates["set"].cancel()
+    st.session_state.candidates = None
+    prefetch = st.session_state.get("prefetch")
+    if prefetch:
+        prefetch.discard()
+    st.session_state.prefetch = None
+
+# Speculatively run the actions likely to follow a generation, at prefetch priority
+def start_prefetch(client: Groq, query: str, code: str, settings: dict) -> None:
+    actions = ["optimize"]
+    if not get_result("explanation"):
+        actions.insert(0, "explain")
+    # Best-of-N spares already answer the Alternative button
+    if not st.session_state.candidates:
+        actions.append("alternative")
+    jobs = build_prefetch_jobs(
+        client,
+        query,
+        code,
+        settings["language"],
+        settings["complexity"],
+        settings["tags"],
+        settings["style"],
+        actions,
+        use_cache=settings["use_cache"],
+        session_id=current_session_id()
+    )
+    if jobs:
+        st.session_state.prefetch = get_prefetcher().start(current_session_id(), jobs)
+
+# A prefetched result for `action` of the current generation, if one is ready
+def take_prefetched(action: str) -> Optional[Union[str, Optimization]]:
+    prefetch = st.session_state.prefetch
+    return prefetch.take(action) if prefetch else None
+
+# Start a history entry (and, unless it continues an archived one, an archive record) for a new generation;
+# its tabs are labelled from the settings recorded here
+def start_history_entry(
+    query: str,
+    settings: dict,
+    similar_match: Optional[dict] = None,
+    archive_key: Optional[str] = None
+) -> None:
+    result_settings = {
+        "language": settings["language"],
+        "complexity": settings["complexity"],
+        "coding_style": settings["coding_style"]
+    }
+    if archive_key is None:
+        archive_key = uuid.uuid4().hex
+        get_archive().record(
+            archive_key,
+            query=query,
+            language=settings["language"],
+            complexity=settings["complexity"],
+            style=settings["coding_style"],
+            tags=list(settings["tags"] or []),
+            model=PRIMARY_MODEL
+        )
+    st.session_state.history_entry = get_history_store().add(
+        current_session_id(), query, result_settings, similar_match, archive_key
+    )
+    st.session_state.archive_key = archive_key
+    st.session_state.results = {}
+    st.session_state.result_settings = result_settings
+    st.session_state.similar_match = similar_match
+    st.session_state.comparison = {}
+    drop_background_work()
+
+# Results live compressed in the shared history store; session state only holds their digests
+def get_result(name: str) -> Optional[str]:
+    digest = st.session_state.results.get(name)
+    return get_history_store().text(digest) if digest else None
+
+def set_result(name: str, text: Optional[str], seconds: Optional[float] = None, archive: bool = True) -> None:
+    digest = None
+    if st.session_state.history_entry is not None:
+        digest = get_history_store().set_result(current_session_id(), st.session_state.history_entry, name, text)
+    if digest:
+        st.session_state.results[name] = digest
+    else:
+        st.session_state.results.pop(name, None)
+    
+    # Queued for the archive's background writer; never waits on disk
+    if archive and text and st.session_state.archive_key and name in RESULT_ARCHIVE_COLUMNS:
+        fields = {RESULT_ARCHIVE_COLUMNS[name]: text}
+        if seconds is not None:
+            fields["timings"] = {name: round(seconds, 3)}
+        get_archive().record(st.session_state.archive_key, **fields)
+
+# Bring back an earlier generation (button callback, so it may also set the query widget)
+def restore_history_entry(entry: HistoryEntry) -> None:
+    st.session_state.history_entry = entry.entry_id
+    st.session_state.archive_key = entry.archive_key
+    st.session_state.results = dict(entry.results)
+    st.session_state.result_settings = entry.settings
+    st.session_state.similar_match = entry.similar_match
+    st.session_state.comparison = {}
+    drop_background_work()
+    st.session_state.query = entry.query
+
+# Load an archived generation into the tabs (and this session's history) without calling the model
+def load_archived_generation(generation: ArchivedGeneration) -> None:
+    settings = {
+        "language": generation.language,
+        "complexity": generation.complexity,
+        "coding_style": generation.style or "Default"
+    }
+    start_history_entry(generation.query, settings, archive_key=generation.key)
+    for name, column in RESULT_ARCHIVE_COLUMNS.items():
+        set_result(name, getattr(generation, column), archive=False)
+    st.session_state.query = generation.query
+
+# Sidebar settings; changing one only reruns this fragment; actions read them at click time
+@st.fragment
+def render_settings() -> None:
+    # Theme selection with preview
+    selected_theme = st.selectbox("Theme", THEMES, index=0, key="theme_select")
+    inject_custom_css(selected_theme)
+    
+    # Language selection
+    selected_language = st.selectbox("Programming Language", LANGUAGES, index=0)
+    compare_languages = st.multiselect(
+        "Compare languages",
+        LANGUAGES,
+        default=[],
+        help="Pick two or more, then 🌐 Compare to generate the request in each of them at once"
+    )
+    
+    # Complexity selection with icons and descriptions
+    complexity = st.selectbox(
+        "Code Complexity",
+        options=list(COMPLEXITY_LEVELS.keys()),
+        format_func=lambda x: f"{COMPLEXITY_LEVELS[x]['icon']} {x}",
+        index=1,
+        help="Select the level of complexity for the generated code"
+    )
+    
+    # Display complexity description
+    with st.expander("Complexity Details", expanded=False):
+        st.markdown(f"**{complexity}** {COMPLEXITY_LEVELS[complexity]['icon']}")
+        st.caption(COMPLEXITY_LEVELS[complexity]['description'])
+    
+    # Additional options
+    with st.expander("Advanced Options", expanded=False):
+        coding_style = st.selectbox(
+            "Coding Style",
+            ["Default", "Functional", "OOP", "Procedural", "Concise", "Verbose"],
+            index=0
         )
         
-        # Display complexity description
-        with st.expander("Complexity Details", expanded=False):
-            st.markdown(f"**{complexity}** {COMPLEXITY_LEVELS[complexity]['icon']}")
-            st.caption(COMPLEXITY_LEVELS[complexity]['description'])
+        tags = st_tags(
+            label="Keywords/Tags:",
+            text="Press enter to add more",
+            value=[],
+            key="tags",
+            suggestions=["algorithm", "data structure", "API", "GUI", "CLI"]
+        )
         
-        # Additional options
-        with st.expander("Advanced Options", expanded=False):
-            coding_style = st.selectbox(
-                "Coding Style",
-                ["Default", "Functional", "OOP", "Procedural", "Concise", "Verbose"],
-                index=0
-            )
-            
-            tags = st_tags(
-                label="Keywords/Tags:",
-                text="Press enter to add more",
-                value=[],
-                key="tags",
-                suggestions=["algorithm", "data structure", "API", "GUI", "CLI"]
+        auto_explain = st.checkbox("Auto-generate explanation", value=True)
+        stream_output = st.checkbox("Stream output", value=True,
+                                    help="Render code as it is generated instead of waiting for the full response")
+        reuse_similar = st.checkbox("Reuse answers for similar requests", value=False,
+                                    help="Serve a cached answer when a near-identical request was made before")
+        fresh_sample = st.checkbox("Fresh sample (bypass cache)", value=False,
+                                   help="Always ask the model again instead of reusing a cached answer")
+        candidates = st.slider("Candidates per generation", 1, 5, value=min(max(CANDIDATES, 1), 5),
+                               help="Generate this many samples at once and keep the first one that validates; "
+                                    "the others become alternatives")
+        prefetch = st.checkbox("Prefetch likely next actions", value=PREFETCH_DEFAULT,
+                               help="After a generation, run Explain, Optimize and Alternative in the background "
+                                    "so clicking them is instant (uses extra tokens)")
+    
+    previous = st.session_state.get("settings")
+    st.session_state.settings = {
+        "language": selected_language,
+        "complexity": complexity,
+        "coding_style": coding_style,
+        "style": coding_style if coding_style != "Default" else None,
+        "tags": tags,
+        "auto_explain": auto_explain,
+        "stream_output": stream_output,
+        "reuse_similar": reuse_similar,
+        "use_cache": not fresh_sample,
+        "compare_languages": compare_languages,
+        "candidates": candidates,
+        "prefetch": prefetch
+    }
+    
+    # The Compare button lives in the workspace fragment; redraw it when it turns on or off
+    if previous is not None and (len(previous["compare_languages"]) < 2) != (len(compare_languages) < 2):
+        st.rerun(scope="app")
+
+# Earlier generations of this session; restoring one reruns the app with its results
+@st.fragment
+def render_history() -> None:
+    entries = [entry for entry in get_history_store().entries(current_session_id()) if entry.results]
+    if not entries:
+        return
+    
+    with st.expander(f"🕘 History ({len(entries)})", expanded=False):
+        for entry in entries:
+            label = (
+                f"{time.strftime('%H:%M', time.localtime(entry.created))} · "
+                f"{entry.settings['language']} · {entry.query[:40]}"
             )
-            
-            auto_explain = st.checkbox("Auto-generate explanation", value=True)
-            show_metadata = st.checkbox("Show code metadata", value=False)
-        
-        st.markdown("---")
-        st.markdown("### About AstraCode Pro")
-        st.caption("A next-gen AI code generator with advanced customization and theming")
+            if st.button(
+                label,
+                key=f"history_{entry.entry_id}",
+                help=entry.query,
+                on_click=restore_history_entry,
+                args=(entry,),
+                disabled=entry.entry_id == st.session_state.history_entry,
+                use_container_width=True
+            ):
+                st.rerun()
+
+# Full-text search over every archived generation; loading one reruns the app with its results
+@st.fragment
+def render_archive() -> None:
+    archive = get_archive()
+    if not archive.enabled:
+        return
     
-    # Main content area
-    st.title(f"💻 AstraCode Pro")
-    st.caption("Generate production-ready code with AI-powered assistance")
+    with st.expander("🔎 Archive", expanded=False):
+        search = st.text_input("Search past generations", key="archive_search",
+                               placeholder="e.g. fibonacci memo")
+        if not search:
+            return
+        started = time.perf_counter()
+        matches = [generation for generation in archive.search(search) if generation.code]
+        st.caption(f"{len(matches)} matches in {(time.perf_counter() - started) * 1000:.1f} ms")
+        for generation in matches:
+            label = f"{generation.language} · {generation.complexity} · {generation.query[:40]}"
+            if st.button(
+                label,
+                key=f"archive_{generation.id}",
+                help=generation.query,
+                on_click=load_archived_generation,
+                args=(generation,),
+                use_container_width=True
+            ):
+                st.rerun()
+
+# Telemetry admin panel (ASTRACODE_ADMIN_PANEL=1); refreshing only reruns the panel
+@st.fragment
+def render_admin_panel() -> None:
+    with st.expander("📊 Telemetry", expanded=False):
+        st.button("Refresh", key="refresh_telemetry", use_container_width=True)
+        metrics = get_metrics()
+        recent = list(metrics.recent)
+        if not recent:
+            st.caption("No LLM calls recorded yet")
+            return
+        
+        st.metric("Calls", len(recent))
+        st.metric("Fallbacks", sum(1 for call in recent if call["fallback"]))
+        st.markdown("**Tokens/minute by complexity**")
+        st.dataframe(
+            [{"complexity": complexity, "tokens/min": round(rate)}
+             for complexity, rate in sorted(metrics.tokens_per_minute().items())],
+            hide_index=True
+        )
+        st.markdown("**Per action**")
+        st.dataframe(
+            [{"action": action, **summary} for action, summary in metrics.action_summary().items()],
+            hide_index=True
+        )
+        prefetch = get_prefetcher().stats()
+        if prefetch:
+            st.markdown(f"**Prefetch** ({get_prefetcher().wasted_tokens} tokens wasted)")
+            st.dataframe([{"action": action, **outcomes} for action, outcomes in prefetch.items()], hide_index=True)
+        budgets = get_output_budget().snapshot()
+        if budgets:
+            st.markdown("**Learned output budgets**")
+            st.dataframe([{"bucket": bucket, **stats} for bucket, stats in budgets.items()], hide_index=True)
+        st.markdown("**Recent calls**")
+        st.dataframe(recent[::-1][:50], hide_index=True)
+
+# Query input and action bar; results only change from here, so it reruns the app afterwards
+@st.fragment
+def render_workspace(client: Groq) -> None:
+    settings = st.session_state.settings
+    selected_language = settings["language"]
+    complexity = settings["complexity"]
+    tags = settings["tags"]
+    style = settings["style"]
+    stream_output = settings["stream_output"]
+    use_cache = settings["use_cache"]
     
     # Layout columns
     col1, col2 = st.columns([4, 1])
@@ -456,168 +977,223 @@ def main():
                 "Describe your coding requirement:",
                 height=150,
                 placeholder="e.g., A REST API endpoint for user authentication with JWT tokens\nor\nA React component for a responsive product carousel",
-                help="Be as specific as possible for better results"
+                help="Be as specific as possible for better results",
+                key="query"
             )
     
-    # Initialize session state
-    if 'generated_code' not in st.session_state:
-        st.session_state.generated_code = None
-    if 'alternative_code' not in st.session_state:
-        st.session_state.alternative_code = None
-    if 'optimized_code' not in st.session_state:
-        st.session_state.optimized_code = None
-    if 'explanation' not in st.session_state:
-        st.session_state.explanation = None
-    
     # Action buttons
-    action_cols = st.columns([1, 1, 1, 1, 1, 2])
+    action_cols = st.columns([1, 1, 1, 1, 1, 2, 1])
+    
+    # Live output area for streamed responses
+    stream_placeholder = st.empty()
+    
+    results_changed = False
+    generated_code = get_result("generated_code")
     
     with action_cols[0]:
-        if st.button("🚀 Generate", use_container_width=True, help="Generate initial code implementation"):
+        generate_clicked = st.button("🚀 Generate", use_container_width=True, help="Generate initial code implementation")
+        if generate_clicked or st.session_state.pop("force_generate", False):
             if not query:
                 st.warning("Please enter a code description")
             else:
+                similar = None
+                if settings["reuse_similar"] and use_cache and not st.session_state.pop("skip_similar", False):
+                    similar = find_similar_generation(query, selected_language, complexity, tags, style)
+                
                 with st.spinner(f"Generating {complexity.lower()} {selected_language} code..."):
-                    progress_bar = st.progress(0)
-                    
-                    for i in range(100):
-                        time.sleep(0.02)
-                        progress_bar.progress(i + 1)
-                    
-                    code = generate_code(
-                        query,
-                        selected_language,
-                        PRIMARY_MODEL,
-                        client,
-                        complexity,
-                        tags,
-                        coding_style if coding_style != "Default" else None
-                    )
-                    
-                    if not code:
-                        st.warning("Trying backup model...")
+                    started = time.monotonic()
+                    similar_match = None
+                    if similar:
+                        code, match = similar
+                        similar_match = {"query": match.query, "similarity": match.similarity}
+                    else:
                         code = generate_code(
                             query,
                             selected_language,
-                            BACKUP_MODEL,
+                            PRIMARY_MODEL,
                             client,
                             complexity,
                             tags,
-                            coding_style if coding_style != "Default" else None
+                            style,
+                            stream=stream_output,
+                            placeholder=stream_placeholder,
+                            use_cache=use_cache,
+                            candidates=settings["candidates"]
                         )
+                    pending = st.session_state.pop("pending_candidates", None)
+                    if code and not similar:
+                        # Remembered under the sample that was kept
+                        request = (
+                            pending["set"].candidates[pending["winner"]].request if pending
+                            else build_code_request(query, selected_language, PRIMARY_MODEL, complexity, tags, style)
+                        )
+                        remember_generation(query, selected_language, complexity, tags, style, request)
                     
                     if code:
-                        st.session_state.generated_code = code
-                        st.session_state.alternative_code = None
-                        st.session_state.optimized_code = None
+                        start_history_entry(query, settings, similar_match)
+                        st.session_state.candidates = pending
+                        set_result("generated_code", code, time.monotonic() - started)
                         
-                        if auto_explain:
+                        if settings["auto_explain"]:
                             with st.spinner("Generating explanation..."):
-                                st.session_state.explanation = generate_explanation(
+                                started = time.monotonic()
+                                set_result("explanation", generate_explanation(
                                     code,
                                     selected_language,
                                     client,
-                                    complexity
-                                )
+                                    complexity,
+                                    stream=stream_output,
+                                    placeholder=stream_placeholder,
+                                    use_cache=use_cache
+                                ), time.monotonic() - started)
+                        
+                        if settings["prefetch"]:
+                            start_prefetch(client, query, code, settings)
                     
-                    progress_bar.empty()
+                    stream_placeholder.empty()
+                    results_changed = True
     
     with action_cols[1]:
+        # Spare samples of a best-of-N generation are shown before asking the model again
+        candidates = st.session_state.candidates
         if st.button("🔄 Alternative", use_container_width=True, 
-                    disabled=not st.session_state.generated_code,
-                    help="Generate alternative implementation"):
-            with st.spinner(f"Generating alternative {selected_language} solution..."):
-                alt_code = generate_code(
-                    f"Alternative approach for: {query}",
-                    selected_language,
-                    PRIMARY_MODEL,
-                    client,
-                    complexity,
-                    tags,
-                    coding_style if coding_style != "Default" else None
-                )
-                if alt_code:
-                    st.session_state.alternative_code = alt_code
+                    disabled=not generated_code,
+                    help="Show the next valid sample of this generation, or generate an alternative implementation"):
+            spare = None
+            if candidates:
+                with st.spinner("Waiting for the next valid sample..."):
+                    started = time.monotonic()
+                    spare = candidates["set"].next_valid(exclude=candidates["shown"])
+                if spare is not None:
+                    candidates["shown"].add(spare.index)
+                    set_result("alternative_code", spare.code, time.monotonic() - started)
+                    results_changed = True
+            if spare is None:
+                started = time.monotonic()
+                spare = take_prefetched("alternative")
+                if spare is not None:
+                    set_result("alternative_code", spare, time.monotonic() - started)
+                    results_changed = True
+            # No sample or prefetched result left: ask the model
+            if spare is None:
+                with st.spinner(f"Generating alternative {selected_language} solution..."):
+                    started = time.monotonic()
+                    alt_code = generate_code(
+                        f"Alternative approach for: {query}",
+                        selected_language,
+                        PRIMARY_MODEL,
+                        client,
+                        complexity,
+                        tags,
+                        style,
+                        stream=stream_output,
+                        placeholder=stream_placeholder,
+                        use_cache=use_cache,
+                        priority=PRIORITY_NORMAL,
+                        action="alternative"
+                    )
+                    stream_placeholder.empty()
+                    if alt_code:
+                        set_result("alternative_code", alt_code, time.monotonic() - started)
+                        results_changed = True
     
     with action_cols[2]:
         if st.button("⚡ Optimize", use_container_width=True,
-                    disabled=not st.session_state.generated_code,
+                    disabled=not generated_code,
                     help="Optimize the generated code"):
             with st.spinner(f"Optimizing {selected_language} code..."):
-                optimized = optimize_code(
-                    st.session_state.generated_code,
+                started = time.monotonic()
+                # A prefetched optimization comes with the same details as one made here
+                optimization = take_prefetched("optimize") or optimize_code(
+                    generated_code,
                     selected_language,
-                    client
+                    client,
+                    stream=stream_output,
+                    placeholder=stream_placeholder,
+                    use_cache=use_cache
                 )
-                if optimized:
-                    st.session_state.optimized_code = optimized
+                stream_placeholder.empty()
+                if optimization:
+                    set_result("optimized_code", optimization.code, time.monotonic() - started)
+                    st.session_state.optimization = optimization.summary()
+                    results_changed = True
     
     with action_cols[3]:
         if st.button("📝 Explain", use_container_width=True,
-                    disabled=not st.session_state.generated_code,
+                    disabled=not generated_code,
                     help="Generate detailed explanation"):
             with st.spinner("Generating code explanation..."):
-                st.session_state.explanation = generate_explanation(
-                    st.session_state.generated_code,
+                started = time.monotonic()
+                set_result("explanation", take_prefetched("explain") or generate_explanation(
+                    generated_code,
                     selected_language,
                     client,
-                    complexity
-                )
+                    complexity,
+                    stream=stream_output,
+                    placeholder=stream_placeholder,
+                    use_cache=use_cache
+                ), time.monotonic() - started)
+                stream_placeholder.empty()
+                results_changed = True
     
     with action_cols[4]:
         if st.button("🧹 Clear", use_container_width=True,
                     help="Clear all generated content"):
-            st.session_state.generated_code = None
-            st.session_state.alternative_code = None
-            st.session_state.optimized_code = None
-            st.session_state.explanation = None
+            reset_results()
+            results_changed = True
     
-    # Display results in tabs
-    if st.session_state.generated_code:
-        tab1, tab2, tab3 = st.tabs(["Generated Code", "Optimized Code", "Explanation"])
-        
-        with tab1:
-            st.subheader(f"Generated {selected_language} Code ({complexity})")
-            
-            if show_metadata:
-                with st.expander("Code Metadata", expanded=False):
-                    metadata_cols = st.columns(3)
-                    with metadata_cols[0]:
-                        st.metric("Language", selected_language)
-                    with metadata_cols[1]:
-                        st.metric("Complexity", complexity)
-                    with metadata_cols[2]:
-                        st.metric("Style", coding_style)
-            
-            st.code(st.session_state.generated_code, language=selected_language.lower())
-            
-            if st.session_state.explanation and auto_explain:
-                with st.expander("Auto-generated Explanation", expanded=False):
-                    st.markdown(st.session_state.explanation)
-        
-        with tab2:
-            if st.session_state.optimized_code:
-                st.subheader(f"Optimized {selected_language} Code")
-                st.code(st.session_state.optimized_code, language=selected_language.lower())
+    with action_cols[5]:
+        if st.button("✨ Full Analysis", use_container_width=True,
+                    help="Generate code, then its explanation, optimization and an alternative concurrently"):
+            if not query:
+                st.warning("Please enter a code description")
             else:
-                st.info("Click the 'Optimize' button to generate an optimized version")
-        
-        with tab3:
-            if st.session_state.explanation:
-                st.subheader("Code Explanation")
-                st.markdown(st.session_state.explanation)
+                start_history_entry(query, settings)
+                run_full_analysis(
+                    client,
+                    query,
+                    selected_language,
+                    complexity,
+                    tags,
+                    style,
+                    stream_placeholder,
+                    use_cache=use_cache
+                )
+                stream_placeholder.empty()
+                results_changed = True
+    
+    with action_cols[6]:
+        compare_languages = settings["compare_languages"]
+        if st.button("🌐 Compare", use_container_width=True,
+                    disabled=len(compare_languages) < 2,
+                    help="Generate the request in every language picked under 'Compare languages' concurrently"):
+            if not query:
+                st.warning("Please enter a code description")
             else:
-                st.info("Click the 'Explain' button to generate a code explanation")
-        
-        # Alternative solution section
-        if st.session_state.alternative_code:
-            st.markdown("---")
-            with st.container(border=True):
-                st.subheader(f"Alternative {selected_language} Solution")
-                st.code(st.session_state.alternative_code, language=selected_language.lower())
+                start_history_entry(query, settings)
+                started = time.monotonic()
+                comparison = run_language_fanout(
+                    client,
+                    query,
+                    compare_languages,
+                    complexity,
+                    tags,
+                    style,
+                    stream_placeholder,
+                    use_cache=use_cache
+                )
+                for language, result in comparison.items():
+                    set_result(COMPARISON_PREFIX + language, result.pop("code"))
+                st.session_state.comparison = {"elapsed": time.monotonic() - started, "languages": comparison}
+                stream_placeholder.empty()
+                results_changed = True
+    
+    # The result panes live outside this fragment; a full rerun redraws them
+    if results_changed:
+        st.rerun()
     
     # Empty state
-    elif not st.session_state.generated_code and not query:
+    if not generated_code and not query:
         with st.container(border=True):
             st.subheader("Welcome to AstraCode Pro!")
             st.markdown("""
@@ -637,5 +1213,300 @@ def main():
             </div>
             """, unsafe_allow_html=True)
 
+# Generated code tab; the metadata toggle and regenerate button only rerun this tab
+@st.fragment
+def render_generated_tab() -> None:
+    result = st.session_state.result_settings
+    st.subheader(f"Generated {result['language']} Code ({result['complexity']})")
+    
+    if st.session_state.similar_match:
+        match = st.session_state.similar_match
+        st.info(
+            f"♻️ Reused the answer to a similar request ({match['similarity']:.0%} match): "
+            f"*{match['query']}*"
+        )
+        # Regenerate, skipping the similar-request shortcut
+        if st.button("🔁 Regenerate anyway", help="Ask the model for a new answer to your exact request"):
+            st.session_state.force_generate = True
+            st.session_state.skip_similar = True
+            st.rerun()
+    
+    candidates = st.session_state.candidates
+    if candidates:
+        candidate_set = candidates["set"]
+        winner = candidate_set.candidates[candidates["winner"]]
+        counts = {}
+        for candidate in candidate_set.candidates:
+            counts[candidate.status] = counts.get(candidate.status, 0) + 1
+        st.caption(
+            f"Best of {len(candidate_set.candidates)}: kept sample #{winner.index + 1} "
+            f"(temperature {winner.temperature:g}, ready after {winner.seconds:.1f}s) · "
+            + ", ".join(f"{count} {status}" for status, count in counts.items())
+        )
+        rejected = [candidate for candidate in candidate_set.candidates if candidate.status == "invalid"]
+        if rejected:
+            with st.expander("Rejected samples", expanded=False):
+                for candidate in rejected:
+                    st.markdown(f"**#{candidate.index + 1}**: {candidate.error}")
+    
+    if st.checkbox("Show code metadata", value=False):
+        with st.expander("Code Metadata", expanded=False):
+            metadata_cols = st.columns(3)
+            with metadata_cols[0]:
+                st.metric("Language", result["language"])
+            with metadata_cols[1]:
+                st.metric("Complexity", result["complexity"])
+            with metadata_cols[2]:
+                st.metric("Style", result["coding_style"])
+    
+    render_code(get_result("generated_code"), result["language"])
+    
+    # Whether to explain is decided when generating; the settings fragment doesn't rerun this tab
+    explanation = get_result("explanation")
+    if explanation:
+        with st.expander("Auto-generated Explanation", expanded=False):
+            st.markdown(explanation)
+
+# Side-by-side diff of two versions of the code (changed regions with a few lines of context)
+DIFF_CSS = """
+<style>
+.astra-diff table.diff {width: 100%; border-collapse: collapse; font-family: monospace; font-size: 0.8rem;}
+.astra-diff td {padding: 0 0.4rem; white-space: pre-wrap; vertical-align: top;}
+.astra-diff .diff_header {opacity: 0.6; text-align: right;}
+.astra-diff .diff_next {display: none;}
+.astra-diff .diff_add {background: rgba(46, 160, 67, 0.3);}
+.astra-diff .diff_chg {background: rgba(210, 153, 34, 0.3);}
+.astra-diff .diff_sub {background: rgba(248, 81, 73, 0.3);}
+</style>
+"""
+
+def render_diff(original: str, changed: str) -> None:
+    original_lines = original.splitlines()
+    changed_lines = changed.splitlines()
+    if original_lines == changed_lines:
+        st.info("No changes")
+        return
+    added = removed = 0
+    for line in difflib.unified_diff(original_lines, changed_lines, lineterm="", n=0):
+        if line.startswith("+") and not line.startswith("+++"):
+            added += 1
+        elif line.startswith("-") and not line.startswith("---"):
+            removed += 1
+    st.caption(f"+{added} / −{removed} lines")
+    table = difflib.HtmlDiff(tabsize=4, wrapcolumn=70).make_table(
+        original_lines, changed_lines, "Generated", "Optimized", context=True, numlines=3
+    )
+    st.html(f'{DIFF_CSS}<div class="astra-diff">{table}</div>')
+
+# Human-readable benchmark figures
+def format_seconds(seconds: Optional[float]) -> Optional[str]:
+    if seconds is None:
+        return None
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("µs", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3g} {unit}"
+    return f"{seconds / 1e-9:.3g} ns"
+
+def format_bytes(size: Optional[int]) -> Optional[str]:
+    if size is None:
+        return None
+    for unit in ("B", "KB", "MB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+# Sandbox results of the generated and optimized code, side by side
+def render_benchmark(comparison: BenchmarkComparison) -> None:
+    cols = st.columns(3)
+    with cols[0]:
+        speedup = comparison.speedup
+        st.metric("Speedup", f"{speedup:.2f}×" if speedup else "n/a")
+    with cols[1]:
+        st.metric("Original peak RSS", format_bytes(comparison.original.max_rss) or "n/a")
+    with cols[2]:
+        st.metric("Optimized peak RSS", format_bytes(comparison.optimized.max_rss) or "n/a")
+    if comparison.rows:
+        st.dataframe(
+            [
+                {
+                    "workload": row["workload"],
+                    "original": format_seconds(row["original_seconds"]),
+                    "optimized": format_seconds(row["optimized_seconds"]),
+                    "speedup": f"{row['speedup']:.2f}×" if row["speedup"] else None,
+                    "original peak": format_bytes(row["original_peak_bytes"]),
+                    "optimized peak": format_bytes(row["optimized_peak_bytes"]),
+                    "status": row["status"]
+                }
+                for row in comparison.rows
+            ],
+            hide_index=True
+        )
+    for label, result in (("Original", comparison.original), ("Optimized", comparison.optimized)):
+        failures = [workload for workload in result.workloads if workload["error"]]
+        if result.error:
+            st.error(f"{label} code: {result.error}")
+        if failures or (result.error and result.output):
+            with st.expander(f"{label} code: details"):
+                for workload in failures:
+                    st.markdown(f"**{workload['name']}**: `{workload['error']}`")
+                if result.output:
+                    st.code(result.output, language="text")
+    cached = comparison.original.cached and comparison.optimized.cached
+    st.caption(
+        "Per-call times are the fastest of several timeit rounds; peaks are tracemalloc allocations per workload"
+        + (" (cached result)" if cached else "")
+    )
+
+# Optimized code tab; benchmarking only reruns this tab
+@st.fragment
+def render_optimized_tab() -> None:
+    language = st.session_state.result_settings["language"]
+    optimized_code = get_result("optimized_code")
+    if optimized_code:
+        st.subheader(f"Optimized {language} Code")
+        optimization = st.session_state.get("optimization")
+        if optimization and optimization["digest"] == st.session_state.results.get("optimized_code"):
+            if "edits" in optimization:
+                st.caption(
+                    f"Applied {optimization['edits']} edit(s): about {optimization['output_tokens']:,} output tokens "
+                    f"instead of rewriting all {optimization['file_tokens']:,}"
+                )
+            elif optimization["fallback"]:
+                st.caption(f"Rewrote the whole file: {optimization['fallback']}")
+        generated_code = get_result("generated_code")
+        if generated_code and st.toggle("Show changes side by side", value=False):
+            render_diff(generated_code, optimized_code)
+        else:
+            render_code(optimized_code, language)
+        
+        if language == "Python":
+            # Keyed by both results, so a new generation or optimization never shows a stale benchmark
+            key = (st.session_state.results.get("generated_code"), st.session_state.results.get("optimized_code"))
+            if st.button("🧪 Benchmark", help="Run the tests and benchmarks of both versions in a sandbox and time them"):
+                with st.spinner("Running both versions in the sandbox..."):
+                    st.session_state.benchmark = {
+                        "key": key,
+                        "comparison": get_sandbox().compare(get_result("generated_code"), optimized_code)
+                    }
+            benchmark = st.session_state.get("benchmark")
+            if benchmark and benchmark["key"] == key:
+                render_benchmark(benchmark["comparison"])
+    else:
+        st.info("Click the 'Optimize' button to generate an optimized version")
+
+# Explanation tab
+@st.fragment
+def render_explanation_tab() -> None:
+    explanation = get_result("explanation")
+    if explanation:
+        st.subheader("Code Explanation")
+        st.markdown(explanation)
+    else:
+        st.info("Click the 'Explain' button to generate a code explanation")
+
+# Alternative solution section
+@st.fragment
+def render_alternative() -> None:
+    language = st.session_state.result_settings["language"]
+    st.markdown("---")
+    with st.container(border=True):
+        st.subheader(f"Alternative {language} Solution")
+        render_code(get_result("alternative_code"), language)
+
+# Language comparison section; each language in its own tab, with per-language call stats
+@st.fragment
+def render_comparison(languages: list) -> None:
+    st.markdown("---")
+    with st.container(border=True):
+        st.subheader(f"Compared in {len(languages)} Languages")
+        comparison = st.session_state.comparison
+        if comparison:
+            calls = comparison["languages"]
+            st.caption(
+                f"All {len(calls)} finished in {comparison['elapsed']:.1f}s "
+                f"(slowest {max((call['latency'] for call in calls.values()), default=0):.1f}s)"
+            )
+            st.dataframe(
+                [
+                    {
+                        "language": language,
+                        "latency (s)": round(call["latency"], 2),
+                        "first token (s)": round(call["ttft"], 2) if call["ttft"] is not None else None,
+                        "tokens": call["tokens"],
+                        "cache": call["cache"]
+                    }
+                    for language, call in ((language, calls[language]) for language in languages if language in calls)
+                ],
+                hide_index=True
+            )
+        for tab, language in zip(st.tabs(languages), languages):
+            with tab:
+                render_code(get_result(COMPARISON_PREFIX + language), language)
+
+# Main App Interface
+def main():
+    # Main content area (static content first, so the page paints before any setup)
+    st.title(f"💻 AstraCode Pro")
+    st.caption("Generate production-ready code with AI-powered assistance")
+    STARTUP.mark("first_paint")
+    start_metrics_endpoint()
+    
+    # Initialize session state
+    if 'results' not in st.session_state:
+        reset_results()
+    get_history_store().touch(current_session_id())
+    
+    # Sidebar for settings
+    with st.sidebar:
+        st.title("⚙️ AstraCode Pro Settings")
+        
+        render_settings()
+        
+        render_history()
+        
+        render_archive()
+        
+        if ADMIN_PANEL:
+            render_admin_panel()
+        
+        st.markdown("---")
+        st.markdown("### About AstraCode Pro")
+        st.caption("A next-gen AI code generator with advanced customization and theming")
+    
+    client = get_groq_client()
+    if not client:
+        return
+    
+    # Each section below is a fragment: an interaction inside one reruns and
+    # re-sends only that section instead of every code block on the page
+    render_workspace(client)
+    
+    # Display results in tabs
+    if get_result("generated_code"):
+        tab1, tab2, tab3 = st.tabs(["Generated Code", "Optimized Code", "Explanation"])
+        
+        with tab1:
+            render_generated_tab()
+        
+        with tab2:
+            render_optimized_tab()
+        
+        with tab3:
+            render_explanation_tab()
+        
+        if get_result("alternative_code"):
+            render_alternative()
+    
+    compared = [language for language in LANGUAGES if COMPARISON_PREFIX + language in st.session_state.results]
+    if compared:
+        render_comparison(compared)
+    
+    STARTUP.mark("ready")
+    if not STARTUP.reported:
+        # Once per process, after the page is up: have the client ready before the first click
+        client.warm()
+    STARTUP.log_once()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
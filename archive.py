@@ -0,0 +1,228 @@
+import atexit
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+# Archive Configuration
+ARCHIVE_PATH = os.getenv("ASTRACODE_ARCHIVE_PATH", "astracode_archive.db")
+ARCHIVE_FLUSH_INTERVAL = 0.5  # seconds the writer waits to fill a batch
+ARCHIVE_BATCH_SIZE = 256
+ARCHIVE_SEARCH_LIMIT = 20
+ARCHIVE_COLUMNS = (
+    "query", "language", "complexity", "style", "tags", "model",
+    "code", "explanation", "optimized", "alternative", "timings"
+)
+
+SEARCH_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+class ArchivedGeneration:
+    __slots__ = ("id", "key", "created") + ARCHIVE_COLUMNS
+
+    def __init__(self, row: sqlite3.Row):
+        for name in self.__slots__:
+            setattr(self, name, row[name])
+        self.tags = json.loads(self.tags) if self.tags else []
+        self.timings = json.loads(self.timings) if self.timings else {}
+
+
+class GenerationArchive:
+    """Every generation, kept in SQLite with an FTS5 index over queries and code.
+
+    ``record`` only enqueues: a background thread merges queued records by
+    key and writes each batch in one transaction (WAL journal), so archiving
+    never adds latency to a request. Records with the same key update one
+    row, which lets results that arrive later (explanation, optimization)
+    join their generation; ``timings`` dicts are merged. Searches run on a
+    separate connection and see every committed batch. Pass ``path=None``
+    (or an empty string) to disable the archive.
+    """
+
+    def __init__(self, path: Optional[str] = ARCHIVE_PATH, flush_interval: float = ARCHIVE_FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.fts = False
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._db = None
+        self._writer = None
+        if not path:
+            return
+        self._db = self._connect()
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS generations (
+                id INTEGER PRIMARY KEY,
+                key TEXT NOT NULL UNIQUE,
+                created REAL NOT NULL,
+                query TEXT,
+                language TEXT,
+                complexity TEXT,
+                style TEXT,
+                tags TEXT,
+                model TEXT,
+                code TEXT,
+                explanation TEXT,
+                optimized TEXT,
+                alternative TEXT,
+                timings TEXT
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS generations_created ON generations (created)")
+        try:
+            self._db.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS generations_fts
+                USING fts5(query, code, content='generations', content_rowid='id')
+            """)
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5: search falls back to LIKE scans
+            pass
+        else:
+            self.fts = True
+            self._db.executescript("""
+                CREATE TRIGGER IF NOT EXISTS generations_fts_insert AFTER INSERT ON generations BEGIN
+                    INSERT INTO generations_fts (rowid, query, code) VALUES (new.id, new.query, new.code);
+                END;
+                CREATE TRIGGER IF NOT EXISTS generations_fts_delete AFTER DELETE ON generations BEGIN
+                    INSERT INTO generations_fts (generations_fts, rowid, query, code)
+                    VALUES ('delete', old.id, old.query, old.code);
+                END;
+                CREATE TRIGGER IF NOT EXISTS generations_fts_update AFTER UPDATE OF query, code ON generations BEGIN
+                    INSERT INTO generations_fts (generations_fts, rowid, query, code)
+                    VALUES ('delete', old.id, old.query, old.code);
+                    INSERT INTO generations_fts (rowid, query, code) VALUES (new.id, new.query, new.code);
+                END;
+            """)
+        self._db.commit()
+        self._writer = threading.Thread(target=self._write_loop, name="archive-writer", daemon=True)
+        self._writer.start()
+        # The writer is a daemon; write out whatever is still queued on exit
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def enabled(self) -> bool:
+        return self._db is not None
+
+    def record(self, key: str, **fields) -> None:
+        """Queue an insert/update of the generation ``key``; only ``ARCHIVE_COLUMNS`` are accepted."""
+        if self._db is None:
+            return
+        unknown = set(fields) - set(ARCHIVE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown archive columns: {', '.join(sorted(unknown))}")
+        self._queue.put((key, time.time(), fields))
+
+    def flush(self) -> None:
+        """Block until everything queued so far is written."""
+        if self._db is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+
+    def search(self, text: str, limit: int = ARCHIVE_SEARCH_LIMIT) -> List[ArchivedGeneration]:
+        """Best matches for ``text`` in queries and code (every word, prefix-matched); newest first without words."""
+        if self._db is None:
+            return []
+        words = SEARCH_TOKEN_PATTERN.findall(text.lower())
+        if not words:
+            return self.recent(limit)
+        if self.fts:
+            # Quoted so user input can't be read as FTS5 query syntax
+            match = " ".join(f'"{word}"*' for word in words)
+            sql = (
+                "SELECT g.* FROM generations_fts f JOIN generations g ON g.id = f.rowid "
+                "WHERE generations_fts MATCH ? ORDER BY f.rank LIMIT ?"
+            )
+            params = (match, limit)
+        else:
+            clauses = " AND ".join("(query LIKE ? OR code LIKE ?)" for _ in words)
+            sql = f"SELECT * FROM generations WHERE {clauses} ORDER BY created DESC LIMIT ?"
+            params = tuple(pattern for word in words for pattern in (f"%{word}%",) * 2) + (limit,)
+        with self._lock:
+            return [ArchivedGeneration(row) for row in self._db.execute(sql, params)]
+
+    def recent(self, limit: int = ARCHIVE_SEARCH_LIMIT) -> List[ArchivedGeneration]:
+        if self._db is None:
+            return []
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM generations ORDER BY created DESC LIMIT ?", (limit,))
+            return [ArchivedGeneration(row) for row in rows]
+
+    def get(self, generation_id: int) -> Optional[ArchivedGeneration]:
+        if self._db is None:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT * FROM generations WHERE id = ?", (generation_id,)).fetchone()
+        return ArchivedGeneration(row) if row else None
+
+    def _write_loop(self) -> None:
+        db = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < ARCHIVE_BATCH_SIZE and batch[-1] is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stopping = batch[-1] is None
+            records = [record for record in batch if record is not None]
+            try:
+                self._write(db, records)
+            except sqlite3.Error as e:
+                # Archiving is best effort; a failed batch must not stop the writer
+                print(f"[astracode] archive write failed: {e}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        db.close()
+
+    @staticmethod
+    def _write(db: sqlite3.Connection, records: List[tuple]) -> None:
+        merged: Dict[str, tuple] = {}
+        for key, created, fields in records:
+            if key in merged:
+                first_created, previous = merged[key]
+                timings = {**previous.get("timings", {}), **fields.get("timings", {})}
+                fields = {**previous, **fields, **({"timings": timings} if timings else {})}
+                created = first_created
+            merged[key] = (created, fields)
+        if not merged:
+            return
+        with db:
+            for key, (created, fields) in merged.items():
+                values = {
+                    name: json.dumps(value, ensure_ascii=False) if name in ("tags", "timings") else value
+                    for name, value in fields.items()
+                }
+                columns = ["key", "created"] + list(values)
+                updates = ", ".join(
+                    f"{name} = json_patch(coalesce(generations.{name}, '{{}}'), excluded.{name})"
+                    if name == "timings" else f"{name} = excluded.{name}"
+                    for name in values
+                )
+                db.execute(
+                    f"INSERT INTO generations ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                    "ON CONFLICT(key) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING"),
+                    [key, created] + list(values.values())
+                )
@@ -0,0 +1,189 @@
+"""Headless batch code generation: JSONL queries in, JSONL results out.
+
+    python batch.py queries.jsonl results.jsonl --concurrency 8
+
+Each input line is a JSON object with a ``query`` and optionally ``id``,
+``language``, ``complexity``, ``tags`` and ``style``. Results are appended
+to the output file as soon as each one finishes, so an interrupted run
+loses no finished work; rerunning with the same output file skips every
+``id`` already written there. Calls go through the same cache, coalescing,
+model routing and rate limiting as the app.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Optional
+
+from core import LANGUAGES, generate, get_client, start_metrics_endpoint
+from ratelimit import PRIORITY_BACKGROUND
+
+if TYPE_CHECKING:
+    from groq import Groq
+
+BATCH_CONCURRENCY = 8
+BATCH_RETRIES = 3
+BATCH_BACKOFF = 2.0  # seconds, doubled on every retry
+
+
+def read_jobs(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if not job.get("query"):
+                raise ValueError(f"{path}:{line_number}: missing 'query'")
+            job.setdefault("id", line_number)
+            yield job
+
+
+def completed_ids(path: str) -> set:
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; that job simply runs again
+                continue
+            if record.get("error") is None:
+                done.add(record.get("id"))
+    return done
+
+
+def run_job(
+    job: dict,
+    client: Groq,
+    retries: int = BATCH_RETRIES,
+    backoff: float = BATCH_BACKOFF,
+    use_cache: bool = True
+) -> dict:
+    language = job.get("language", "Python")
+    record = {
+        "id": job["id"],
+        "query": job["query"],
+        "language": language,
+        "complexity": job.get("complexity", "Medium"),
+        "tags": job.get("tags") or [],
+        "style": job.get("style"),
+        "code": None,
+        "error": None,
+        "attempts": 0,
+        "latency": None
+    }
+    if language not in LANGUAGES:
+        print(f"warning: job {job['id']}: unsupported language {language!r}", file=sys.stderr)
+
+    started = time.monotonic()
+    for attempt in range(retries + 1):
+        record["attempts"] = attempt + 1
+        try:
+            record["code"] = generate(
+                job["query"],
+                language,
+                record["complexity"],
+                record["tags"],
+                record["style"],
+                client=client,
+                use_cache=use_cache,
+                priority=PRIORITY_BACKGROUND
+            )
+            record["error"] = None
+            break
+        except Exception as e:
+            record["error"] = str(e)
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt + random.uniform(0, backoff))
+    record["latency"] = round(time.monotonic() - started, 3)
+    return record
+
+
+def run_batch(
+    jobs: Iterable[dict],
+    output_path: str,
+    concurrency: int = BATCH_CONCURRENCY,
+    retries: int = BATCH_RETRIES,
+    client: Optional[Groq] = None,
+    use_cache: bool = True,
+    on_result: Optional[Callable[[dict], None]] = None
+) -> dict:
+    """Run ``jobs`` with bounded concurrency, appending each result to ``output_path``.
+
+    Jobs whose ``id`` already has a successful result in the output file are
+    skipped. At most ``2 * concurrency`` jobs are read ahead, so arbitrarily
+    large inputs stream through in constant memory. Returns a summary dict.
+    """
+    client = client or get_client()
+    skip = completed_ids(output_path)
+    summary = {"succeeded": 0, "failed": 0, "skipped": 0}
+    started = time.monotonic()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        pending = set()
+
+        def drain(return_when: str) -> None:
+            nonlocal pending
+            done, pending = wait(pending, return_when=return_when)
+            for future in done:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                summary["failed" if record["error"] else "succeeded"] += 1
+                if on_result:
+                    on_result(record)
+
+        for job in jobs:
+            if job["id"] in skip:
+                summary["skipped"] += 1
+                continue
+            if len(pending) >= 2 * concurrency:
+                drain(FIRST_COMPLETED)
+            pending.add(executor.submit(run_job, job, client, retries, BATCH_BACKOFF, use_cache))
+        while pending:
+            drain(FIRST_COMPLETED)
+
+    summary["elapsed"] = round(time.monotonic() - started, 3)
+    return summary
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate code for every query in a JSONL file.")
+    parser.add_argument("input", help="JSONL file of queries")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY,
+                        help="maximum number of requests in flight")
+    parser.add_argument("--retries", type=int, default=BATCH_RETRIES,
+                        help="retries per query after the first failure")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="always ask the model instead of reusing cached answers")
+    args = parser.parse_args(argv)
+    start_metrics_endpoint()
+
+    def report(record: dict) -> None:
+        status = "error: " + record["error"] if record["error"] else f"ok in {record['latency']}s"
+        print(f"[{record['id']}] {status}", file=sys.stderr)
+
+    summary = run_batch(
+        read_jobs(args.input),
+        args.output,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        use_cache=not args.no_cache,
+        on_result=report
+    )
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""End-to-end performance benchmark of the app against the local replay server.
+
+    python bench.py --sessions 8 --iterations 3 --output bench_results.json
+    python bench.py --recordings recordings.jsonl --queries queries.jsonl --rate-limit-rate 0.05
+
+Each simulated session drives the real Streamlit script headlessly
+(``streamlit.testing``) and plays a user: enter a query, Generate (with
+the automatic explanation), Optimize, Alternative, Explain, then toggle a
+display option (a UI-only rerun). Streamlit's test harness holds one
+session per process, so every session runs in its own process; all of
+them share one replay server (see ``replay.py``), whose timing and error
+injection are set with the same options. Sessions tick "Fresh sample" so
+each action reaches the backend, unless ``--cache`` is given.
+
+The report has p50/p95/p99 end-to-end latency per action, time to first
+token, reruns per second and memory per session. It is written as JSON
+so runs can be diffed.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+from replay import ReplayServer, add_profile_arguments, load_recordings, profile_from_args
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+BENCH_SESSIONS = 4
+BENCH_ITERATIONS = 2
+BENCH_TIMEOUT = 120.0  # seconds a single script run may take
+BENCH_QUERIES = [
+    "A function to calculate the Fibonacci sequence with memoization",
+    "A REST API endpoint for user authentication with JWT tokens",
+    "Parse a CSV file and compute per-column statistics",
+    "An LRU cache class with O(1) get and put",
+    "Merge overlapping intervals in a list",
+    "A thread-safe bounded producer/consumer queue"
+]
+BENCH_ACTIONS = ["🔄 Alternative", "⚡ Optimize", "📝 Explain"]
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return round(ordered[min(int(q * len(ordered)), len(ordered) - 1)], 4)
+
+    return {
+        "count": len(ordered),
+        "mean": round(sum(ordered) / len(ordered), 4),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": round(ordered[-1], 4)
+    }
+
+
+def resident_memory_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        # Peak rather than current, but available everywhere
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def session_environment(backend_url: str, use_cache: bool) -> dict:
+    # Read by the app's modules at import, so it has to be in place before a session process starts
+    env = {
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "bench"),
+        "ASTRACODE_BACKEND_URL": backend_url,
+        "ASTRACODE_RPM_LIMIT": os.environ.get("ASTRACODE_RPM_LIMIT", "100000"),
+        "ASTRACODE_TPM_LIMIT": os.environ.get("ASTRACODE_TPM_LIMIT", "100000000")
+    }
+    if not use_cache:
+        env["ASTRACODE_CACHE_PATH"] = ""
+    return env
+
+
+def run_session(session: int, queries: List[str], iterations: int, use_cache: bool, results) -> None:
+    from streamlit.testing.v1 import AppTest
+
+    record = {"session": session, "actions": {}, "runs": 0, "ttft": [], "errors": []}
+    baseline = resident_memory_mb()
+    started = time.monotonic()
+    app = AppTest.from_file(APP_PATH, default_timeout=BENCH_TIMEOUT)
+
+    def run(action: str, interact) -> None:
+        action_started = time.monotonic()
+        try:
+            interact()
+            app.run()
+        except Exception as e:
+            record["errors"].append(f"{action}: {e}")
+            return
+        finally:
+            record["runs"] += 1
+        record["actions"].setdefault(action, []).append(time.monotonic() - action_started)
+        for element in list(app.exception) + list(app.error):
+            record["errors"].append(f"{action}: {element.value if hasattr(element, 'value') else element.message}")
+
+    def click(label: str):
+        return lambda: next(button for button in app.button if button.label == label).click()
+
+    def toggle(label: str):
+        def interact():
+            box = next(box for box in app.checkbox if box.label == label)
+            box.set_value(not box.value)
+        return interact
+
+    run("first_run", lambda: None)
+    if not use_cache:
+        run("settings", toggle("Fresh sample (bypass cache)"))
+    for iteration in range(iterations):
+        query = queries[(session + iteration) % len(queries)]
+        run("input", lambda: app.text_area[0].input(query))
+        run("generate", click("🚀 Generate"))
+        for label in BENCH_ACTIONS:
+            run(label.split(" ", 1)[1].lower(), click(label))
+        run("ui_rerun", toggle("Show code metadata"))
+
+    from core import get_model_router
+
+    record["elapsed"] = time.monotonic() - started
+    record["memory_mb"] = resident_memory_mb() - baseline
+    record["ttft"] = [sample for samples in get_model_router().ttft_samples().values() for sample in samples]
+    results.put(record)
+
+
+def run_benchmark(
+    server: ReplayServer,
+    sessions: int = BENCH_SESSIONS,
+    iterations: int = BENCH_ITERATIONS,
+    queries: Optional[List[str]] = None,
+    use_cache: bool = False
+) -> dict:
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    os.environ.update(session_environment(server.start(), use_cache))
+    started = time.monotonic()
+    workers = [
+        context.Process(
+            target=run_session,
+            args=(session, queries or BENCH_QUERIES, iterations, use_cache, results),
+            name=f"bench-session-{session}"
+        )
+        for session in range(sessions)
+    ]
+    for worker in workers:
+        worker.start()
+    records = []
+    for worker in workers:
+        # Drain before joining: a child blocks on exit until its result is read
+        while worker.is_alive() or not results.empty():
+            try:
+                records.append(results.get(timeout=0.5))
+            except Exception:
+                continue
+        worker.join()
+    elapsed = time.monotonic() - started
+    server.stop()
+
+    actions: Dict[str, List[float]] = {}
+    for record in records:
+        for action, latencies in record["actions"].items():
+            actions.setdefault(action, []).extend(latencies)
+    llm_actions = ["generate"] + [label.split(" ", 1)[1].lower() for label in BENCH_ACTIONS]
+    total_runs = sum(record["runs"] for record in records)
+    memory = [record["memory_mb"] for record in records]
+    return {
+        "sessions": sessions,
+        "completed_sessions": len(records),
+        "iterations": iterations,
+        "elapsed": round(elapsed, 3),
+        "latency": {action: percentiles(latencies) for action, latencies in sorted(actions.items())},
+        "end_to_end": percentiles([value for action in llm_actions for value in actions.get(action, [])]),
+        "ttft": percentiles([sample for record in records for sample in record["ttft"]]),
+        "reruns_per_second": round(total_runs / elapsed, 3) if elapsed else None,
+        "memory_per_session_mb": {
+            "mean": round(sum(memory) / len(memory), 1) if memory else None,
+            "max": round(max(memory), 1) if memory else None
+        },
+        "server": dict(server.stats),
+        "errors": [error for record in records for error in record["errors"]]
+    }
+
+
+def read_queries(path: str) -> List[str]:
+    # Same format as batch.py input: one JSON object with a "query" per line
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["query"] for line in f if line.strip()]
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark AstraCode Pro end to end against a replay server.")
+    parser.add_argument("--sessions", type=int, default=BENCH_SESSIONS, help="concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=BENCH_ITERATIONS, help="queries per session")
+    parser.add_argument("--queries", help="JSONL file of queries (batch.py input format)")
+    parser.add_argument("--recordings", help="JSONL recordings to replay (see replay.py)")
+    parser.add_argument("--cache", action="store_true", help="let sessions use the response cache")
+    parser.add_argument("--port", type=int, default=0, help="replay server port (default: any free port)")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file the report is written to")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = ReplayServer(
+        load_recordings(args.recordings) if args.recordings else [],
+        profile_from_args(args),
+        port=args.port
+    )
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        **run_benchmark(
+            server,
+            sessions=args.sessions,
+            iterations=args.iterations,
+            queries=read_queries(args.queries) if args.queries else None,
+            use_cache=args.cache
+        )
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    summary = {key: report[key] for key in ("end_to_end", "ttft", "reruns_per_second", "memory_per_session_mb")}
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    return 1 if report["errors"] or report["completed_sessions"] < args.sessions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+import math
+import os
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# Output Budget Configuration
+MAX_OUTPUT_TOKENS = int(os.getenv("ASTRACODE_MAX_OUTPUT_TOKENS", 4096))
+BUDGET_MIN_SAMPLES = 10  # observations needed before a learned budget replaces the default
+BUDGET_WINDOW = 200  # recent completion lengths kept per bucket
+BUDGET_QUANTILE = 0.95
+BUDGET_HEADROOM = 1.25
+BUDGET_GRANULARITY = 256  # budgets are rounded up to a multiple of this
+
+
+class OutputBudget:
+    """``max_tokens`` per request kind and complexity, learned from observed completion lengths.
+
+    Until a bucket has ``min_samples`` observations its caller's default is
+    used; after that the budget is the recent 95th percentile plus headroom,
+    rounded up and capped at ``ceiling``. Completions that overran their
+    budget are recorded at their stitched length (see continuation in
+    ``core.py``), so the budget grows back when it was too tight.
+    """
+
+    def __init__(
+        self,
+        min_samples: int = BUDGET_MIN_SAMPLES,
+        window: int = BUDGET_WINDOW,
+        ceiling: int = MAX_OUTPUT_TOKENS
+    ):
+        self.min_samples = min_samples
+        self.window = window
+        self.ceiling = ceiling
+        self._samples: Dict[Tuple[str, str], Deque[int]] = {}
+        self._truncated: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, complexity: Optional[str], tokens: int, truncated: bool = False) -> None:
+        key = (kind, complexity or "")
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(tokens)
+            if truncated:
+                self._truncated[key] = self._truncated.get(key, 0) + 1
+
+    def max_tokens(self, kind: str, complexity: Optional[str], default: int) -> int:
+        with self._lock:
+            samples = list(self._samples.get((kind, complexity or ""), ()))
+        learned = self._learned(samples)
+        return learned if learned is not None else min(default, self.ceiling)
+
+    def _learned(self, samples: list) -> Optional[int]:
+        if len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        quantile = ordered[min(int(BUDGET_QUANTILE * len(ordered)), len(ordered) - 1)]
+        budget = math.ceil(quantile * BUDGET_HEADROOM / BUDGET_GRANULARITY) * BUDGET_GRANULARITY
+        return max(BUDGET_GRANULARITY, min(budget, self.ceiling))
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            buckets = {key: list(samples) for key, samples in self._samples.items()}
+            truncated = dict(self._truncated)
+        return {
+            f"{kind}/{complexity or '-'}": {
+                "samples": len(samples),
+                "max_observed": max(samples),
+                "budget": self._learned(samples),
+                "truncated": truncated.get((kind, complexity), 0)
+            }
+            for (kind, complexity), samples in sorted(buckets.items())
+        }
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# Cache Configuration
+CACHE_PATH = os.getenv("ASTRACODE_CACHE_PATH", "astracode_cache.db")
+CACHE_TTL = float(os.getenv("ASTRACODE_CACHE_TTL", 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv("ASTRACODE_CACHE_MAX_ENTRIES", 512))
+CACHE_DISK_MAX_ENTRIES = int(os.getenv("ASTRACODE_CACHE_DISK_MAX_ENTRIES", 20000))
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: an in-memory LRU in front of a SQLite table.
+
+    Both tiers honour the same TTL. The memory tier is bounded by
+    ``max_entries``; the disk tier is trimmed to ``max_disk_entries`` by
+    least-recent access. Pass ``path=None`` (or an empty string) to run
+    memory-only. All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        ttl: float = CACHE_TTL,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        max_disk_entries: int = CACHE_DISK_MAX_ENTRIES
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    accessed REAL NOT NULL
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            self._purge_expired()
+
+    @staticmethod
+    def make_key(
+        model: str,
+        prompt: str,
+        temperature: Optional[float],
+        top_p: Optional[float],
+        max_tokens: Optional[int]
+    ) -> str:
+        payload = json.dumps([model, prompt, temperature, top_p, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    return value
+                del self._memory[key]
+
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created = row
+            if now - created > self.ttl:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, value, created)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            self._db.commit()
+            self._writes += 1
+            # Trimming needs a COUNT(*), so only do it every so often
+            if self._writes % 100 == 0:
+                self._trim_disk()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def _remember(self, key: str, value: str, created: float) -> None:
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _purge_expired(self) -> None:
+        self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+        self._db.commit()
+
+    def _trim_disk(self) -> None:
+        self._purge_expired()
+        (count,) = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()
+        excess = count - self.max_disk_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed LIMIT ?)",
+                (excess,)
+            )
+            self._db.commit()
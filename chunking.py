@@ -0,0 +1,135 @@
+import bisect
+import os
+from typing import List, Optional
+
+from pygments.token import Comment, Name, Punctuation, String, Text, Token
+
+from highlight import get_lexer
+from ratelimit import estimate_tokens
+
+# Chunking Configuration
+CHUNK_THRESHOLD_TOKENS = int(os.getenv("ASTRACODE_CHUNK_THRESHOLD", 1500))  # inputs above this are map-reduced
+CHUNK_TARGET_TOKENS = int(os.getenv("ASTRACODE_CHUNK_TOKENS", 800))
+CHUNK_OUTLINE_LINES = 40  # unit headings listed in the outline every chunk prompt carries
+
+OPENERS = "([{"
+CLOSERS = ")]}"
+# Lines at the top level that continue the previous unit rather than start one
+CONTINUATION_KEYWORDS = {"else", "elif", "except", "finally", "catch"}
+# Statements left out of the outline
+PREAMBLE_PREFIXES = ("import ", "from ", "#include", "using ", "package ", "use ", "require")
+
+
+class CodeChunk:
+    """Consecutive top-level units of a file (lines ``start``..``end``, 1-based, inclusive)."""
+
+    def __init__(self, index: int, start: int, end: int, code: str, headings: List[str]):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.code = code
+        self.headings = headings
+
+    @property
+    def title(self) -> str:
+        return self.headings[0] if self.headings else f"lines {self.start}-{self.end}"
+
+
+def _line_heads(code: str, language: str) -> List[Optional[tuple]]:
+    """For each line: (bracket depth at its start, first token type, first token) if a token starts it at column 0."""
+    line_offsets = [0] + [i + 1 for i, char in enumerate(code) if char == "\n"]
+    heads: List[Optional[tuple]] = [None] * len(line_offsets)
+    seen = [False] * len(line_offsets)
+    depth = 0
+    for position, token_type, value in get_lexer(language).get_tokens_unprocessed(code):
+        if value.strip():
+            line = bisect.bisect_right(line_offsets, position) - 1
+            if not seen[line]:
+                seen[line] = True
+                if position == line_offsets[line]:
+                    heads[line] = (depth, token_type, value.strip())
+        if token_type in Punctuation or token_type in Token.Operator or token_type in Text:
+            depth += sum(value.count(char) for char in OPENERS) - sum(value.count(char) for char in CLOSERS)
+            depth = max(depth, 0)
+    return heads
+
+
+def _unit_starts(code: str, language: str) -> List[int]:
+    starts = []
+    lead = None  # first line of a comment/decorator run heading the next unit
+    for line, head in enumerate(_line_heads(code, language)):
+        # Lines inside multi-line strings start with a string token
+        if head is None or head[1] in String:
+            continue
+        depth, token_type, value = head
+        if depth or value[0] in CLOSERS or value.split()[0].rstrip(":") in CONTINUATION_KEYWORDS:
+            lead = None
+            continue
+        if (
+            (token_type in Comment and token_type not in Comment.Preproc)
+            or token_type in Name.Decorator
+            or value.startswith(("@", "template"))
+        ):
+            lead = line if lead is None else lead
+            continue
+        starts.append(line if lead is None else lead)
+        lead = None
+    if not starts or starts[0] != 0:
+        starts.insert(0, 0)
+    return starts
+
+
+def _heading(lines: List[str]) -> str:
+    for line in lines:
+        stripped = line.strip()
+        if stripped and not stripped.startswith(("#", "//", "/*", "*", "@")):
+            return "" if stripped.startswith(PREAMBLE_PREFIXES) else stripped[:80]
+    return ""
+
+
+def split_code(code: str, language: str, target_tokens: int = CHUNK_TARGET_TOKENS) -> List[CodeChunk]:
+    """Split ``code`` at top-level units (functions, classes, statements) into chunks of about ``target_tokens``.
+
+    Boundaries come from the language's Pygments lexer: a unit starts at a
+    column-0 token outside any bracket, so strings, comments and nested
+    code never split; comments and decorators stay with what follows them.
+    A unit larger than the target becomes a chunk of its own.
+    """
+    lines = code.split("\n")
+    starts = _unit_starts(code, language) + [len(lines)]
+    units = [lines[start:end] for start, end in zip(starts, starts[1:]) if start < end]
+    chunks: List[CodeChunk] = []
+    current: List[str] = []
+    headings: List[str] = []
+    first_line = 1
+    for unit in units:
+        if current and estimate_tokens("\n".join(current + unit)) > target_tokens:
+            chunks.append(CodeChunk(len(chunks), first_line, first_line + len(current) - 1, "\n".join(current), headings))
+            first_line += len(current)
+            current, headings = [], []
+        current += unit
+        heading = _heading(unit)
+        if heading:
+            headings.append(heading)
+    if current:
+        chunks.append(CodeChunk(len(chunks), first_line, first_line + len(current) - 1, "\n".join(current), headings))
+    return chunks
+
+
+def plan_chunks(code: str, language: str) -> Optional[List[CodeChunk]]:
+    """Chunks for map-reduce processing, or None when ``code`` is small enough for a single request."""
+    if estimate_tokens(code) <= CHUNK_THRESHOLD_TOKENS:
+        return None
+    chunks = split_code(code, language)
+    return chunks if len(chunks) > 1 else None
+
+
+def outline(chunks: List[CodeChunk]) -> str:
+    """Where everything is, so each chunk can be handled knowing the rest of the file."""
+    lines = []
+    for chunk in chunks:
+        for heading in chunk.headings:
+            lines.append(f"- part {chunk.index + 1} (lines {chunk.start}-{chunk.end}): {heading}")
+    if len(lines) > CHUNK_OUTLINE_LINES:
+        lines = lines[:CHUNK_OUTLINE_LINES] + [f"- ... {len(lines) - CHUNK_OUTLINE_LINES} more"]
+    return "\n".join(lines)
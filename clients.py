@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import os
+import threading
+from importlib.util import find_spec
+from typing import TYPE_CHECKING
+
+from startup import lazy_import
+
+if TYPE_CHECKING:
+    from groq import Groq
+
+# Connection Pool Configuration
+GROQ_TIMEOUT = float(os.getenv("ASTRACODE_GROQ_TIMEOUT", 60))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("ASTRACODE_GROQ_CONNECT_TIMEOUT", 5))
+GROQ_MAX_RETRIES = int(os.getenv("ASTRACODE_GROQ_MAX_RETRIES", 2))
+GROQ_MAX_CONNECTIONS = int(os.getenv("ASTRACODE_GROQ_MAX_CONNECTIONS", 100))
+GROQ_MAX_KEEPALIVE = int(os.getenv("ASTRACODE_GROQ_MAX_KEEPALIVE", 20))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv("ASTRACODE_GROQ_KEEPALIVE_EXPIRY", 120))
+
+# Completion Backend (e.g. the local replay server in replay.py) and traffic recording
+BACKEND_URL = os.getenv("ASTRACODE_BACKEND_URL") or None
+RECORD_PATH = os.getenv("ASTRACODE_RECORD_PATH") or None
+
+
+def http2_available() -> bool:
+    return find_spec("h2") is not None
+
+
+def _pool_options() -> dict:
+    # groq and httpx are imported on first use to keep them off the cold-start path
+    httpx = lazy_import("httpx")
+    return dict(
+        timeout=httpx.Timeout(GROQ_TIMEOUT, connect=GROQ_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+            keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+        ),
+        http2=http2_available()
+    )
+
+
+class ClientRegistry:
+    """Process-lifetime Groq clients with tuned, shared connection pools.
+
+    One client is kept per API key and shared by every thread; concurrent
+    work (map-reduce, fan-out, best-of-N) runs on threads over its pool.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync = {}
+
+    def get_sync(self, api_key: str) -> Groq:
+        with self._lock:
+            client = self._sync.get(api_key)
+            if client is None:
+                groq = lazy_import("groq")
+                client = groq.Groq(
+                    api_key=api_key,
+                    base_url=BACKEND_URL,
+                    max_retries=GROQ_MAX_RETRIES,
+                    http_client=groq.DefaultHttpxClient(**_pool_options())
+                )
+                if RECORD_PATH:
+                    client = lazy_import("replay").RecordingClient(client, RECORD_PATH)
+                self._sync[api_key] = client
+            return client
+
+    def get_lazy(self, api_key: str) -> LazyClient:
+        return LazyClient(self, api_key)
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._sync.values():
+                client.close()
+            self._sync.clear()
+
+
+class LazyClient:
+    """Stands in for the registry's client until it is first used.
+
+    Building the client imports groq and httpx and sets up the connection
+    pool; a script run that makes no request (such as the first one) never
+    pays for it. ``warm`` builds it on a background thread instead.
+    """
+
+    def __init__(self, registry: ClientRegistry, api_key: str):
+        self._registry = registry
+        self._api_key = api_key
+
+    def resolve(self) -> Groq:
+        return self._registry.get_sync(self._api_key)
+
+    def warm(self) -> None:
+        threading.Thread(target=self.resolve, name="client-warmup", daemon=True).start()
+
+    def __getattr__(self, name: str):
+        return getattr(self.resolve(), name)
@@ -0,0 +1,142 @@
+import threading
+from concurrent.futures import CancelledError
+from typing import Callable, Iterable, Iterator, List, Optional
+
+IDLE_INTERVAL = 0.25  # seconds a subscriber waits before its on_idle callback fires
+
+
+class _Flight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.cancelled = threading.Event()  # set once no subscriber is left
+        self.status = {}
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """Coalesce identical in-flight requests into a single upstream call.
+
+    The first caller for a key starts the producer on a background thread;
+    every caller (including the first) receives an iterator that replays the
+    chunks produced so far and then follows the live stream. Because no
+    subscriber drives the producer, one of them going away (e.g. a Streamlit
+    rerun) never strands the others; once the last subscriber has gone, the
+    producer is stopped and the flight unregistered, so a later caller starts
+    a fresh call rather than joining one that ends early. Errors (including
+    the ``CancelledError`` of a stopped flight) are re-raised to all
+    subscribers.
+
+    The producer is handed a per-flight ``status`` dict it may update (e.g.
+    with its queue position) and the flight's ``cancelled`` event, which it
+    may watch while it waits for its first chunk; subscribers waiting for the
+    next chunk get the status through their ``on_idle`` callback, called on
+    their own thread. A subscriber whose own ``cancelled`` event is set stops
+    with ``CancelledError`` even while no chunk arrives.
+    ``on_lead`` is called (before the producer starts) only for the caller
+    whose producer actually runs.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.coalesced_calls = 0
+
+    def subscribe(
+        self,
+        key: str,
+        producer: Callable[[dict, threading.Event], Iterable[str]],
+        on_idle: Optional[Callable[[dict], None]] = None,
+        on_lead: Optional[Callable[[], None]] = None,
+        cancelled: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None or flight.cancelled.is_set():
+                flight = _Flight()
+                self._flights[key] = flight
+                self.upstream_calls += 1
+                if on_lead:
+                    on_lead()
+                threading.Thread(
+                    target=self._run,
+                    args=(key, flight, producer),
+                    name=f"singleflight-{key[:12]}",
+                    daemon=True
+                ).start()
+            else:
+                self.coalesced_calls += 1
+            with flight.cond:
+                flight.subscribers += 1
+        return self._follow(key, flight, on_idle, cancelled)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def _run(self, key: str, flight: _Flight, producer: Callable[[dict, threading.Event], Iterable[str]]) -> None:
+        chunks = producer(flight.status, flight.cancelled)
+        try:
+            for chunk in chunks:
+                with flight.cond:
+                    if flight.cancelled.is_set():
+                        # Whoever still reads must not take the partial output for a full answer
+                        flight.error = CancelledError()
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if hasattr(chunks, "close"):
+                chunks.close()
+            # Unregister first so late arrivals start a fresh call instead of
+            # replaying a finished one (the response cache covers those)
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+
+    def _follow(
+        self,
+        key: str,
+        flight: _Flight,
+        on_idle: Optional[Callable[[dict], None]] = None,
+        cancelled: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        position = 0
+        timeout = IDLE_INTERVAL if on_idle or cancelled else None
+        try:
+            while True:
+                with flight.cond:
+                    while position >= len(flight.chunks) and not flight.done:
+                        if not flight.cond.wait(timeout):
+                            break
+                    chunks = flight.chunks[position:]
+                    done = flight.done
+                if cancelled is not None and cancelled.is_set():
+                    raise CancelledError()
+                if not chunks and not done:
+                    if on_idle:
+                        on_idle(flight.status)
+                    continue
+                position += len(chunks)
+                yield from chunks
+                if done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            # Under the registry lock, so subscribe() can't join the flight once it is cancelled
+            with self._lock:
+                with flight.cond:
+                    flight.subscribers -= 1
+                    if flight.subscribers == 0 and not flight.done:
+                        flight.cancelled.set()
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
@@ -0,0 +1,131 @@
+from typing import List, Optional, Tuple
+
+FENCE = "```"
+
+# Fence info-string tags models use for each entry in LANGUAGES
+LANGUAGE_ALIASES = {
+    "Python": {"python", "py", "python3", "py3"},
+    "JavaScript": {"javascript", "js", "jsx", "node", "nodejs", "mjs", "cjs"},
+    "Java": {"java"},
+    "C++": {"c++", "cpp", "cxx", "cc", "hpp", "h++"},
+    "Go": {"go", "golang"},
+    "Rust": {"rust", "rs"},
+    "TypeScript": {"typescript", "ts", "tsx"},
+    "Swift": {"swift"},
+    "Kotlin": {"kotlin", "kt", "kts"},
+    "C#": {"c#", "csharp", "cs", "dotnet"}
+}
+
+
+def language_tags(language: str) -> set:
+    return LANGUAGE_ALIASES.get(language, {language.lower()})
+
+
+class CodeBlockExtractor:
+    """Incrementally extract the code block for ``language`` from streamed markdown.
+
+    Feed text deltas as they arrive; ``feed()`` returns True once a block
+    tagged with one of the language's aliases (or untagged) has closed, at
+    which point the rest of the response can be dropped. Blocks tagged with
+    another language (e.g. a ``bash`` install line) are skipped over. Only
+    fences at the start of a line count, so backticks inside code don't
+    close the block early. ``code`` is the best answer so far: the target
+    block, else an unterminated block, else the first block, else the raw
+    text when the model used no fences at all.
+    """
+
+    def __init__(self, language: str):
+        self.tags = language_tags(language)
+        self.done = False
+        self._text: List[str] = []
+        self._pending = ""
+        self._blocks: List[Tuple[str, str]] = []
+        self._open_tag: Optional[str] = None
+        self._open_lines: Optional[List[str]] = None
+        self._target: Optional[str] = None
+
+    def feed(self, delta: str) -> bool:
+        if self.done:
+            return True
+        self._text.append(delta)
+        self._pending += delta
+        while not self.done and "\n" in self._pending:
+            line, self._pending = self._pending.split("\n", 1)
+            self._process_line(line)
+        return self.done
+
+    def finish(self) -> str:
+        if not self.done and self._pending:
+            self._process_line(self._pending)
+            self._pending = ""
+        return self.code
+
+    @property
+    def code(self) -> str:
+        if self._target is not None:
+            return self._target
+        open_block = None
+        if self._open_lines is not None:
+            lines = self._open_lines
+            if self._pending and not self._pending.lstrip().startswith("`"):
+                lines = lines + [self._pending]
+            open_block = (self._open_tag, "\n".join(lines).strip())
+        candidates = self._blocks + ([open_block] if open_block else [])
+        for tag, code in candidates:
+            if not tag or tag in self.tags:
+                return code
+        if candidates:
+            return candidates[0][1]
+        return "".join(self._text).strip()
+
+    def _process_line(self, line: str) -> None:
+        stripped = line.strip()
+        if self._open_lines is None:
+            if stripped.startswith(FENCE):
+                info = stripped[len(FENCE):].strip().lower()
+                self._open_tag = info.split()[0].strip("{}.") if info else ""
+                self._open_lines = []
+            return
+        if stripped.startswith(FENCE) and not stripped.strip("`").strip():
+            code = "\n".join(self._open_lines).strip()
+            self._blocks.append((self._open_tag, code))
+            if not self._open_tag or self._open_tag in self.tags:
+                self._target = code
+                self.done = True
+            self._open_tag = None
+            self._open_lines = None
+            return
+        self._open_lines.append(line)
+
+
+# Extract just the code block if it's wrapped in markdown
+def extract_code_block(raw_content: str, language: str) -> str:
+    extractor = CodeBlockExtractor(language)
+    extractor.feed(raw_content)
+    return extractor.finish()
+
+
+def open_fence(text: str) -> bool:
+    """Whether ``text`` ends inside a fenced block (an odd number of line-start fences)."""
+    return sum(1 for line in text.split("\n") if line.strip().startswith(FENCE)) % 2 == 1
+
+
+# Part of a continuation that doesn't repeat the text it continues
+def stitch_continuation(previous: str, continuation: str, min_overlap: int = 8) -> str:
+    # Models often re-open the code block they were cut off in
+    if open_fence(previous) and continuation.lstrip().startswith(FENCE):
+        stripped = continuation.lstrip()
+        newline = stripped.find("\n")
+        continuation = stripped[newline + 1:] if newline != -1 else ""
+    # ...or restart from a few lines back
+    for size in range(min(len(previous), len(continuation)), min_overlap - 1, -1):
+        if previous.endswith(continuation[:size]):
+            return continuation[size:]
+    # ...or restart the line they were cut off in, however short it is
+    partial = previous[previous.rfind("\n") + 1:]
+    if partial.strip():
+        restarted = continuation.lstrip("\n")
+        for head in (partial, partial.lstrip()):
+            if restarted.startswith(head):
+                return restarted[len(head):]
+    return continuation
@@ -0,0 +1,1244 @@
+"""UI-free core of AstraCode Pro: prompt building and the completion stack.
+
+Everything here is safe to use outside Streamlit (see ``batch.py``); the
+Streamlit app in ``app.py`` is a thin layer on top.
+"""
+from __future__ import annotations
+
+import os
+import textwrap
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, CancelledError, ThreadPoolExecutor, wait
+from contextlib import closing
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, List, Optional, Tuple, Union
+
+from archive import GenerationArchive
+from budget import MAX_OUTPUT_TOKENS, OutputBudget
+from cache import ResponseCache
+from chunking import CodeChunk, outline, plan_chunks
+from clients import ClientRegistry
+from codeblock import CodeBlockExtractor, extract_code_block, stitch_continuation
+from coalesce import SingleFlight
+from highlight import Highlighter
+from history import HistoryStore, text_digest
+from patching import NO_CHANGES, PatchError, apply_hunks, parse_hunks, uses_patches
+from prefetch import PrefetchJob, Prefetcher
+from ratelimit import (
+    FairScheduler,
+    PRIORITY_BACKGROUND,
+    PRIORITY_NORMAL,
+    PRIORITY_PREFETCH,
+    Ticket,
+    estimate_tokens
+)
+from routing import ModelRouter
+from sandbox import SandboxRunner
+from semantic_cache import SemanticIndex, SimilarMatch
+from telemetry import METRICS_PORT, CallTrace, Metrics, serve_metrics
+from validation import check_tokens, validate_code
+
+if TYPE_CHECKING:
+    from groq import Groq
+
+# Configuration
+PRIMARY_MODEL = "qwen-2.5-coder-32b"
+BACKUP_MODEL = "llama3-70b-8192"
+LANGUAGES = ["Python", "JavaScript", "Java", "C++", "Go", "Rust", "TypeScript", "Swift", "Kotlin", "C#"]
+COMPLEXITY_LEVELS = {
+    "Basic": {
+        "description": "Simple implementation with minimal features",
+        "icon": "🌱",
+        "temperature": 0.3,
+        "max_tokens": 1024,  # starting output budgets, adapted from observed lengths
+        "explanation_tokens": 512
+    },
+    "Medium": {
+        "description": "Well-structured code with comments and basic error handling",
+        "icon": "🚀",
+        "temperature": 0.5,
+        "max_tokens": 2048,
+        "explanation_tokens": 768
+    },
+    "Advanced": {
+        "description": "Production-ready with tests, documentation, and robust error handling",
+        "icon": "💎",
+        "temperature": 0.7,
+        "max_tokens": 3072,
+        "explanation_tokens": 1024
+    },
+    "Expert": {
+        "description": "Optimized solution with advanced patterns, benchmarks, and scalability",
+        "icon": "🧠",
+        "temperature": 0.9,
+        "max_tokens": 4096,
+        "explanation_tokens": 1024
+    }
+}
+MAX_CONTINUATIONS = int(os.getenv("ASTRACODE_MAX_CONTINUATIONS", 3))  # follow-up requests for a truncated answer
+CONTINUATION_OVERLAP_WINDOW = 200  # characters of a continuation checked for repeated text
+CONTINUATION_PROMPT = (
+    "Continue exactly where your previous message stopped. Do not repeat anything already written "
+    "and do not add any explanation."
+)
+CHUNK_WORKERS = 4  # concurrent requests when map-reducing a large input
+CHUNK_PROGRESS_INTERVAL = 0.1  # seconds between progress callbacks while map-reducing
+CANDIDATES = int(os.getenv("ASTRACODE_CANDIDATES", 1))  # default samples per generation (best of N)
+CANDIDATE_TEMPERATURE_STEP = 0.15  # samples spread around the complexity level's temperature by this much
+CANDIDATE_TEMPERATURE_RANGE = (0.05, 1.2)
+CANDIDATE_CHECK_INTERVAL = 0.25  # seconds between validations of a streaming sample
+# Output budget bucket of each action (optimization budgets follow the input size instead)
+BUDGET_KINDS = {"generate": "code", "alternative": "code", "explain": "explanation"}
+
+# Shared Instances (one per process, shared by every session and batch worker)
+_shared = {}
+_shared_lock = threading.Lock()
+
+def _shared_instance(name: str, factory: Callable[[], object]):
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+# Pooled Groq clients reused across requests
+def get_client_registry() -> ClientRegistry:
+    return _shared_instance("client_registry", ClientRegistry)
+
+def get_client(api_key: Optional[str] = None, lazy: bool = False) -> Groq:
+    # A lazy client is only built on first use (see clients.LazyClient)
+    api_key = api_key or os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY not found! Please set it in environment variables or secrets.")
+    if lazy:
+        return get_client_registry().get_lazy(api_key)
+    return get_client_registry().get_sync(api_key)
+
+# Two-tier response cache
+def get_response_cache() -> ResponseCache:
+    return _shared_instance("response_cache", ResponseCache)
+
+# Identical concurrent requests share one upstream call
+def get_request_coalescer() -> SingleFlight:
+    return _shared_instance("request_coalescer", SingleFlight)
+
+# Health tracking, circuit breaking and hedging across models
+def get_model_router() -> ModelRouter:
+    return _shared_instance("model_router", lambda: ModelRouter([PRIMARY_MODEL, BACKUP_MODEL]))
+
+# Per-model RPM/TPM budgets with a fair queue
+def get_scheduler() -> FairScheduler:
+    return _shared_instance("scheduler", FairScheduler)
+
+# Near-duplicate lookup of past code-generation queries
+def get_semantic_index() -> SemanticIndex:
+    return _shared_instance("semantic_index", SemanticIndex)
+
+# Memoized server-side syntax highlighting
+def get_highlighter() -> Highlighter:
+    return _shared_instance("highlighter", Highlighter)
+
+# Searchable archive of every generation (written by a background thread)
+def get_archive() -> GenerationArchive:
+    return _shared_instance("archive", GenerationArchive)
+
+# Output token budgets learned per request kind and complexity
+def get_output_budget() -> OutputBudget:
+    return _shared_instance("output_budget", OutputBudget)
+
+# Compressed per-session result history, shared across sessions
+def get_history_store() -> HistoryStore:
+    return _shared_instance("history_store", HistoryStore)
+
+# Speculative background runs of likely next actions
+def get_prefetcher() -> Prefetcher:
+    # Fetched first: factories run under the (non-reentrant) shared-instance lock
+    metrics = get_metrics()
+    return _shared_instance("prefetcher", lambda: Prefetcher(metrics=metrics))
+
+# Sandboxed runs and benchmarks of generated Python code, cached with the responses
+def get_sandbox() -> SandboxRunner:
+    # Fetched first: factories run under the (non-reentrant) shared-instance lock
+    cache = get_response_cache()
+    return _shared_instance("sandbox", lambda: SandboxRunner(cache=cache))
+
+# Per-call telemetry (and the Prometheus endpoint when ASTRACODE_METRICS_PORT is set)
+def get_metrics() -> Metrics:
+    return _shared_instance("metrics", _create_metrics)
+
+def _create_metrics() -> Metrics:
+    metrics = Metrics()
+    metrics.register_gauge(
+        "astracode_rate_limit_queue_length",
+        "Calls waiting for the rate limiter",
+        lambda: {(): get_scheduler().queue_length()}
+    )
+    metrics.register_gauge(
+        "astracode_upstream_in_flight",
+        "Distinct upstream calls currently streaming",
+        lambda: {(): get_request_coalescer().in_flight()}
+    )
+    if METRICS_PORT:
+        serve_metrics(metrics, METRICS_PORT)
+    return metrics
+
+# Called at process start, so /metrics answers before (or without) any model call
+def start_metrics_endpoint() -> None:
+    if METRICS_PORT:
+        get_metrics()
+
+# Upstream Completion Producer (yields text deltas, settles the rate-limit ticket)
+def iter_stream_deltas(
+    client: Groq,
+    request: dict,
+    scheduler: FairScheduler,
+    ticket: Ticket,
+    trace: Optional[CallTrace] = None
+) -> Iterator[str]:
+    from groq import RateLimitError  # already loaded along with the client
+    
+    try:
+        stream = client.chat.completions.create(stream=True, **request)
+    except RateLimitError:
+        scheduler.penalize(request["model"])
+        raise
+    usage = None
+    finish_reason = None
+    try:
+        for chunk in stream:
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+            if chunk.choices:
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if trace is not None and trace.ttft is None:
+                    trace.first_token(request["model"], ticket.queue_wait)
+                yield delta
+    finally:
+        stream.close()
+        scheduler.settle(
+            ticket,
+            usage.total_tokens if usage else None,
+            usage.completion_tokens if usage else None
+        )
+        # Only the attempt that was served reports; a cancelled hedge has no usage
+        if trace is not None and trace.model == request["model"]:
+            trace.finish_reason = finish_reason
+            if usage:
+                # Summed over the continuations of a truncated answer
+                trace.prompt_tokens = (trace.prompt_tokens or 0) + usage.prompt_tokens
+                trace.completion_tokens = (trace.completion_tokens or 0) + usage.completion_tokens
+
+# Exact-match cache key for a completion request; max_tokens is left out since
+# budgets adapt over time and truncated answers are continued past them
+def request_cache_key(request: dict) -> str:
+    return ResponseCache.make_key(
+        request["model"],
+        request["messages"][0]["content"],
+        request.get("temperature"),
+        request.get("top_p"),
+        None
+    )
+
+# Follow-up request asking the model to go on from where a truncated answer stopped
+def build_continuation_request(request: dict, partial: str, model: str) -> dict:
+    return {
+        **request,
+        "model": model,
+        "messages": request["messages"] + [
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": CONTINUATION_PROMPT}
+        ]
+    }
+
+# Drop what a continuation repeats of the text before it, then pass the rest through
+def trim_continuation(previous: str, deltas: Iterator[str]) -> Iterator[str]:
+    head = ""
+    try:
+        for delta in deltas:
+            if head is None:
+                yield delta
+                continue
+            head += delta
+            if len(head) >= CONTINUATION_OVERLAP_WINDOW:
+                yield stitch_continuation(previous, head)
+                head = None
+        if head:
+            yield stitch_continuation(previous, head)
+    finally:
+        deltas.close()
+
+# Cached, Coalesced, Rate-Limited Completion Stream (yields text deltas)
+def open_completion(
+    client: Groq,
+    request: dict,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    session_id: str = "",
+    on_idle: Optional[Callable[[dict], None]] = None,
+    stop_after_code: Optional[str] = None,
+    action: str = "completion",
+    complexity: Optional[str] = None,
+    stats: Optional[dict] = None,
+    cancel: Optional[threading.Event] = None
+) -> Iterator[str]:
+    # With `stop_after_code` set to a language, the upstream stream is closed
+    # as soon as that language's code block has been fully received.
+    # `action` and `complexity` only label the call's telemetry; `stats`, if
+    # given, receives the call's trace (latency, TTFT, tokens, cache outcome).
+    # Setting `cancel` raises CancelledError even while the call is still
+    # queued or waiting for its first token
+    trace = CallTrace(action, complexity, request["model"])
+    try:
+        yield from _open_completion(
+            client, request, use_cache, priority, session_id, on_idle, stop_after_code, trace, cancel
+        )
+    except (GeneratorExit, CancelledError):
+        trace.outcome = "cancelled"
+        raise
+    except BaseException:
+        trace.outcome = "error"
+        raise
+    finally:
+        trace.latency = time.monotonic() - trace.started
+        if stats is not None:
+            stats.update(trace.as_dict())
+        if trace.done():
+            get_metrics().record_call(trace)
+
+def _open_completion(
+    client: Groq,
+    request: dict,
+    use_cache: bool,
+    priority: int,
+    session_id: str,
+    on_idle: Optional[Callable[[dict], None]],
+    stop_after_code: Optional[str],
+    trace: CallTrace,
+    cancel: Optional[threading.Event] = None
+) -> Iterator[str]:
+    cache = get_response_cache()
+    key = request_cache_key(request)
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            trace.cache = "hit"
+            yield cached
+            return
+    # Until this call turns out to start the upstream request itself
+    trace.cache = "coalesced"
+    
+    # Upstream is always streamed so the router can measure time-to-first-token
+    # and hedge; non-streaming callers simply don't render the partial text
+    router = get_model_router()
+    scheduler = get_scheduler()
+    
+    # `cancelled` is set by the coalescer once every caller has gone
+    def produce(status: dict, cancelled: threading.Event) -> Iterator[str]:
+        def upstream(segment: dict) -> Iterator[str]:
+            prompt_tokens = estimate_tokens("".join(message["content"] for message in segment["messages"]))
+            
+            def start(model: str, cancelled: threading.Event) -> Tuple[float, Iterator[str]]:
+                ticket = scheduler.acquire(
+                    model,
+                    session_id,
+                    priority,
+                    prompt_tokens,
+                    on_position=lambda position: status.update(model=model, queue_position=position),
+                    cancelled=cancelled,
+                    max_tokens=segment.get("max_tokens")
+                )
+                status["queue_position"] = None
+                return ticket.granted, iter_stream_deltas(client, {**segment, "model": model}, scheduler, ticket, trace)
+            
+            return router.stream(segment["model"], start, cancelled=cancelled)
+        
+        extractor = CodeBlockExtractor(stop_after_code) if stop_after_code else None
+        parts = []
+        code_closed = False
+        continuations = 0
+        try:
+            deltas = upstream(request)
+            while True:
+                trace.finish_reason = None
+                with closing(deltas):
+                    for delta in deltas:
+                        parts.append(delta)
+                        yield delta
+                        if extractor and extractor.feed(delta):
+                            code_closed = True
+                            break
+                # Hit max_tokens before the answer (or its code block) was complete: ask for the rest
+                if code_closed or trace.finish_reason != "length" or continuations >= MAX_CONTINUATIONS:
+                    break
+                continuations += 1
+                partial = "".join(parts)
+                deltas = trim_continuation(
+                    partial,
+                    upstream(build_continuation_request(request, partial, trace.model or request["model"]))
+                )
+        except (GeneratorExit, CancelledError):
+            trace.outcome = "cancelled"
+            raise
+        except BaseException:
+            trace.outcome = "error"
+            raise
+        finally:
+            if trace.done():
+                get_metrics().record_call(trace)
+        # Written once by the shared producer; a fresh sample still
+        # refreshes the cache for the next caller
+        content = "".join(parts)
+        if content:
+            cache.set(key, content)
+            kind = BUDGET_KINDS.get(trace.action)
+            if kind:
+                # Usage never arrives for a stream closed after its code block
+                tokens = trace.completion_tokens if trace.completion_tokens and not code_closed else None
+                get_output_budget().observe(
+                    kind, trace.complexity, tokens or estimate_tokens(content), truncated=continuations > 0
+                )
+    
+    def lead() -> None:
+        trace.cache = "miss" if use_cache else "bypass"
+        trace.lead()
+    
+    yield from get_request_coalescer().subscribe(key, produce, on_idle=on_idle, on_lead=lead, cancelled=cancel)
+
+# Prompt Builders
+def build_code_request(
+    query: str,
+    language: str,
+    model: str,
+    complexity: str,
+    keywords: Optional[list] = None,
+    style: Optional[str] = None
+) -> dict:
+    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
+    
+    prompt = f"""
+    {complexity_config['description']} in {language}:
+    {query}
+    
+    Requirements:
+    - Use {language} best practices
+    - Include appropriate comments
+    - Follow clean code principles
+    """
+    
+    if keywords:
+        prompt += f"\nKeywords to consider: {', '.join(keywords)}"
+    if style:
+        prompt += f"\nCoding style: {style}"
+    
+    if complexity == "Expert":
+        prompt += """
+        Additional requirements:
+        - Include performance benchmarks if applicable
+        - Add scalability considerations
+        - Document trade-offs and alternatives
+        - Include unit tests
+        """
+    
+    prompt += """
+    IMPORTANT: Return ONLY the raw executable code with comments, 
+    without any additional explanation before or after the code block.
+    """
+    
+    return dict(
+        model=model,
+        messages=[{
+            "role": "user",
+            "content": prompt
+        }],
+        temperature=complexity_config['temperature'],
+        max_tokens=get_output_budget().max_tokens("code", complexity, complexity_config["max_tokens"]),
+        top_p=0.95
+    )
+
+def build_explanation_request(code: str, language: str, complexity: str) -> dict:
+    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
+    
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"""
+            Explain this {language} code in {complexity.lower()} terms:
+            {code}
+            
+            Structure your explanation:
+            1. Overview of what the code does
+            2. Key components/functions
+            3. Flow of execution
+            4. {complexity_config['description']} considerations
+            """
+        }],
+        temperature=0.3,
+        max_tokens=get_output_budget().max_tokens(
+            "explanation", complexity, complexity_config["explanation_tokens"]
+        )
+    )
+
+def build_optimization_request(code: str, language: str) -> dict:
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"""
+            Optimize this {language} code for performance and readability:
+            {code}
+            
+            Return:
+            1. Optimized code with comments explaining changes
+            2. Performance benchmarks if applicable
+            3. Memory usage considerations
+            
+            IMPORTANT: Return ONLY the raw executable code with comments, 
+            without any additional explanation before or after the code block.
+            """
+        }],
+        temperature=0.5,
+        # The optimized code is about as long as the input, plus comments
+        max_tokens=min(2 * estimate_tokens(code) + 512, MAX_OUTPUT_TOKENS)
+    )
+
+# Diff-based optimization: the model sends edits rather than the whole file,
+# so the answer grows with the change instead of the input (see patching.py)
+def build_patch_optimization_request(code: str, language: str) -> dict:
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            # Dedent before the code goes in, or its first line would be indented
+            # and SEARCH blocks copying it would never match
+            "content": textwrap.dedent(f"""
+            Optimize this {language} code for performance and readability.
+            
+            Reply ONLY with edits in this exact format, one block per change:
+            
+            <<<<<<< SEARCH
+            lines copied exactly from the code
+            =======
+            the lines that replace them
+            >>>>>>> REPLACE
+            
+            Rules:
+            - SEARCH must match the code exactly, including indentation
+            - Keep each block small: the lines that change plus enough context to be unique
+            - Give the blocks in the order they appear in the code
+            - To add code (e.g. an import), replace a nearby line with itself plus the new lines
+            - Comment the changed lines to explain each optimization
+            - If nothing is worth changing, reply with {NO_CHANGES}
+            
+            Code:
+            ```{language.lower()}
+            """) + f"{code}\n```\n"
+        }],
+        temperature=0.5,
+        # Edits are usually a fraction of the file; this only bounds a near-total rewrite
+        max_tokens=min(estimate_tokens(code) + 512, MAX_OUTPUT_TOKENS)
+    )
+
+class Optimization:
+    """Optimized code and how it was produced, as the Optimized tab reports it.
+
+    Code from applied edits has ``edits`` set, with the size of the edit
+    response and of the file it spared rewriting; a full rewrite has
+    ``fallback`` set to why the edits were skipped, if they were tried.
+    """
+
+    def __init__(
+        self,
+        code: str,
+        edits: Optional[int] = None,
+        output_tokens: Optional[int] = None,
+        file_tokens: Optional[int] = None,
+        fallback: Optional[str] = None
+    ):
+        self.code = code
+        self.edits = edits
+        self.output_tokens = output_tokens
+        self.file_tokens = file_tokens
+        self.fallback = fallback
+    
+    def __bool__(self) -> bool:
+        return bool(self.code)
+    
+    def summary(self) -> dict:
+        # Session-state form, keyed by the digest of the code it describes
+        if self.edits is not None:
+            return {
+                "digest": text_digest(self.code),
+                "edits": self.edits,
+                "output_tokens": self.output_tokens,
+                "file_tokens": self.file_tokens
+            }
+        return {"digest": text_digest(self.code), "fallback": self.fallback}
+
+def apply_patch_response(code: str, response: str, language: str) -> Tuple[str, int]:
+    # Returns the edited code and the number of edits; raises PatchError when
+    # the edits don't apply or break code that was valid before
+    hunks = parse_hunks(response)
+    if not hunks:
+        if NO_CHANGES in response.upper():
+            return code, 0
+        raise PatchError("the response has no edits")
+    patched = apply_hunks(code, hunks)
+    if validate_code(code, language) is None:
+        error = validate_code(patched, language)
+        if error:
+            raise PatchError(f"the edited code doesn't validate ({error})")
+    return patched, len(hunks)
+
+def optimize_by_patch(
+    client: Groq,
+    code: str,
+    language: str,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    session_id: str = "",
+    parts: Optional[list] = None,
+    cancel: Optional[threading.Event] = None,
+    stats: Optional[dict] = None
+) -> Optimization:
+    content = complete(
+        client,
+        build_patch_optimization_request(code, language),
+        use_cache=use_cache,
+        priority=priority,
+        session_id=session_id,
+        parts=parts,
+        cancel=cancel,
+        action="optimize_patch",
+        stats=stats
+    )
+    optimized, edits = apply_patch_response(code, content, language)
+    return Optimization(optimized, edits, estimate_tokens(content), estimate_tokens(code))
+
+# Collect a Completion
+def complete(
+    client: Groq,
+    request: dict,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    session_id: str = "",
+    parts: Optional[list] = None,
+    cancel: Optional[threading.Event] = None,
+    stop_after_code: Optional[str] = None,
+    action: str = "completion",
+    complexity: Optional[str] = None,
+    stats: Optional[dict] = None,
+    on_idle: Optional[Callable[[dict], None]] = None
+) -> str:
+    # Partial text is appended to `parts` as it arrives so another thread can
+    # watch progress; setting `cancel` abandons the call. `on_idle` gets the
+    # call's queue status while it waits (see open_completion)
+    parts = [] if parts is None else parts
+    deltas = open_completion(
+        client,
+        request,
+        use_cache=use_cache,
+        priority=priority,
+        session_id=session_id,
+        on_idle=on_idle,
+        stop_after_code=stop_after_code,
+        action=action,
+        complexity=complexity,
+        stats=stats,
+        cancel=cancel
+    )
+    with closing(deltas):
+        for delta in deltas:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            parts.append(delta)
+    return "".join(parts)
+
+# Map-Reduce over Large Inputs (chunks come from chunking.plan_chunks)
+def build_chunk_explanation_request(chunk: CodeChunk, chunks: List[CodeChunk], language: str, complexity: str) -> dict:
+    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
+    
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"""
+            This is part {chunk.index + 1} of {len(chunks)} (lines {chunk.start}-{chunk.end}) of a larger {language} file.
+            Outline of the whole file:
+            {outline(chunks)}
+            
+            Explain this part in {complexity.lower()} terms:
+            {chunk.code}
+            
+            Cover what it does, its key components and how it fits into the rest of the file.
+            Do not write an introduction or a summary of the whole file.
+            """
+        }],
+        temperature=0.3,
+        max_tokens=complexity_config["explanation_tokens"]
+    )
+
+def build_explanation_summary_request(
+    chunks: List[CodeChunk],
+    sections: List[str],
+    language: str,
+    complexity: str
+) -> dict:
+    complexity_config = COMPLEXITY_LEVELS.get(complexity, COMPLEXITY_LEVELS["Medium"])
+    parts = "\n\n".join(
+        f"Part {chunk.index + 1} (lines {chunk.start}-{chunk.end}):\n{section.strip()}"
+        for chunk, section in zip(chunks, sections)
+    )
+    
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"""
+            These are explanations of the consecutive parts of one {language} file:
+            {parts}
+            
+            Write the introduction to the file's explanation, in {complexity.lower()} terms:
+            1. Overview of what the code does
+            2. Flow of execution across the parts
+            3. {complexity_config['description']} considerations
+            
+            Do not repeat the per-part explanations.
+            """
+        }],
+        temperature=0.3,
+        max_tokens=complexity_config["explanation_tokens"]
+    )
+
+def build_chunk_optimization_request(chunk: CodeChunk, chunks: List[CodeChunk], language: str) -> dict:
+    return dict(
+        model=PRIMARY_MODEL,
+        messages=[{
+            "role": "user",
+            "content": f"""
+            This is part {chunk.index + 1} of {len(chunks)} (lines {chunk.start}-{chunk.end}) of a larger {language} file.
+            Outline of the whole file:
+            {outline(chunks)}
+            
+            Optimize this part for performance and readability:
+            {chunk.code}
+            
+            Keep every name, signature and import the rest of the file relies on.
+            IMPORTANT: Return ONLY this part as raw executable code with comments explaining changes,
+            without any additional explanation before or after the code block.
+            """
+        }],
+        temperature=0.5,
+        max_tokens=min(2 * estimate_tokens(chunk.code) + 512, MAX_OUTPUT_TOKENS)
+    )
+
+def map_chunks(
+    client: Groq,
+    requests: List[dict],
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    session_id: str = "",
+    cancel: Optional[threading.Event] = None,
+    stop_after_code: Optional[str] = None,
+    action: str = "completion",
+    complexity: Optional[str] = None,
+    on_progress: Optional[Callable[[List[str]], None]] = None,
+    on_idle: Optional[Callable[[dict], None]] = None
+) -> List[str]:
+    # Runs the requests concurrently; `on_progress` is called in this thread
+    # with every chunk's text so far, so the caller may render from it, and
+    # `on_idle` on the chunks' threads with the status of a waiting chunk
+    parts = [[] for _ in requests]
+    stop = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=CHUNK_WORKERS, thread_name_prefix="chunk")
+    futures = [
+        executor.submit(
+            complete,
+            client,
+            request,
+            use_cache=use_cache,
+            priority=priority,
+            session_id=session_id,
+            parts=chunk_parts,
+            cancel=stop,
+            stop_after_code=stop_after_code,
+            action=action,
+            complexity=complexity,
+            on_idle=on_idle
+        )
+        for request, chunk_parts in zip(requests, parts)
+    ]
+    try:
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CHUNK_PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            for future in done:
+                # Fail fast: one broken chunk spoils the merged result
+                future.result()
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            if on_progress:
+                on_progress(["".join(chunk_parts) for chunk_parts in parts])
+        return [future.result() for future in futures]
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def explain_chunked(
+    client: Groq,
+    chunks: List[CodeChunk],
+    language: str,
+    complexity: str,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BACKGROUND,
+    session_id: str = "",
+    cancel: Optional[threading.Event] = None,
+    on_progress: Optional[Callable[[str], None]] = None,
+    on_idle: Optional[Callable[[dict], None]] = None
+) -> str:
+    """Explain each chunk concurrently, then write a short overview of the whole from the part explanations.
+
+    The result is the overview followed by one section per part. Only the
+    overview request sees every part, and it gets their explanations rather
+    than the code, so latency follows the largest chunk, not the file.
+    """
+    def document(overview: str, sections: List[str]) -> str:
+        body = "\n\n".join(
+            f"### Part {chunk.index + 1}: `{chunk.title}` (lines {chunk.start}-{chunk.end})\n\n"
+            f"{section.strip() or '_Explaining..._'}"
+            for chunk, section in zip(chunks, sections)
+        )
+        return f"{overview.strip()}\n\n{body}" if overview.strip() else body
+    
+    sections = map_chunks(
+        client,
+        [build_chunk_explanation_request(chunk, chunks, language, complexity) for chunk in chunks],
+        use_cache=use_cache,
+        priority=priority,
+        session_id=session_id,
+        cancel=cancel,
+        action="explain_part",
+        complexity=complexity,
+        on_progress=(lambda texts: on_progress(document("", texts))) if on_progress else None,
+        on_idle=on_idle
+    )
+    
+    overview = []
+    last_progress = 0.0
+    deltas = open_completion(
+        client,
+        build_explanation_summary_request(chunks, sections, language, complexity),
+        use_cache=use_cache,
+        priority=priority,
+        session_id=session_id,
+        on_idle=on_idle,
+        action="explain_summary",
+        complexity=complexity,
+        cancel=cancel
+    )
+    with closing(deltas):
+        for delta in deltas:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError()
+            overview.append(delta)
+            now = time.monotonic()
+            if on_progress and now - last_progress >= CHUNK_PROGRESS_INTERVAL:
+                last_progress = now
+                on_progress(document("".join(overview), sections))
+    return document("".join(overview), sections)
+
+def optimize_chunked(
+    client: Groq,
+    chunks: List[CodeChunk],
+    language: str,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    session_id: str = "",
+    cancel: Optional[threading.Event] = None,
+    on_progress: Optional[Callable[[str], None]] = None,
+    on_idle: Optional[Callable[[dict], None]] = None
+) -> str:
+    """Optimize each chunk concurrently and join the optimized parts in order (the merge needs no model call).
+
+    Returns code, not markdown; a part that came back empty keeps its original code.
+    """
+    def document(texts: List[str], final: bool = False) -> str:
+        merged = []
+        for chunk, text in zip(chunks, texts):
+            code = extract_code_block(text, language) if text else ""
+            merged.append(code or (chunk.code.strip() if final else ""))
+        return "\n\n".join(code for code in merged if code)
+    
+    texts = map_chunks(
+        client,
+        [build_chunk_optimization_request(chunk, chunks, language) for chunk in chunks],
+        use_cache=use_cache,
+        priority=priority,
+        session_id=session_id,
+        cancel=cancel,
+        stop_after_code=language,
+        action="optimize_part",
+        on_progress=(lambda texts: on_progress(document(texts))) if on_progress else None,
+        on_idle=on_idle
+    )
+    return document(texts, final=True)
+
+# Best-of-N Candidates (concurrent samples of one code request, validated as they stream)
+def candidate_temperatures(temperature: float, count: int) -> List[float]:
+    # The first sample keeps the level's own temperature (and so shares its
+    # cache entry); the rest alternate below and above it
+    low, high = CANDIDATE_TEMPERATURE_RANGE
+    temperatures = [temperature]
+    step = 1
+    while len(temperatures) < count and step <= 2 * count:
+        for offset in (-step, step):
+            value = round(min(max(temperature + offset * CANDIDATE_TEMPERATURE_STEP, low), high), 2)
+            if value not in temperatures and len(temperatures) < count:
+                temperatures.append(value)
+        step += 1
+    return temperatures
+
+class Candidate:
+    """One sample: ``status`` goes from "streaming" to "valid", "invalid", "error" or "cancelled"."""
+    
+    def __init__(self, index: int, request: dict):
+        self.index = index
+        self.request = request
+        self.status = "streaming"
+        self.code = ""
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+    
+    @property
+    def temperature(self) -> float:
+        return self.request["temperature"]
+
+class CandidateSet:
+    """N samples of a code request generated concurrently, each checked as it streams.
+    
+    Every sample runs on its own thread through the usual completion stack.
+    Complete lines are lexed as they arrive, and a sample with a structural
+    error is cancelled straight away. A sample that finishes is validated in
+    full (see ``validation.py``). ``first_valid`` returns as soon as any
+    sample passes; the others keep going, and the valid ones can be picked
+    up later with ``next_valid`` as alternatives.
+    """
+    
+    def __init__(
+        self,
+        client: Groq,
+        request: dict,
+        language: str,
+        count: int,
+        use_cache: bool = True,
+        priority: int = PRIORITY_NORMAL,
+        session_id: str = "",
+        complexity: Optional[str] = None,
+        action: str = "generate"
+    ):
+        self.language = language
+        self.started = time.monotonic()
+        self.candidates = [
+            Candidate(index, {**request, "temperature": temperature})
+            for index, temperature in enumerate(candidate_temperatures(request["temperature"], count))
+        ]
+        self._changed = threading.Condition()
+        self._cancel = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.candidates), thread_name_prefix="candidate")
+        for candidate in self.candidates:
+            self._executor.submit(
+                self._run, candidate, client, use_cache, priority, session_id, complexity, action
+            )
+        self._executor.shutdown(wait=False)
+    
+    def _run(
+        self,
+        candidate: Candidate,
+        client: Groq,
+        use_cache: bool,
+        priority: int,
+        session_id: str,
+        complexity: Optional[str],
+        action: str
+    ) -> None:
+        parts = []
+        status, error = "valid", None
+        try:
+            deltas = open_completion(
+                client,
+                candidate.request,
+                use_cache=use_cache,
+                priority=priority,
+                session_id=session_id,
+                stop_after_code=self.language,
+                action=action,
+                complexity=complexity,
+                cancel=self._cancel
+            )
+            last_check = time.monotonic()
+            with closing(deltas):
+                for delta in deltas:
+                    if self._cancel.is_set():
+                        status = "cancelled"
+                        break
+                    parts.append(delta)
+                    candidate.code = extract_code_block("".join(parts), self.language)
+                    now = time.monotonic()
+                    if now - last_check >= CANDIDATE_CHECK_INTERVAL:
+                        last_check = now
+                        error = check_tokens(candidate.code, self.language, final=False)
+                        if error:
+                            status = "invalid"
+                            break
+            if status == "valid":
+                raw = "".join(parts)
+                candidate.code = extract_code_block(raw, self.language)
+                error = validate_code(candidate.code, self.language, raw)
+                status = "invalid" if error else "valid"
+        except CancelledError:
+            status = "cancelled"
+        except Exception as e:
+            status, error = "error", str(e)
+        with self._changed:
+            candidate.status = status
+            candidate.error = error
+            candidate.seconds = time.monotonic() - self.started
+            self._changed.notify_all()
+    
+    @property
+    def done(self) -> bool:
+        return all(candidate.status != "streaming" for candidate in self.candidates)
+    
+    def valid(self) -> List[Candidate]:
+        # In the order they passed
+        finished = [candidate for candidate in self.candidates if candidate.status == "valid"]
+        return sorted(finished, key=lambda candidate: candidate.seconds)
+    
+    def next_valid(
+        self,
+        exclude: Iterable[int] = (),
+        on_progress: Optional[Callable[["CandidateSet"], None]] = None
+    ) -> Optional[Candidate]:
+        """The earliest valid sample not in ``exclude``, waiting while any is still streaming.
+        
+        ``on_progress`` is called in this thread every ``CHUNK_PROGRESS_INTERVAL``
+        seconds while waiting, so the caller may render the samples so far.
+        """
+        exclude = set(exclude)
+        while True:
+            with self._changed:
+                for candidate in self.valid():
+                    if candidate.index not in exclude:
+                        return candidate
+                if self.done:
+                    return None
+                self._changed.wait(CHUNK_PROGRESS_INTERVAL)
+            if on_progress:
+                on_progress(self)
+    
+    def first_valid(self, on_progress: Optional[Callable[["CandidateSet"], None]] = None) -> Optional[Candidate]:
+        return self.next_valid(on_progress=on_progress)
+    
+    def fallback(self) -> Optional[Candidate]:
+        # When no sample passed: the longest answer that got as far as being checked
+        checked = [candidate for candidate in self.candidates if candidate.status == "invalid" and candidate.code]
+        return max(checked, key=lambda candidate: len(candidate.code), default=None)
+    
+    def cancel(self) -> None:
+        """Stop every sample still streaming (their upstream calls end once nobody else shares them)."""
+        self._cancel.set()
+
+# Speculative Prefetch (the requests the app's buttons would make, run ahead of the click)
+def build_prefetch_jobs(
+    client: Groq,
+    query: str,
+    code: str,
+    language: str,
+    complexity: str,
+    keywords: Optional[list],
+    style: Optional[str],
+    actions: List[str],
+    use_cache: bool = True,
+    session_id: str = ""
+) -> List[PrefetchJob]:
+    # Large inputs take the map-reduce path instead; they aren't prefetched
+    if plan_chunks(code, language):
+        return []
+    requests = {
+        # action: (request, code block to stop after, complexity label)
+        "explain": (build_explanation_request(code, language, complexity), None, complexity),
+        "optimize": (build_optimization_request(code, language), language, None),
+        "alternative": (
+            build_code_request(
+                f"Alternative approach for: {query}", language, PRIMARY_MODEL, complexity, keywords, style
+            ),
+            language,
+            complexity
+        )
+    }
+    jobs = []
+    for action in actions:
+        request, stop_after_code, label = requests[action]
+        
+        def run(parts: list, cancel: threading.Event, stats: dict, action=action, request=request,
+                stop_after_code=stop_after_code, label=label) -> Union[str, Optimization]:
+            # "optimize" returns an Optimization, like the Optimize button's optimize_code
+            fallback = None
+            if action == "optimize" and uses_patches(code):
+                # Same order as the Optimize button, so a click joins whichever request is running
+                try:
+                    return optimize_by_patch(
+                        client, code, language, use_cache, PRIORITY_PREFETCH, session_id, parts, cancel, stats
+                    )
+                except PatchError as e:
+                    fallback = str(e)
+            content = complete(
+                client,
+                request,
+                use_cache=use_cache,
+                priority=PRIORITY_PREFETCH,
+                session_id=session_id,
+                parts=parts,
+                cancel=cancel,
+                stop_after_code=stop_after_code,
+                action=action,
+                complexity=label,
+                stats=stats
+            )
+            if action == "optimize":
+                return Optimization(extract_code_block(content, language), fallback=fallback)
+            return extract_code_block(content, language) if stop_after_code else content
+        
+        jobs.append((action, request["max_tokens"], run))
+    return jobs
+
+# Semantic Reuse of Similar Generations
+def similarity_facets(language: str, complexity: str, keywords: Optional[list], style: Optional[str]) -> tuple:
+    tags = ",".join(sorted(keyword.lower() for keyword in keywords or []))
+    return (language, complexity, style or "", tags)
+
+def remember_generation(
+    query: str,
+    language: str,
+    complexity: str,
+    keywords: Optional[list],
+    style: Optional[str],
+    request: dict
+) -> None:
+    facets = similarity_facets(language, complexity, keywords, style)
+    get_semantic_index().add(facets, query, request_cache_key(request))
+
+def find_similar_generation(
+    query: str,
+    language: str,
+    complexity: str,
+    keywords: Optional[list] = None,
+    style: Optional[str] = None
+) -> Optional[Tuple[str, SimilarMatch]]:
+    # Returns the extracted code of a cached answer to a similar query, if any
+    index = get_semantic_index()
+    match = index.lookup(similarity_facets(language, complexity, keywords, style), query)
+    if match is None:
+        return None
+    content = get_response_cache().get(match.key)
+    if content is None:
+        # The exact answer has expired or been evicted
+        index.discard(match.key)
+        return None
+    return extract_code_block(content, language), match
+
+# Python API
+def generate(
+    query: str,
+    language: str,
+    complexity: str = "Medium",
+    keywords: Optional[list] = None,
+    style: Optional[str] = None,
+    model: str = PRIMARY_MODEL,
+    client: Optional[Groq] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL,
+    reuse_similar: bool = False,
+    candidates: int = 1
+) -> str:
+    if use_cache and reuse_similar:
+        similar = find_similar_generation(query, language, complexity, keywords, style)
+        if similar is not None:
+            return similar[0]
+    request = build_code_request(query, language, model, complexity, keywords, style)
+    if candidates > 1:
+        # Best of N: the first sample that validates wins and the rest are cancelled
+        candidate_set = CandidateSet(
+            client or get_client(),
+            request,
+            language,
+            candidates,
+            use_cache=use_cache,
+            priority=priority,
+            complexity=complexity
+        )
+        winner = candidate_set.first_valid()
+        candidate_set.cancel()
+        winner = winner or candidate_set.fallback()
+        if winner is None:
+            reasons = "; ".join(sorted({candidate.error for candidate in candidate_set.candidates if candidate.error}))
+            raise RuntimeError(f"None of the {candidates} samples produced code: {reasons}")
+        remember_generation(query, language, complexity, keywords, style, winner.request)
+        return winner.code
+    content = complete(
+        client or get_client(),
+        request,
+        use_cache=use_cache,
+        priority=priority,
+        stop_after_code=language,
+        action="generate",
+        complexity=complexity
+    )
+    remember_generation(query, language, complexity, keywords, style, request)
+    return extract_code_block(content, language)
+
+def explain(
+    code: str,
+    language: str,
+    complexity: str = "Medium",
+    client: Optional[Groq] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_BACKGROUND
+) -> str:
+    chunks = plan_chunks(code, language)
+    if chunks:
+        return explain_chunked(
+            client or get_client(), chunks, language, complexity, use_cache=use_cache, priority=priority
+        )
+    request = build_explanation_request(code, language, complexity)
+    return complete(
+        client or get_client(), request, use_cache=use_cache, priority=priority, action="explain", complexity=complexity
+    )
+
+def optimize(
+    code: str,
+    language: str,
+    client: Optional[Groq] = None,
+    use_cache: bool = True,
+    priority: int = PRIORITY_NORMAL
+) -> str:
+    if uses_patches(code):
+        try:
+            return optimize_by_patch(client or get_client(), code, language, use_cache=use_cache, priority=priority).code
+        except PatchError:
+            # Fall back to rewriting the whole file
+            pass
+    chunks = plan_chunks(code, language)
+    if chunks:
+        return optimize_chunked(client or get_client(), chunks, language, use_cache=use_cache, priority=priority)
+    request = build_optimization_request(code, language)
+    content = complete(
+        client or get_client(),
+        request,
+        use_cache=use_cache,
+        priority=priority,
+        stop_after_code=language,
+        action="optimize"
+    )
+    return extract_code_block(content, language)
@@ -0,0 +1,95 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional
+
+from pygments import highlight
+from pygments.formatters import HtmlFormatter
+from pygments.lexer import Lexer
+from pygments.lexers import TextLexer, get_lexer_by_name
+from pygments.util import ClassNotFound
+
+from codeblock import language_tags
+
+# Highlighting Configuration
+HIGHLIGHT_CACHE_ENTRIES = int(os.getenv("ASTRACODE_HIGHLIGHT_CACHE_ENTRIES", 512))
+HIGHLIGHT_VIEWPORT_LINES = 60  # lines shown while a large block is still being highlighted
+HIGHLIGHT_CSS_CLASS = "astra-highlight"
+
+
+@lru_cache(maxsize=None)
+def get_lexer(language: str) -> Lexer:
+    for tag in [language.lower()] + sorted(language_tags(language)):
+        try:
+            return get_lexer_by_name(tag, stripnl=False, ensurenl=False)
+        except ClassNotFound:
+            continue
+    return TextLexer()
+
+
+def style_definitions(style: str) -> str:
+    """CSS for one Pygments style, scoped to highlighted code blocks."""
+    formatter = HtmlFormatter(style=style)
+    selector = f".{HIGHLIGHT_CSS_CLASS}"
+    # Skips the unscoped ``pre`` / line-number rules get_style_defs() adds
+    return "\n".join(formatter.get_background_style_defs(selector) + formatter.get_token_style_defs(selector))
+
+
+class Highlighter:
+    """Pygments code-to-HTML rendering memoized in a bounded LRU.
+
+    Output only carries token classes; colors come from the active theme's
+    stylesheet, so one rendering serves every theme and entries are keyed
+    by content hash and language alone. Identical code (cached LLM
+    responses repeat a lot) is highlighted once per process.
+    """
+
+    def __init__(self, max_entries: int = HIGHLIGHT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(code: str, language: str) -> tuple:
+        return (hashlib.sha256(code.encode("utf-8")).hexdigest(), language)
+
+    def cached(self, code: str, language: str) -> Optional[str]:
+        key = self.make_key(code, language)
+        with self._lock:
+            html = self._entries.get(key)
+            if html is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return html
+
+    def highlight(self, code: str, language: str) -> str:
+        html = self.cached(code, language)
+        if html is not None:
+            return html
+        html = self.render(code, language)
+        with self._lock:
+            self.misses += 1
+            self._entries[self.make_key(code, language)] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    @staticmethod
+    def render(code: str, language: str) -> str:
+        return highlight(code, get_lexer(language), HtmlFormatter(cssclass=HIGHLIGHT_CSS_CLASS, wrapcode=True))
+
+    def render_head(self, code: str, language: str, lines: int = HIGHLIGHT_VIEWPORT_LINES) -> Optional[str]:
+        """Uncached rendering of the first ``lines`` lines, or None if the code is that short.
+
+        Lexing from the top of a cut-off block can only mis-color its last
+        lines, and the full rendering replaces it moments later.
+        """
+        head = code.split("\n", lines)
+        if len(head) <= lines:
+            return None
+        return self.render("\n".join(head[:lines]), language)
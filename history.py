@@ -0,0 +1,320 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from cache import CACHE_PATH, CACHE_TTL
+
+# History Configuration
+HISTORY_ENTRIES = int(os.getenv("ASTRACODE_HISTORY_ENTRIES", 20))  # generations kept per session
+HISTORY_IDLE_SECONDS = float(os.getenv("ASTRACODE_HISTORY_IDLE", 900))
+HISTORY_MEMORY_LIMIT = int(float(os.getenv("ASTRACODE_HISTORY_MEMORY_MB", 64)) * 2 ** 20)
+HISTORY_DISK_MAX_SESSIONS = 5000
+HISTORY_SWEEP_INTERVAL = 60.0  # seconds between idle sweeps
+HISTORY_COMPRESSION_LEVEL = 6
+
+
+def text_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class HistoryEntry:
+    """One generation: what was asked, with which settings, and the digests of its results."""
+
+    __slots__ = ("entry_id", "created", "query", "settings", "results", "similar_match", "archive_key")
+
+    def __init__(
+        self,
+        entry_id: int,
+        created: float,
+        query: str,
+        settings: dict,
+        results: Optional[Dict[str, str]] = None,
+        similar_match: Optional[dict] = None,
+        archive_key: Optional[str] = None
+    ):
+        self.entry_id = entry_id
+        self.created = created
+        self.query = query
+        self.settings = settings
+        self.results = results or {}
+        self.similar_match = similar_match
+        self.archive_key = archive_key
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "HistoryEntry":
+        return cls(**data)
+
+
+class _Session:
+    __slots__ = ("entries", "next_id", "accessed")
+
+    def __init__(self, entries: Optional[List[HistoryEntry]] = None, next_id: int = 0):
+        self.entries = entries or []  # oldest first
+        self.next_id = next_id
+        self.accessed = time.monotonic()
+
+
+class HistoryStore:
+    """Bounded per-session result history over shared, compressed blobs.
+
+    Each session keeps its last ``max_entries`` generations. Result texts
+    are zlib-compressed and stored once per content digest, reference-counted
+    across sessions (cached responses repeat a lot), so a session itself
+    only holds digests. Sessions idle for ``idle_seconds`` are spilled to
+    SQLite and loaded back on their next ``touch``; when the blobs in memory
+    exceed ``memory_limit`` bytes, the least recently used sessions are
+    spilled early. Without a database path spilled history is dropped.
+    All methods are thread-safe.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        max_entries: int = HISTORY_ENTRIES,
+        idle_seconds: float = HISTORY_IDLE_SECONDS,
+        memory_limit: int = HISTORY_MEMORY_LIMIT,
+        ttl: float = CACHE_TTL
+    ):
+        self.max_entries = max_entries
+        self.idle_seconds = idle_seconds
+        self.memory_limit = memory_limit
+        self.ttl = ttl
+        self.memory_bytes = 0
+        self.spilled = 0
+        self.restored = 0
+        self._blobs: Dict[str, list] = {}  # digest -> [compressed text, reference count]
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS history_sessions (
+                    session_id TEXT PRIMARY KEY,
+                    entries TEXT NOT NULL,
+                    next_id INTEGER NOT NULL,
+                    spilled REAL NOT NULL
+                )
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS history_refs (
+                    session_id TEXT NOT NULL,
+                    digest TEXT NOT NULL,
+                    PRIMARY KEY (session_id, digest)
+                )
+            """)
+            self._db.execute("CREATE INDEX IF NOT EXISTS history_refs_digest ON history_refs (digest)")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS history_blobs (
+                    digest TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                )
+            """)
+            self._db.commit()
+            self._purge_disk()
+
+    def touch(self, session_id: str) -> None:
+        """Mark a session active, loading its history back if it was spilled."""
+        with self._lock:
+            session = self._session(session_id)
+            session.accessed = time.monotonic()
+            self._maybe_sweep()
+
+    def add(
+        self,
+        session_id: str,
+        query: str,
+        settings: dict,
+        similar_match: Optional[dict] = None,
+        archive_key: Optional[str] = None
+    ) -> int:
+        """Start a new entry for a generation and return its id; the oldest entry beyond the limit is dropped."""
+        with self._lock:
+            session = self._session(session_id)
+            entry = HistoryEntry(
+                session.next_id,
+                time.time(),
+                query,
+                dict(settings),
+                similar_match=similar_match,
+                archive_key=archive_key
+            )
+            session.next_id += 1
+            session.entries.append(entry)
+            while len(session.entries) > self.max_entries:
+                for digest in session.entries.pop(0).results.values():
+                    self._release(digest)
+            return entry.entry_id
+
+    def set_result(self, session_id: str, entry_id: int, name: str, text: Optional[str]) -> Optional[str]:
+        """Store (or with ``None`` clear) one result of an entry; returns its digest, or None if the entry is gone."""
+        compressed = zlib.compress(text.encode("utf-8"), HISTORY_COMPRESSION_LEVEL) if text else None
+        with self._lock:
+            entry = self._find(self._session(session_id), entry_id)
+            if entry is None:
+                return None
+            previous = entry.results.pop(name, None)
+            digest = None
+            if compressed is not None:
+                digest = text_digest(text)
+                self._retain(digest, compressed)
+                entry.results[name] = digest
+            if previous is not None:
+                self._release(previous)
+            self._enforce_limit(keep=session_id)
+            return digest
+
+    def entries(self, session_id: str) -> List[HistoryEntry]:
+        """A snapshot of the session's entries, newest first."""
+        with self._lock:
+            return [
+                HistoryEntry.from_dict({**entry.as_dict(), "results": dict(entry.results)})
+                for entry in reversed(self._session(session_id).entries)
+            ]
+
+    def text(self, digest: str) -> Optional[str]:
+        with self._lock:
+            blob = self._blobs.get(digest)
+            compressed = blob[0] if blob is not None else None
+            if compressed is None and self._db is not None:
+                # Only reachable if another thread spilled the owning session mid-run
+                row = self._db.execute("SELECT data FROM history_blobs WHERE digest = ?", (digest,)).fetchone()
+                compressed = row[0] if row else None
+        return zlib.decompress(compressed).decode("utf-8") if compressed is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "blobs": len(self._blobs),
+                "memory_bytes": self.memory_bytes,
+                "spilled": self.spilled,
+                "restored": self.restored
+            }
+
+    def sweep(self) -> None:
+        """Spill sessions idle for longer than ``idle_seconds``."""
+        with self._lock:
+            self._sweep()
+
+    def _session(self, session_id: str) -> _Session:
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._restore(session_id) or _Session()
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        return session
+
+    @staticmethod
+    def _find(session: _Session, entry_id: int) -> Optional[HistoryEntry]:
+        for entry in reversed(session.entries):
+            if entry.entry_id == entry_id:
+                return entry
+        return None
+
+    def _retain(self, digest: str, compressed: bytes) -> None:
+        blob = self._blobs.get(digest)
+        if blob is None:
+            self._blobs[digest] = [compressed, 1]
+            self.memory_bytes += len(compressed)
+        else:
+            blob[1] += 1
+
+    def _release(self, digest: str) -> None:
+        blob = self._blobs[digest]
+        blob[1] -= 1
+        if blob[1] == 0:
+            del self._blobs[digest]
+            self.memory_bytes -= len(blob[0])
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        if now - self._last_sweep >= HISTORY_SWEEP_INTERVAL:
+            self._last_sweep = now
+            self._sweep()
+
+    def _sweep(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        idle = [session_id for session_id, session in self._sessions.items() if session.accessed < cutoff]
+        for session_id in idle:
+            self._spill(session_id)
+        if idle and self._db is not None:
+            self._purge_disk()
+
+    def _enforce_limit(self, keep: str) -> None:
+        while self.memory_bytes > self.memory_limit and len(self._sessions) > 1:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                break
+            self._spill(session_id)
+
+    def _spill(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        digests = {digest for entry in session.entries for digest in entry.results.values()}
+        if self._db is not None and session.entries:
+            self._db.execute(
+                "INSERT OR REPLACE INTO history_sessions (session_id, entries, next_id, spilled) VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps([entry.as_dict() for entry in session.entries]), session.next_id, time.time())
+            )
+            self._db.execute("DELETE FROM history_refs WHERE session_id = ?", (session_id,))
+            self._db.executemany(
+                "INSERT INTO history_refs (session_id, digest) VALUES (?, ?)",
+                [(session_id, digest) for digest in digests]
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO history_blobs (digest, data) VALUES (?, ?)",
+                [(digest, self._blobs[digest][0]) for digest in digests]
+            )
+            self._db.commit()
+        for entry in session.entries:
+            for digest in entry.results.values():
+                self._release(digest)
+        self.spilled += 1
+
+    def _restore(self, session_id: str) -> Optional[_Session]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT entries, next_id FROM history_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        entries = [HistoryEntry.from_dict(data) for data in json.loads(row[0])]
+        blobs = dict(self._db.execute(
+            "SELECT b.digest, b.data FROM history_blobs b "
+            "JOIN history_refs r ON r.digest = b.digest WHERE r.session_id = ?",
+            (session_id,)
+        ).fetchall())
+        for entry in entries:
+            # A result whose blob went missing is dropped rather than shown empty
+            entry.results = {name: digest for name, digest in entry.results.items() if digest in blobs}
+            for digest in entry.results.values():
+                self._retain(digest, blobs[digest])
+        # The disk copy is gone now; the next spill writes it again
+        self._db.execute("DELETE FROM history_sessions WHERE session_id = ?", (session_id,))
+        self._db.execute("DELETE FROM history_refs WHERE session_id = ?", (session_id,))
+        self._db.commit()
+        self.restored += 1
+        return _Session(entries, row[1])
+
+    def _purge_disk(self) -> None:
+        self._db.execute(
+            "DELETE FROM history_sessions WHERE spilled < ? OR session_id NOT IN "
+            "(SELECT session_id FROM history_sessions ORDER BY spilled DESC LIMIT ?)",
+            (time.time() - self.ttl, HISTORY_DISK_MAX_SESSIONS)
+        )
+        self._db.execute("DELETE FROM history_refs WHERE session_id NOT IN (SELECT session_id FROM history_sessions)")
+        self._db.execute("DELETE FROM history_blobs WHERE digest NOT IN (SELECT digest FROM history_refs)")
+        self._db.commit()
@@ -0,0 +1,89 @@
+import os
+import re
+from typing import List, Optional, Tuple
+
+from ratelimit import estimate_tokens
+
+# Patch Configuration
+# Code of at least this many estimated tokens is optimized through edits instead of a full rewrite (-1 disables)
+PATCH_MIN_TOKENS = int(os.getenv("ASTRACODE_PATCH_MIN_TOKENS", 200))
+NO_CHANGES = "NO CHANGES"
+
+SEARCH_MARKER = re.compile(r"^\s*<{5,9}\s*SEARCH\s*$")
+DIVIDER_MARKER = re.compile(r"^\s*={5,9}\s*$")
+REPLACE_MARKER = re.compile(r"^\s*>{5,9}\s*REPLACE\s*$")
+
+
+class PatchError(Exception):
+    """A patch response that can't be applied: malformed, truncated or not matching the code."""
+
+
+class Hunk:
+    """Replace the ``search`` lines with the ``replace`` lines."""
+
+    def __init__(self, search: str, replace: str):
+        self.search = search
+        self.replace = replace
+
+
+def parse_hunks(text: str) -> List[Hunk]:
+    """SEARCH/REPLACE blocks in ``text``, in order; anything around them (prose, fences) is ignored."""
+    hunks: List[Hunk] = []
+    search: Optional[List[str]] = None
+    replace: Optional[List[str]] = None
+    for line in text.split("\n"):
+        if search is None:
+            if SEARCH_MARKER.match(line):
+                search = []
+        elif replace is None:
+            if DIVIDER_MARKER.match(line):
+                replace = []
+            else:
+                search.append(line)
+        elif REPLACE_MARKER.match(line):
+            hunks.append(Hunk("\n".join(search), "\n".join(replace)))
+            search = replace = None
+        else:
+            replace.append(line)
+    if search is not None:
+        raise PatchError("the last edit was cut off")
+    return hunks
+
+
+def _find(code: str, search: str, start: int) -> Optional[Tuple[int, int]]:
+    # Exact text first, then line by line ignoring trailing whitespace
+    position = code.find(search, start)
+    if position != -1:
+        return position, position + len(search)
+    wanted = [line.rstrip() for line in search.split("\n")]
+    offsets = [0] + [index + 1 for index, char in enumerate(code) if char == "\n"]
+    lines = code.split("\n")
+    for first in range(len(lines) - len(wanted) + 1):
+        if offsets[first] < start:
+            continue
+        if [line.rstrip() for line in lines[first:first + len(wanted)]] == wanted:
+            last = first + len(wanted) - 1
+            return offsets[first], offsets[last] + len(lines[last])
+    return None
+
+
+def apply_hunks(code: str, hunks: List[Hunk]) -> str:
+    """Apply ``hunks`` in turn, each to the result of the one before.
+
+    A hunk is looked for after the previous edit first and then anywhere,
+    so edits given out of order still apply.
+    """
+    cursor = 0
+    for number, hunk in enumerate(hunks, start=1):
+        if not hunk.search.strip():
+            raise PatchError(f"edit {number} has nothing to search for")
+        span = _find(code, hunk.search, cursor) or _find(code, hunk.search, 0)
+        if span is None:
+            raise PatchError(f"edit {number} doesn't match the code")
+        code = code[:span[0]] + hunk.replace + code[span[1]:]
+        cursor = span[0] + len(hunk.replace)
+    return code
+
+
+def uses_patches(code: str) -> bool:
+    return 0 <= PATCH_MIN_TOKENS <= estimate_tokens(code)
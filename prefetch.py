@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from ratelimit import estimate_tokens
+
+# Prefetch Configuration
+PREFETCH_DEFAULT = os.getenv("ASTRACODE_PREFETCH", "0") == "1"  # default of the sidebar toggle
+PREFETCH_WORKERS = int(os.getenv("ASTRACODE_PREFETCH_WORKERS", 2))
+PREFETCH_SESSION_TOKENS = int(os.getenv("ASTRACODE_PREFETCH_TOKENS", 8192))  # per session per window
+PREFETCH_WINDOW = 600.0  # seconds the session budget covers
+PREFETCH_TTL = 1800.0  # seconds an unused batch is kept before it counts as wasted
+
+# A speculative job: (action, output tokens it may use, run(parts, cancel, stats) -> result)
+PrefetchJob = Tuple[str, int, Callable[[list, threading.Event, dict], Any]]
+
+
+class SpeculativeTask:
+    __slots__ = ("action", "tokens", "future", "parts", "cancel", "stats", "used")
+
+    def __init__(self, action: str, tokens: int):
+        self.action = action
+        self.tokens = tokens
+        self.future: Optional[Future] = None
+        self.parts: List[str] = []  # partial output, for counting what a cancelled task already used
+        self.cancel = threading.Event()
+        self.stats: dict = {}  # the call's trace; a cache hit used no upstream tokens
+        self.used = False
+
+
+class PrefetchBatch:
+    """Speculative results for one generation, held in the session that asked for it."""
+
+    def __init__(self, prefetcher: "Prefetcher", session_id: str):
+        self.prefetcher = prefetcher
+        self.session_id = session_id
+        self.created = time.monotonic()
+        self.tasks: Dict[str, SpeculativeTask] = {}
+        self.discarded = False
+
+    def take(self, action: str) -> Any:
+        """The prefetched result of ``action`` if it is ready (a hit), else None.
+
+        A task still running is left alone: the caller's own request for the
+        same prompt joins it through request coalescing (counted as "late").
+        """
+        task = self.tasks.get(action)
+        if task is None or task.used:
+            self.prefetcher.record(action, "miss")
+            return None
+        if not task.future.done():
+            task.used = True
+            self.prefetcher.record(action, "late")
+            return None
+        try:
+            result = task.future.result()
+        except (CancelledError, Exception):
+            result = None
+        task.used = True
+        self.prefetcher.record(action, "hit" if result else "failed")
+        return result or None
+
+    def discard(self) -> None:
+        """Drop what was never used: pending tasks are cancelled, and their tokens count as wasted."""
+        if self.discarded:
+            return
+        self.discarded = True
+        for task in self.tasks.values():
+            if task.used:
+                continue
+            task.cancel.set()
+            if task.future.cancel():
+                self.prefetcher.record(task.action, "cancelled")
+                continue
+            tokens = 0 if task.stats.get("cache") == "hit" else estimate_tokens("".join(task.parts))
+            self.prefetcher.record(task.action, "wasted", tokens)
+
+
+class Prefetcher:
+    """Runs likely next actions in the background, within a per-session token budget.
+
+    ``start`` admits jobs in order while the session's speculative output
+    tokens over the last ``window`` seconds stay within ``session_tokens``;
+    jobs run on a small shared pool. The caller submits them at prefetch
+    priority, below everything a user asked for, so they only use rate-limit
+    capacity that real requests leave free. Outcomes (hit, late, miss, wasted, ...) and wasted tokens
+    are counted in ``metrics`` when given, and in ``stats``.
+    """
+
+    def __init__(
+        self,
+        workers: int = PREFETCH_WORKERS,
+        session_tokens: int = PREFETCH_SESSION_TOKENS,
+        window: float = PREFETCH_WINDOW,
+        metrics=None
+    ):
+        self.session_tokens = session_tokens
+        self.window = window
+        self.metrics = metrics
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="prefetch")
+        self._spent: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._batches: List[PrefetchBatch] = []
+        self._counts: Dict[Tuple[str, str], int] = {}
+        self._wasted_tokens = 0
+        self._lock = threading.Lock()
+
+    def start(self, session_id: str, jobs: List[PrefetchJob]) -> PrefetchBatch:
+        batch = PrefetchBatch(self, session_id)
+        self._expire()
+        for action, tokens, run in jobs:
+            if not self._admit(session_id, tokens):
+                self.record(action, "over_budget")
+                continue
+            task = SpeculativeTask(action, tokens)
+            task.future = self._pool.submit(run, task.parts, task.cancel, task.stats)
+            batch.tasks[action] = task
+            self.record(action, "started")
+        with self._lock:
+            self._batches.append(batch)
+        return batch
+
+    def record(self, action: str, outcome: str, wasted_tokens: int = 0) -> None:
+        with self._lock:
+            self._counts[(action, outcome)] = self._counts.get((action, outcome), 0) + 1
+            self._wasted_tokens += wasted_tokens
+        if self.metrics is not None:
+            self.metrics.inc("astracode_prefetch_total", (("action", action), ("outcome", outcome)))
+            if wasted_tokens:
+                self.metrics.inc("astracode_prefetch_wasted_tokens_total", (("action", action),), wasted_tokens)
+
+    def stats(self) -> Dict[str, dict]:
+        """Per action: outcome counts and the hit rate over the clicks that found a prefetch."""
+        with self._lock:
+            counts = dict(self._counts)
+        summary: Dict[str, dict] = {}
+        for (action, outcome), count in sorted(counts.items()):
+            summary.setdefault(action, {})[outcome] = count
+        for outcomes in summary.values():
+            served = outcomes.get("hit", 0) + outcomes.get("late", 0) + outcomes.get("miss", 0)
+            outcomes["hit_rate"] = round(outcomes.get("hit", 0) / served, 3) if served else None
+        return summary
+
+    @property
+    def wasted_tokens(self) -> int:
+        return self._wasted_tokens
+
+    def _admit(self, session_id: str, tokens: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            spent = self._spent.setdefault(session_id, deque())
+            while spent and spent[0][0] < now - self.window:
+                spent.popleft()
+            if sum(amount for _, amount in spent) + tokens > self.session_tokens:
+                return False
+            spent.append((now, tokens))
+            return True
+
+    def _expire(self) -> None:
+        # Batches of sessions that went away without another action
+        now = time.monotonic()
+        with self._lock:
+            expired = [batch for batch in self._batches if batch.discarded or batch.created < now - PREFETCH_TTL]
+            self._batches = [batch for batch in self._batches if batch not in expired]
+            for session_id, spent in list(self._spent.items()):
+                if not spent or spent[-1][0] < now - self.window:
+                    del self._spent[session_id]
+        for batch in expired:
+            batch.discard()
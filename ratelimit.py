@@ -0,0 +1,159 @@
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+from typing import Callable, Dict, List, Optional
+
+# Rate Limit Configuration (per model, matching the provider's account tier)
+RATE_LIMIT_RPM = int(os.getenv("ASTRACODE_RPM_LIMIT", 30))
+RATE_LIMIT_TPM = int(os.getenv("ASTRACODE_TPM_LIMIT", 30000))
+RATE_LIMIT_POLL_INTERVAL = 0.25
+RATE_LIMIT_INITIAL_COMPLETION_ESTIMATE = 1024
+
+# Scheduling priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BACKGROUND = 2
+# Speculative work nobody has asked for yet, behind even background requests
+PRIORITY_PREFETCH = 3
+
+
+def estimate_tokens(text: str) -> int:
+    # Rough heuristic (~4 characters per token) used only for reservations
+    return max(1, len(text) // 4)
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        missing = min(amount, self.capacity) - self.level
+        return 0.0 if missing <= 0 else missing / self.rate
+
+
+class Ticket:
+    def __init__(self, model: str, session_id: str, priority: int, rank: int, seq: int, tokens: int):
+        self.model = model
+        self.session_id = session_id
+        self.priority = priority
+        self.rank = rank
+        self.seq = seq
+        self.reserved_tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted: Optional[float] = None
+
+    @property
+    def order(self) -> tuple:
+        return (self.priority, self.rank, self.seq)
+
+    @property
+    def queue_wait(self) -> float:
+        return (self.granted or time.monotonic()) - self.enqueued
+
+
+class FairScheduler:
+    """Process-wide requests/tokens-per-minute budgets with a fair wait queue.
+
+    Each model has a requests bucket and a tokens bucket. ``acquire()``
+    reserves one request plus an estimate of the tokens the call will use,
+    blocking until both budgets allow it; ``settle()`` corrects the token
+    bucket with the actual usage once the call has finished. Waiters are
+    served by priority, then round-robin across sessions (a session's n-th
+    queued request ranks behind every other session's first), then FIFO.
+    """
+
+    def __init__(self, rpm: int = RATE_LIMIT_RPM, tpm: int = RATE_LIMIT_TPM):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._cond = threading.Condition()
+        self._buckets: Dict[str, tuple] = {}
+        self._queues: Dict[str, List[Ticket]] = {}
+        self._completion_estimate: Dict[str, float] = {}
+        self._seq = itertools.count()
+
+    def acquire(
+        self,
+        model: str,
+        session_id: str,
+        priority: int,
+        prompt_tokens: int,
+        on_position: Optional[Callable[[int], None]] = None,
+        cancelled: Optional[threading.Event] = None,
+        max_tokens: Optional[int] = None
+    ) -> Ticket:
+        with self._cond:
+            requests, tokens = self._model_buckets(model)
+            queue = self._queues.setdefault(model, [])
+            rank = sum(1 for t in queue if t.session_id == session_id and t.priority == priority)
+            completion = self._completion_estimate.get(model, RATE_LIMIT_INITIAL_COMPLETION_ESTIMATE)
+            # A request can't use more than its max_tokens, so short ones reserve less
+            reserve = prompt_tokens + int(min(completion, max_tokens or completion))
+            ticket = Ticket(model, session_id, priority, rank, next(self._seq), reserve)
+            queue.append(ticket)
+            queue.sort(key=lambda t: t.order)
+            try:
+                while True:
+                    wait_for = RATE_LIMIT_POLL_INTERVAL
+                    if queue[0] is ticket:
+                        now = time.monotonic()
+                        requests.refill(now)
+                        tokens.refill(now)
+                        wait_for = max(requests.wait_time(1), tokens.wait_time(ticket.reserved_tokens))
+                        if wait_for == 0:
+                            requests.level -= 1
+                            tokens.level -= ticket.reserved_tokens
+                            ticket.granted = now
+                            queue.pop(0)
+                            self._cond.notify_all()
+                            return ticket
+                    if cancelled is not None and cancelled.is_set():
+                        raise CancelledError()
+                    if on_position:
+                        on_position(queue.index(ticket) + 1)
+                    self._cond.wait(min(wait_for, RATE_LIMIT_POLL_INTERVAL))
+            except BaseException:
+                if ticket in queue:
+                    queue.remove(ticket)
+                    self._cond.notify_all()
+                raise
+
+    def settle(self, ticket: Ticket, total_tokens: Optional[int], completion_tokens: Optional[int] = None) -> None:
+        with self._cond:
+            if total_tokens is not None:
+                _, tokens = self._model_buckets(ticket.model)
+                tokens.refill(time.monotonic())
+                tokens.level = min(tokens.capacity, tokens.level + ticket.reserved_tokens - total_tokens)
+            if completion_tokens is not None:
+                estimate = self._completion_estimate.get(ticket.model, RATE_LIMIT_INITIAL_COMPLETION_ESTIMATE)
+                self._completion_estimate[ticket.model] = 0.8 * estimate + 0.2 * completion_tokens
+            self._cond.notify_all()
+
+    def penalize(self, model: str) -> None:
+        # The provider rejected us anyway (429): drain the budget so the
+        # queue backs off until it refills
+        with self._cond:
+            for bucket in self._model_buckets(model):
+                bucket.refill(time.monotonic())
+                bucket.level = min(bucket.level, 0.0)
+
+    def queue_length(self, model: Optional[str] = None) -> int:
+        with self._cond:
+            if model is not None:
+                return len(self._queues.get(model, []))
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _model_buckets(self, model: str) -> tuple:
+        buckets = self._buckets.get(model)
+        if buckets is None:
+            buckets = (TokenBucket(self.rpm), TokenBucket(self.tpm))
+            self._buckets[model] = buckets
+        return buckets
@@ -0,0 +1,424 @@
+"""Local stand-in for the Groq API that replays recorded completions.
+
+    ASTRACODE_RECORD_PATH=recordings.jsonl streamlit run app.py       # record real traffic
+    python replay.py recordings.jsonl --port 8765 --ttft 0.4 --rate-limit-rate 0.05
+    python replay.py recordings.jsonl --enforce-max-tokens                # exercise continuations
+    ASTRACODE_BACKEND_URL=http://127.0.0.1:8765 streamlit run app.py  # replay it
+
+The server speaks the streaming chat-completions protocol the Groq SDK uses,
+so the whole client stack (connection pool, SDK retries, routing, rate
+limiting) runs unchanged. Recorded responses are matched by the same key
+as the response cache (model, prompt and sampling parameters), falling
+back to the prompt alone; unknown requests get a synthetic code answer.
+Time-to-first-token, streaming speed and injected 429/500 errors are
+configurable so latency can be measured without API quota or network.
+With ``enforce_max_tokens`` an answer longer than the request's
+``max_tokens`` is cut there and ends with ``finish_reason: "length"``, and
+a continuation request (one carrying the partial answer) gets the rest,
+so the continuation path can be benchmarked too.
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core import request_cache_key
+from ratelimit import estimate_tokens
+
+REPLAY_HOST = "127.0.0.1"
+REPLAY_PORT = 8765
+REPLAY_TTFT = 0.35  # seconds before the first token
+REPLAY_TTFT_JITTER = 0.25  # relative standard deviation of the TTFT
+REPLAY_TOKENS_PER_SECOND = 300.0
+REPLAY_SYNTHETIC_TOKENS = 400  # length of answers to requests with no recording
+REPLAY_FLUSH_INTERVAL = 0.02  # seconds of tokens sent per write
+
+TOKEN_PATTERN = re.compile(r"\s*\S{1,4}|\s+")
+
+
+class RecordingClient:
+    """Wraps a Groq client and appends every streamed completion to a JSONL file.
+
+    Each line holds the request key, model, prompt, response text (only as
+    far as the caller read it), observed time-to-first-token and duration,
+    and token usage.
+    """
+
+    def __init__(self, client, path: str):
+        self.client = client
+        self.path = path
+        self.chat = self
+        self.completions = self
+        self._lock = threading.Lock()
+
+    def create(self, **request):
+        started = time.monotonic()
+        response = self.client.chat.completions.create(**request)
+        if not request.get("stream"):
+            return response
+        return self._record(request, response, started)
+
+    def close(self) -> None:
+        self.client.close()
+
+    def _record(self, request: dict, stream, started: float):
+        parts: List[str] = []
+        first_token = None
+        usage = None
+        complete = failed = False
+        try:
+            for chunk in stream:
+                x_groq = getattr(chunk, "x_groq", None)
+                usage = getattr(chunk, "usage", None) or getattr(x_groq, "usage", None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if first_token is None:
+                        first_token = time.monotonic() - started
+                    parts.append(chunk.choices[0].delta.content)
+                yield chunk
+            complete = True
+        except Exception:
+            failed = True
+            raise
+        finally:
+            # Closing aborts the upstream call, just as an unwrapped stream
+            # closed early (e.g. at the end of its code block) would
+            stream.close()
+            # A caller that stopped reading early (e.g. once the code block
+            # closed) still gets recorded: what it consumed is all a replay needs
+            if first_token is not None and not failed:
+                self._write(request, parts, first_token, time.monotonic() - started, usage, complete)
+
+    def _write(self, request: dict, parts: List[str], ttft: float, duration: float, usage, complete: bool) -> None:
+        record = {
+            "key": request_cache_key(request),
+            "model": request["model"],
+            "prompt": request["messages"][0]["content"],
+            "response": "".join(parts),
+            "complete": complete,
+            "ttft": ttft,
+            "duration": duration,
+            "usage": {
+                "prompt_tokens": getattr(usage, "prompt_tokens", None),
+                "completion_tokens": getattr(usage, "completion_tokens", None)
+            }
+        }
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_recordings(path: str) -> List[dict]:
+    recordings = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                recordings.append(json.loads(line))
+    return recordings
+
+
+def synthetic_response(prompt: str, tokens: int) -> str:
+    # A fenced block the code extractor accepts whatever language was asked for
+    lines = ["```"]
+    count = 0
+    while count < tokens:
+        lines.append(f"result_{len(lines)} = compute(value_{len(lines)}, factor={len(lines) % 7})  # step")
+        count += estimate_tokens(lines[-1])
+    lines.append("```")
+    lines.append(f"This answers: {prompt[:80].strip()}")
+    return "\n".join(lines)
+
+
+def continued_text(request: dict) -> str:
+    # The partial answer a continuation request asks the model to go on from
+    return "".join(message["content"] for message in request["messages"][1:] if message["role"] == "assistant")
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> Tuple[str, bool]:
+    """``text`` cut to about ``max_tokens`` tokens at a token boundary, and whether it was cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text, False
+    end = 0
+    for match in TOKEN_PATTERN.finditer(text):
+        # The same ~4 characters per token as estimate_tokens
+        if match.end() // 4 > max_tokens:
+            break
+        end = match.end()
+    return text[:end], True
+
+
+class ReplayProfile:
+    """Timing and failure behaviour of the stand-in server."""
+
+    def __init__(
+        self,
+        ttft: float = REPLAY_TTFT,
+        ttft_jitter: float = REPLAY_TTFT_JITTER,
+        tokens_per_second: float = REPLAY_TOKENS_PER_SECOND,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        recorded_timing: bool = False,
+        synthetic_tokens: int = REPLAY_SYNTHETIC_TOKENS,
+        enforce_max_tokens: bool = False,
+        seed: Optional[int] = None
+    ):
+        self.ttft = ttft
+        self.ttft_jitter = ttft_jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.recorded_timing = recorded_timing
+        self.synthetic_tokens = synthetic_tokens
+        self.enforce_max_tokens = enforce_max_tokens
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def roll(self, probability: float) -> bool:
+        with self._lock:
+            return self.random.random() < probability
+
+    def first_token_delay(self, recording: Optional[dict]) -> float:
+        if self.recorded_timing and recording and recording.get("ttft") is not None:
+            return recording["ttft"]
+        with self._lock:
+            return max(0.0, self.random.gauss(self.ttft, self.ttft * self.ttft_jitter))
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering ``POST .../chat/completions`` from recordings."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        recordings: Optional[List[dict]] = None,
+        profile: Optional[ReplayProfile] = None,
+        host: str = REPLAY_HOST,
+        port: int = REPLAY_PORT
+    ):
+        super().__init__((host, port), _ReplayHandler)
+        self.profile = profile or ReplayProfile()
+        self.by_key: Dict[str, dict] = {}
+        self.by_prompt: Dict[str, dict] = {}
+        for recording in recordings or []:
+            self.by_key[recording["key"]] = recording
+            self.by_prompt.setdefault(recording["prompt"], recording)
+        self.stats = {"requests": 0, "replayed": 0, "synthetic": 0, "truncated": 0, "rate_limited": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> str:
+        self._thread = threading.Thread(target=self.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients drop their keep-alive connections whenever they exit
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def count(self, stat: str) -> None:
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    def find(self, request: dict) -> Optional[dict]:
+        return self.by_key.get(request_cache_key(request)) or self.by_prompt.get(request["messages"][0]["content"])
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    server: ReplayServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._error(404, "not_found", f"Unknown path {self.path}")
+            return
+        request = json.loads(body)
+        server = self.server
+        profile = server.profile
+        server.count("requests")
+        if profile.roll(profile.rate_limit_rate):
+            server.count("rate_limited")
+            self._error(429, "rate_limit_exceeded", "Rate limit reached (injected by replay server)", retry_after="1")
+            return
+        if profile.roll(profile.error_rate):
+            server.count("errors")
+            self._error(500, "internal_server_error", "Injected failure")
+            return
+
+        recording = server.find(request)
+        if recording is not None:
+            server.count("replayed")
+            text = recording["response"]
+        else:
+            server.count("synthetic")
+            tokens = profile.synthetic_tokens
+            if not profile.enforce_max_tokens:
+                tokens = min(tokens, request.get("max_tokens") or tokens)
+            text = synthetic_response(request["messages"][0]["content"], tokens)
+        finish_reason = "stop"
+        whole = True  # a recording's usage only fits its whole answer
+        if profile.enforce_max_tokens:
+            partial = continued_text(request)
+            if partial and text.startswith(partial):
+                text = text[len(partial):]
+                whole = False
+            if request.get("max_tokens"):
+                text, cut = truncate_to_tokens(text, request["max_tokens"])
+                if cut:
+                    server.count("truncated")
+                    finish_reason = "length"
+                    whole = False
+        recorded_usage = ((recording or {}).get("usage") if whole else None) or {}
+        prompt_tokens = recorded_usage.get("prompt_tokens") or estimate_tokens(request["messages"][0]["content"])
+        completion_tokens = recorded_usage.get("completion_tokens") or estimate_tokens(text)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+
+        time.sleep(profile.first_token_delay(recording))
+        try:
+            if request.get("stream"):
+                self._stream(request["model"], text, usage, finish_reason)
+            else:
+                self._complete(request["model"], text, usage, finish_reason)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled (e.g. a losing hedge or a closed stream)
+            pass
+
+    def _stream(self, model: str, text: str, usage: dict, finish_reason: str = "stop") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        def event(delta: dict, finish_reason: Optional[str] = None, **extra) -> str:
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        per_write = max(1, int(self.server.profile.tokens_per_second * REPLAY_FLUSH_INTERVAL))
+        self._write(event({"role": "assistant", "content": ""}))
+        for batch in _batched(TOKEN_PATTERN.findall(text), per_write):
+            self._write("".join(event({"content": token}) for token in batch))
+            time.sleep(len(batch) / self.server.profile.tokens_per_second)
+        self._write(event({}, finish_reason, x_groq={"id": completion_id, "usage": usage}) + "data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _complete(self, model: str, text: str, usage: dict, finish_reason: str = "stop") -> None:
+        time.sleep(estimate_tokens(text) / self.server.profile.tokens_per_second)
+        self._json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": finish_reason}],
+            "usage": usage
+        })
+
+    def _write(self, data: str) -> None:
+        payload = data.encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _error(self, status: int, code: str, message: str, retry_after: Optional[str] = None) -> None:
+        headers = {"retry-after": retry_after} if retry_after else {}
+        self._json(status, {"error": {"message": message, "type": "replay_error", "code": code}}, headers)
+
+    def _json(self, status: int, payload: dict, headers: Optional[dict] = None) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _batched(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--ttft", type=float, default=REPLAY_TTFT, help="mean seconds before the first token")
+    parser.add_argument("--ttft-jitter", type=float, default=REPLAY_TTFT_JITTER,
+                        help="relative standard deviation of the time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=REPLAY_TOKENS_PER_SECOND,
+                        help="streaming speed")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests rejected with a 429")
+    parser.add_argument("--recorded-timing", action="store_true",
+                        help="use each recording's own time to first token")
+    parser.add_argument("--enforce-max-tokens", action="store_true",
+                        help="cut answers at the request's max_tokens with finish_reason \"length\"")
+    parser.add_argument("--seed", type=int, default=None, help="seed for jitter and error injection")
+
+
+def profile_from_args(args: argparse.Namespace) -> ReplayProfile:
+    return ReplayProfile(
+        ttft=args.ttft,
+        ttft_jitter=args.ttft_jitter,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        recorded_timing=args.recorded_timing,
+        enforce_max_tokens=args.enforce_max_tokens,
+        seed=args.seed
+    )
+
+
+def main(argv: Optional[list] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve recorded Groq completions with realistic timing.")
+    parser.add_argument("recordings", nargs="?", help="JSONL file written with ASTRACODE_RECORD_PATH")
+    parser.add_argument("--host", default=REPLAY_HOST)
+    parser.add_argument("--port", type=int, default=REPLAY_PORT)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    recordings = load_recordings(args.recordings) if args.recordings else []
+    server = ReplayServer(recordings, profile_from_args(args), args.host, args.port)
+    print(f"replaying {len(recordings)} recordings on {server.url}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats), file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
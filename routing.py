@@ -0,0 +1,274 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import CancelledError
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Router Configuration
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ASTRACODE_ROUTER_FAILURE_THRESHOLD", 3))
+ROUTER_COOLDOWN = float(os.getenv("ASTRACODE_ROUTER_COOLDOWN", 30))
+ROUTER_HEDGE_REQUESTS = os.getenv("ASTRACODE_HEDGE_REQUESTS", "0") == "1"
+ROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("ASTRACODE_HEDGE_MIN_SAMPLES", 10))
+ROUTER_HEDGE_DEFAULT_DELAY = float(os.getenv("ASTRACODE_HEDGE_DEFAULT_DELAY", 5))
+ROUTER_EWMA_ALPHA = 0.2
+ROUTER_WINDOW = 200
+ROUTER_CANCEL_POLL_INTERVAL = 0.25  # seconds between checks of the caller's cancel event
+
+
+class ModelUnavailableError(RuntimeError):
+    pass
+
+
+# Opens one attempt's upstream stream: start(model, cancelled) -> (time the request was let through, deltas)
+AttemptStarter = Callable[[str, threading.Event], Tuple[float, Iterator[str]]]
+
+
+class ModelHealth:
+    """Latency, error-rate and circuit-breaker state for one model."""
+
+    def __init__(self):
+        self.ttft_samples = deque(maxlen=ROUTER_WINDOW)
+        self.ewma_ttft: Optional[float] = None
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= ROUTER_COOLDOWN:
+            return "half-open"
+        return "open"
+
+
+def _ewma(current: Optional[float], sample: float) -> float:
+    return sample if current is None else (1 - ROUTER_EWMA_ALPHA) * current + ROUTER_EWMA_ALPHA * sample
+
+
+class _Attempt:
+    def __init__(self, model: str):
+        self.model = model
+        self.started: Optional[float] = None  # set once the rate limiter lets the request through
+        self.first_token: Optional[float] = None
+        self.cancelled = threading.Event()
+
+
+class ModelRouter:
+    """Route completions across models with circuit breaking and hedging.
+
+    ``stream()`` tries the preferred model first. If it fails before
+    producing output the next healthy model is tried; if it has produced
+    no token by its p95 time-to-first-token, a hedged request is fired at
+    the next model and whichever streams first wins while the other is
+    cancelled. A model that fails ``ROUTER_FAILURE_THRESHOLD`` times in a
+    row is skipped for ``ROUTER_COOLDOWN`` seconds, then probed once.
+
+    ``start(model, cancelled)`` opens the upstream stream for one attempt
+    and returns it with the time the request was let through; it may watch
+    ``cancelled`` while waiting (e.g. in a rate-limit queue). Latency and
+    the hedge delay count from that time, so local queueing is never taken
+    for a slow model. Setting the caller's ``cancelled`` event stops the
+    stream with ``CancelledError``, even before the first token, and
+    cancels every attempt.
+    """
+
+    def __init__(self, models: List[str], hedge: bool = ROUTER_HEDGE_REQUESTS):
+        self.models = list(models)
+        self.hedge = hedge
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self._health: Dict[str, ModelHealth] = {model: ModelHealth() for model in self.models}
+        self._lock = threading.Lock()
+
+    def route(self, preferred: str) -> List[str]:
+        ordered = [preferred] + [model for model in self.models if model != preferred]
+        available = []
+        with self._lock:
+            for model in ordered:
+                health = self._health.setdefault(model, ModelHealth())
+                state = health.state
+                # While half-open, only a single probe request is let through
+                if state == "open" or (state == "half-open" and health.probe_in_flight):
+                    continue
+                available.append(model)
+        return available
+
+    def hedge_delay(self, model: str) -> float:
+        with self._lock:
+            health = self._health[model]
+            if len(health.ttft_samples) < ROUTER_HEDGE_MIN_SAMPLES:
+                return ROUTER_HEDGE_DEFAULT_DELAY
+            return health.percentile(0.95)
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            return {
+                model: {
+                    "state": health.state,
+                    "ewma_ttft": health.ewma_ttft,
+                    "ewma_latency": health.ewma_latency,
+                    "p50_ttft": health.percentile(0.5),
+                    "p95_ttft": health.percentile(0.95),
+                    "error_rate": health.error_rate
+                }
+                for model, health in self._health.items()
+            }
+
+    def ttft_samples(self) -> Dict[str, List[float]]:
+        with self._lock:
+            return {model: list(health.ttft_samples) for model, health in self._health.items()}
+
+    def record_ttft(self, model: str, ttft: float) -> None:
+        with self._lock:
+            health = self._health[model]
+            health.ttft_samples.append(ttft)
+            health.ewma_ttft = _ewma(health.ewma_ttft, ttft)
+
+    def record_success(self, model: str, latency: float) -> None:
+        with self._lock:
+            health = self._health[model]
+            health.ewma_latency = _ewma(health.ewma_latency, latency)
+            health.error_rate = _ewma(health.error_rate, 0.0)
+            health.consecutive_failures = 0
+            health.opened_at = None
+            health.probe_in_flight = False
+
+    def record_failure(self, model: str) -> None:
+        with self._lock:
+            health = self._health[model]
+            health.error_rate = _ewma(health.error_rate, 1.0)
+            health.consecutive_failures += 1
+            if health.probe_in_flight or health.consecutive_failures >= ROUTER_FAILURE_THRESHOLD:
+                health.opened_at = time.monotonic()
+            health.probe_in_flight = False
+
+    def stream(
+        self,
+        preferred: str,
+        start: AttemptStarter,
+        cancelled: Optional[threading.Event] = None
+    ) -> Iterator[str]:
+        models = self.route(preferred)
+        if not models:
+            raise ModelUnavailableError("All models are temporarily unavailable; please retry shortly.")
+
+        events = queue.Queue()
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        last_error: Optional[BaseException] = None
+
+        def launch(model: str) -> None:
+            with self._lock:
+                health = self._health[model]
+                if health.state == "half-open":
+                    health.probe_in_flight = True
+            attempt = _Attempt(model)
+            attempts.append(attempt)
+            threading.Thread(
+                target=self._run_attempt,
+                args=(attempt, start, events),
+                name=f"router-{model}",
+                daemon=True
+            ).start()
+
+        launch(models.pop(0))
+        deadline = None
+
+        try:
+            while True:
+                timeout = None
+                if winner is None and deadline is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                if cancelled is not None:
+                    timeout = min(ROUTER_CANCEL_POLL_INTERVAL, timeout if timeout is not None else float("inf"))
+                try:
+                    attempt, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    if cancelled is not None and cancelled.is_set():
+                        raise CancelledError()
+                    if winner is not None or deadline is None or time.monotonic() < deadline:
+                        continue
+                    # Primary is slower than usual: race it against the next model
+                    deadline = None
+                    with self._lock:
+                        self.hedges_fired += 1
+                    launch(models.pop(0))
+                    continue
+
+                if kind == "granted":
+                    # The hedge clock starts once the primary is actually sent upstream
+                    if winner is None and attempt is attempts[0] and self.hedge and models:
+                        deadline = attempt.started + self.hedge_delay(attempt.model)
+                    continue
+                if winner is None:
+                    if kind == "error":
+                        self.record_failure(attempt.model)
+                        last_error = payload
+                        attempts.remove(attempt)
+                        if not attempts:
+                            if not models:
+                                raise last_error
+                            deadline = None
+                            launch(models.pop(0))
+                        continue
+                    winner = attempt
+                    self.record_ttft(attempt.model, attempt.first_token - attempt.started)
+                    if attempt is not attempts[0]:
+                        with self._lock:
+                            self.hedges_won += 1
+                    for other in attempts:
+                        if other is not winner:
+                            other.cancelled.set()
+                            # A cancelled straggler that was sent upstream was at least this slow
+                            if other.started is not None:
+                                self.record_ttft(other.model, time.monotonic() - other.started)
+                elif attempt is not winner:
+                    continue
+
+                if kind == "delta":
+                    yield payload
+                elif kind == "done":
+                    self.record_success(attempt.model, time.monotonic() - attempt.started)
+                    return
+                else:
+                    self.record_failure(attempt.model)
+                    raise payload
+        finally:
+            for attempt in attempts:
+                attempt.cancelled.set()
+
+    @staticmethod
+    def _run_attempt(
+        attempt: _Attempt,
+        start: AttemptStarter,
+        events: queue.Queue
+    ) -> None:
+        deltas = None
+        try:
+            attempt.started, deltas = start(attempt.model, attempt.cancelled)
+            events.put((attempt, "granted", None))
+            for delta in deltas:
+                if attempt.cancelled.is_set():
+                    return
+                if attempt.first_token is None:
+                    attempt.first_token = time.monotonic()
+                events.put((attempt, "delta", delta))
+            if attempt.first_token is None:
+                attempt.first_token = time.monotonic()
+            events.put((attempt, "done", None))
+        except Exception as e:
+            events.put((attempt, "error", e))
+        finally:
+            if deltas is not None and hasattr(deltas, "close"):
+                deltas.close()
@@ -0,0 +1,516 @@
+"""Sandboxed execution and micro-benchmarking of generated Python code.
+
+Every run is a fresh ``python -I`` subprocess (this file is its entry
+point) that lowers its own CPU, memory, file-size and process limits,
+blocks sockets, process spawning and ``ctypes`` with an audit hook, and
+runs in an empty temporary directory with no inherited environment. It
+may only read files there and in the interpreter's import paths, and
+reports back through a file outside that directory, not stdout. The
+candidate code is loaded as a module (its ``if __name__ == "__main__"``
+demo is not run), then its workloads are run once each as tests and timed
+``timeit``-style: ``test*`` functions, ``unittest.TestCase`` methods and
+``benchmark*`` functions. Code with none of these is timed as a whole
+script instead. Each workload's peak allocation comes from ``tracemalloc``.
+
+Only the standard library is imported here, since the child runs isolated
+from the app's environment.
+"""
+import ast
+import contextlib
+import hashlib
+import io
+import json
+import math
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # not POSIX: runs only get the wall-clock timeout
+    resource = None
+
+# Sandbox Configuration
+SANDBOX_WORKERS = int(os.getenv("ASTRACODE_SANDBOX_WORKERS", min(4, os.cpu_count() or 1)))
+SANDBOX_TIMEOUT = float(os.getenv("ASTRACODE_SANDBOX_TIMEOUT", 20))  # seconds per run
+SANDBOX_MEMORY_LIMIT = int(float(os.getenv("ASTRACODE_SANDBOX_MEMORY_MB", 512)) * 2 ** 20)
+SANDBOX_FILE_LIMIT = 16 * 2 ** 20  # bytes a run may write to a file
+SANDBOX_REPEAT = 5  # timing rounds per workload; the fastest round is reported
+SANDBOX_ROUND_SECONDS = 0.05  # loops per round grow until a round takes this long
+SANDBOX_MAX_LOOPS = 1_000_000
+SANDBOX_MAX_WORKLOADS = 25
+SANDBOX_OUTPUT_LIMIT = 2000  # characters of captured stdout/stderr kept
+SANDBOX_NOISE = 0.05  # relative difference reported as "same"
+SANDBOX_VERSION = 1  # part of the cache key; bump when measurements change meaning
+SANDBOX_ROOT = [""]  # the child's working directory, set before the audit hook goes in
+SANDBOX_READ_ROOTS: List[str] = []  # other paths it may read, set at the same time
+
+# Audit events refused inside the sandbox (prefix match)
+BLOCKED_EVENTS = (
+    "socket.", "subprocess.", "os.system", "os.exec", "os.spawn", "os.posix_spawn",
+    "os.fork", "os.forkpty", "os.kill", "os.killpg", "pty.", "ctypes."
+)
+# Modules that can start processes without raising an audit event
+BLOCKED_IMPORTS = {"_posixsubprocess"}
+# Audit events whose first argument is a path being read
+READ_EVENTS = {"os.listdir", "os.scandir"}
+# Audit events whose first (and second) argument is a path being changed
+WRITE_EVENTS = {"os.remove", "os.rename", "os.rmdir", "os.mkdir", "os.chmod", "os.chown", "os.truncate", "shutil.rmtree"}
+
+
+class SandboxResult:
+    """Outcome of running one piece of code and its workloads in the sandbox."""
+
+    __slots__ = ("error", "timed_out", "workloads", "output", "max_rss", "seconds", "cached")
+
+    def __init__(
+        self,
+        error: Optional[str] = None,
+        timed_out: bool = False,
+        workloads: Optional[List[dict]] = None,
+        output: str = "",
+        max_rss: Optional[int] = None,
+        seconds: float = 0.0,
+        cached: bool = False
+    ):
+        self.error = error
+        self.timed_out = timed_out
+        self.workloads = workloads or []  # name, kind, passed, error, timed_out, seconds (per call), loops, peak_bytes
+        self.output = output
+        self.max_rss = max_rss
+        self.seconds = seconds
+        self.cached = cached
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and all(workload["passed"] for workload in self.workloads)
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__ if name != "cached"}
+
+    @classmethod
+    def from_dict(cls, data: dict, cached: bool = False) -> "SandboxResult":
+        return cls(**data, cached=cached)
+
+
+class BenchmarkComparison:
+    """The same workloads run against the original and the optimized code."""
+
+    def __init__(self, original: SandboxResult, optimized: SandboxResult):
+        self.original = original
+        self.optimized = optimized
+        self.rows = []
+        optimized_workloads = {workload["name"]: workload for workload in optimized.workloads}
+        for before in original.workloads:
+            after = optimized_workloads.get(before["name"])
+            row = {
+                "workload": before["name"],
+                "original_seconds": before["seconds"],
+                "optimized_seconds": after["seconds"] if after else None,
+                "speedup": None,
+                "original_peak_bytes": before["peak_bytes"],
+                "optimized_peak_bytes": after["peak_bytes"] if after else None,
+                "status": _status(before, after)
+            }
+            if row["status"] in ("faster", "slower", "same"):
+                row["speedup"] = before["seconds"] / after["seconds"]
+            self.rows.append(row)
+
+    @property
+    def speedup(self) -> Optional[float]:
+        """Geometric mean speedup over the workloads that passed on both sides."""
+        speedups = [row["speedup"] for row in self.rows if row["speedup"]]
+        if not speedups:
+            return None
+        return math.exp(sum(math.log(speedup) for speedup in speedups) / len(speedups))
+
+
+def _status(before: dict, after: Optional[dict]) -> str:
+    if after is None:
+        return "missing"
+    if before.get("timed_out") and after["passed"]:
+        return "original timed out"
+    if not before["passed"]:
+        return "original failed"
+    if after.get("timed_out"):
+        return "optimized timed out"
+    if not after["passed"]:
+        return "optimized failed"
+    if not before["seconds"] or not after["seconds"]:
+        return "not timed"
+    ratio = before["seconds"] / after["seconds"]
+    if ratio > 1 + SANDBOX_NOISE:
+        return "faster"
+    if ratio < 1 / (1 + SANDBOX_NOISE):
+        return "slower"
+    return "same"
+
+
+def _is_workload_function(node: ast.AST) -> bool:
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith(("test", "benchmark"))
+
+
+def _is_test_case(node: ast.AST) -> bool:
+    return isinstance(node, ast.ClassDef) and any(
+        (base.attr if isinstance(base, ast.Attribute) else getattr(base, "id", "")).endswith("TestCase")
+        for base in node.bases
+    )
+
+
+def extract_workloads(code: str, exclude: Optional[set] = None) -> str:
+    """The imports and workload definitions of ``code``, as source to run against another version of it."""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return ""
+    exclude = exclude or set()
+    imports, definitions = [], []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            imports.append(ast.get_source_segment(code, node))
+        elif (_is_workload_function(node) or _is_test_case(node)) and node.name not in exclude:
+            # Decorators are left off, so a fixture or skip marker can't change what runs
+            definitions.append(ast.get_source_segment(code, node))
+    return "\n\n".join(imports + definitions) if definitions else ""
+
+
+def workload_names(workloads: str) -> set:
+    try:
+        return {node.name for node in ast.parse(workloads).body if hasattr(node, "name")}
+    except SyntaxError:
+        return set()
+
+
+class SandboxRunner:
+    """Runs code in sandboxed subprocesses on a worker pool, caching results by code hash.
+
+    Identical runs already in flight are shared. Results go to ``cache``
+    (anything with ``get``/``set`` of strings, e.g. ``ResponseCache``)
+    when one is given, keyed by the code, its workloads and the limits,
+    so a benchmark is only repeated when any of them change.
+    """
+
+    def __init__(
+        self,
+        workers: int = SANDBOX_WORKERS,
+        timeout: float = SANDBOX_TIMEOUT,
+        memory_limit: int = SANDBOX_MEMORY_LIMIT,
+        cache=None
+    ):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.cache = cache
+        self.runs = 0
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="sandbox")
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def cache_key(self, code: str, workloads: str) -> str:
+        payload = json.dumps(["sandbox", SANDBOX_VERSION, code, workloads, self.timeout, self.memory_limit])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def submit(self, code: str, workloads: Optional[str] = None) -> "Future[SandboxResult]":
+        """Run ``code`` with ``workloads`` (default: its own tests and benchmarks) on the pool."""
+        if workloads is None:
+            workloads = extract_workloads(code)
+        key = self.cache_key(code, workloads)
+        cached = self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            future: Future = Future()
+            future.set_result(SandboxResult.from_dict(json.loads(cached), cached=True))
+            return future
+        with self._lock:
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._pool.submit(self._run, key, code, workloads)
+                self._in_flight[key] = future
+        return future
+
+    def run(self, code: str, workloads: Optional[str] = None) -> SandboxResult:
+        return self.submit(code, workloads).result()
+
+    def compare(self, original: str, optimized: str) -> BenchmarkComparison:
+        """Run the workloads of both versions against each, concurrently, and line them up."""
+        workloads = extract_workloads(original)
+        extra = extract_workloads(optimized, exclude=workload_names(workloads))
+        if extra:
+            workloads = f"{workloads}\n\n{extra}" if workloads else extra
+        before = self.submit(original, workloads)
+        after = self.submit(optimized, workloads)
+        return BenchmarkComparison(before.result(), after.result())
+
+    def _run(self, key: str, code: str, workloads: str) -> SandboxResult:
+        try:
+            result = self._execute(code, workloads)
+            if self.cache is not None:
+                self.cache.set(key, json.dumps(result.as_dict()))
+            return result
+        except OSError as e:
+            # The sandbox itself failed to start; nothing to cache
+            return SandboxResult(error=f"Sandbox unavailable: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _execute(self, code: str, workloads: str) -> SandboxResult:
+        # Imported here so the child, which shares this module, never has _posixsubprocess loaded
+        import subprocess
+
+        job = {
+            "code": code,
+            "workloads": workloads,
+            "timeout": self.timeout,
+            "memory_limit": self.memory_limit
+        }
+        started = time.perf_counter()
+        self.runs += 1
+        with tempfile.TemporaryDirectory(prefix="astracode-sandbox-") as tmp:
+            # The result file sits next to the run's directory, out of reach of the code under test
+            workdir = os.path.join(tmp, "run")
+            os.mkdir(workdir)
+            job["result_path"] = os.path.join(tmp, "result.json")
+            try:
+                completed = subprocess.run(
+                    [sys.executable, "-I", os.path.abspath(__file__)],
+                    input=json.dumps(job),
+                    capture_output=True,
+                    text=True,
+                    encoding="utf-8",
+                    errors="replace",
+                    cwd=workdir,
+                    env={"PYTHONIOENCODING": "utf-8", "PYTHONDONTWRITEBYTECODE": "1"},
+                    timeout=self.timeout
+                )
+            except subprocess.TimeoutExpired as e:
+                output = e.stdout.decode("utf-8", "replace") if isinstance(e.stdout, bytes) else e.stdout or ""
+                return SandboxResult(
+                    error=f"Timed out after {self.timeout:g}s",
+                    timed_out=True,
+                    output=output[-SANDBOX_OUTPUT_LIMIT:],
+                    seconds=time.perf_counter() - started
+                )
+            seconds = time.perf_counter() - started
+            try:
+                with open(job["result_path"], encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                data = None
+        if data is not None:
+            data["seconds"] = seconds
+            return SandboxResult.from_dict(data)
+        # Killed before reporting: CPU limit, memory limit or a hard crash
+        output = (completed.stdout + completed.stderr)[-SANDBOX_OUTPUT_LIMIT:]
+        return SandboxResult(
+            error=f"Exited with status {completed.returncode} before finishing",
+            timed_out=completed.returncode == -9 or "CPU time" in output,
+            output=output,
+            seconds=seconds
+        )
+
+
+# Child Process (python -I sandbox.py, job as JSON on stdin)
+def _limit_resources(timeout: float, memory_limit: int) -> None:
+    if resource is None:
+        return
+    cpu = math.ceil(timeout) + 1
+    limits = [
+        (resource.RLIMIT_CPU, (cpu, cpu)),
+        (resource.RLIMIT_AS, (memory_limit, memory_limit)),
+        (resource.RLIMIT_FSIZE, (SANDBOX_FILE_LIMIT, SANDBOX_FILE_LIMIT)),
+        (resource.RLIMIT_CORE, (0, 0))
+    ]
+    for name, value in limits:
+        try:
+            resource.setrlimit(name, value)
+        except (ValueError, OSError):
+            pass
+
+
+def _audit(event: str, args: tuple) -> None:
+    if event.startswith(BLOCKED_EVENTS):
+        raise PermissionError(f"{event} is not allowed in the sandbox")
+    if event == "import" and args[0] in BLOCKED_IMPORTS:
+        raise PermissionError(f"importing {args[0]} is not allowed in the sandbox")
+    # Files may only be written, moved or deleted inside the run's temporary directory,
+    # and only read there or from the interpreter's import paths (so not /proc or the app's files)
+    if event == "open" and isinstance(args[0], (str, bytes)):
+        writing = any(flag in (args[1] or "") for flag in "wax+") or (args[2] or 0) & (os.O_WRONLY | os.O_RDWR)
+        _check_path(event, args[0], SANDBOX_ROOT if writing else SANDBOX_ROOT + SANDBOX_READ_ROOTS)
+    elif event in READ_EVENTS and isinstance(args[0], (str, bytes)):
+        _check_path(event, args[0], SANDBOX_ROOT + SANDBOX_READ_ROOTS)
+    elif event in WRITE_EVENTS:
+        for path in args[:2]:
+            if isinstance(path, (str, bytes)):
+                _check_path(event, path, SANDBOX_ROOT)
+
+
+def _check_path(event: str, path, roots: List[str]) -> None:
+    path = os.path.realpath(os.fsdecode(path))
+    if not any(os.path.commonpath([path, root]) == root for root in roots):
+        raise PermissionError(f"{event} outside the sandbox directory is not allowed")
+
+
+def _collect_workloads(namespace: dict, names: set) -> List[tuple]:
+    import unittest
+
+    workloads = []
+    for name, value in namespace.items():
+        if name not in names:
+            continue
+        if isinstance(value, type) and issubclass(value, unittest.TestCase):
+            for method in unittest.TestLoader().getTestCaseNames(value):
+                workloads.append((f"{name}.{method}", "test", lambda case=value, method=method: case(method).debug()))
+        elif getattr(value, "__code__", None) is not None:
+            required = value.__code__.co_argcount - len(value.__defaults__ or ())
+            if required == 0 and not value.__code__.co_flags & 0x80:  # coroutines aren't timed
+                kind = "benchmark" if name.startswith("benchmark") else "test"
+                workloads.append((name, kind, value))
+    return workloads[:SANDBOX_MAX_WORKLOADS]
+
+
+class WorkloadTimeout(BaseException):
+    """Raised in the child when a workload overruns its share of the run's time."""
+
+
+@contextlib.contextmanager
+def _time_limit(seconds: float):
+    if not hasattr(signal, "setitimer"):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise WorkloadTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _measure(function, deadline: float) -> tuple:
+    import timeit
+
+    timer = timeit.Timer(function)
+    loops = 1
+    while True:
+        elapsed = timer.timeit(loops)
+        if elapsed >= SANDBOX_ROUND_SECONDS or loops >= SANDBOX_MAX_LOOPS or time.monotonic() > deadline:
+            break
+        loops = min(loops * 10 if elapsed < SANDBOX_ROUND_SECONDS / 10 else loops * 2, SANDBOX_MAX_LOOPS)
+    best = elapsed
+    for _ in range(SANDBOX_REPEAT - 1):
+        if time.monotonic() + elapsed > deadline:
+            break
+        best = min(best, timer.timeit(loops))
+    return best / loops, loops
+
+
+def _peak_rss() -> Optional[int]:
+    # On Linux ru_maxrss can still hold the forking parent's peak, so prefer this process's own high-water mark
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def _child_main() -> None:
+    import builtins
+    import traceback
+    import tracemalloc
+    import types
+    import unittest
+
+    job = json.loads(sys.stdin.read())
+    # Opened before the audit hook goes in; the code under test can't open it by path
+    result_file = open(job["result_path"], "w", encoding="utf-8")
+    # Leave a margin for reporting before the parent's timeout
+    deadline = time.monotonic() + job["timeout"] * 0.8
+    _limit_resources(job["timeout"], job["memory_limit"])
+    captured = io.StringIO()
+    result = {"error": None, "workloads": [], "output": "", "max_rss": None}
+    sys.stdin = io.StringIO()
+    SANDBOX_ROOT[0] = os.path.realpath(os.getcwd())
+    SANDBOX_READ_ROOTS[:] = [os.path.realpath(path) for path in sys.path if path]
+    SANDBOX_READ_ROOTS.append(os.path.realpath("/proc/self/status"))  # for _peak_rss
+    sys.addaudithook(_audit)
+
+    def failure(e: BaseException) -> str:
+        return "".join(traceback.format_exception_only(type(e), e)).strip()
+
+    with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured):
+        module = types.ModuleType("__sandbox__")
+        module.__dict__["__builtins__"] = builtins
+        sys.modules["__sandbox__"] = module
+        try:
+            exec(compile(job["code"], "<candidate>", "exec"), module.__dict__)
+            names = set()
+            if job["workloads"]:
+                exec(compile(job["workloads"], "<workloads>", "exec"), module.__dict__)
+                names = workload_names(job["workloads"])
+            workloads = _collect_workloads(module.__dict__, names)
+            if not workloads:
+                script = compile(job["code"], "<candidate>", "exec")
+                workloads = [("script", "script", lambda: exec(script, {"__name__": "__main__"}))]
+        except BaseException as e:
+            result["error"] = failure(e)
+            workloads = []
+        for index, (name, kind, function) in enumerate(workloads):
+            measured = {"name": name, "kind": kind, "passed": False, "error": None, "timed_out": False,
+                        "seconds": None, "loops": 0, "peak_bytes": None}
+            result["workloads"].append(measured)
+            # Each workload gets an equal share of the time left, so one slow workload can't starve the rest
+            budget = (deadline - time.monotonic()) / (len(workloads) - index)
+            if budget <= 0:
+                measured["error"] = "skipped: time limit"
+                continue
+            try:
+                with _time_limit(budget):
+                    # The first call is both the test run and the warm-up
+                    tracemalloc.start()
+                    function()
+                    measured["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    measured["passed"] = True
+                    measured["seconds"], measured["loops"] = _measure(function, time.monotonic() + budget / 2)
+            except unittest.SkipTest as e:
+                measured["passed"] = True
+                measured["error"] = f"skipped: {e}"
+            except WorkloadTimeout:
+                if not measured["passed"]:
+                    measured["timed_out"] = True
+                    measured["error"] = f"timed out after {budget:.1f}s"
+            except BaseException as e:
+                measured["passed"] = False
+                measured["error"] = failure(e)
+            finally:
+                if tracemalloc.is_tracing():
+                    tracemalloc.stop()
+    result["max_rss"] = _peak_rss()
+    result["output"] = captured.getvalue()[-SANDBOX_OUTPUT_LIMIT:]
+    # Rewrite from the start, dropping anything the code under test wrote through the inherited handle
+    result_file.seek(0)
+    result_file.truncate()
+    json.dump(result, result_file)
+    result_file.close()
+    # Skip atexit handlers and leftover threads, which could still write to it
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    _child_main()
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+from cache import CACHE_PATH
+
+# Similarity Configuration
+SIMILARITY_THRESHOLD = float(os.getenv("ASTRACODE_SIMILARITY_THRESHOLD", 0.7))
+SIMILARITY_MAX_ENTRIES = int(os.getenv("ASTRACODE_SIMILARITY_MAX_ENTRIES", 200000))
+MINHASH_BANDS = 8
+MINHASH_ROWS = 4  # 8 bands x 4 rows: ~95% recall at 0.75 Jaccard, ~67% at 0.6
+MINHASH_PRIME = (1 << 61) - 1
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_+#]+")
+STOPWORDS = frozenset("""
+    a an and the to for of in on with using use that which this it its is are be by from as
+    into via write create make build implement generate give me please i want need can how
+    function program code script snippet simple basic compute calculate return returns
+""".split())
+# Words that flip or narrow a request: two queries differing in one of them never match
+POLARITY_WORDS = frozenset("""
+    not no non never without except excluding exclude unless neither nor instead
+    isn aren doesn don didn won cannot
+    reverse reversed inverse opposite ascending descending increasing decreasing
+""".split())
+
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randrange(1, MINHASH_PRIME), _rng.randrange(0, MINHASH_PRIME))
+    for _ in range(MINHASH_BANDS * MINHASH_ROWS)
+]
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 5 and token.endswith("ing"):
+        return token[:-3]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def normalize_query(query: str) -> FrozenSet[str]:
+    return frozenset(
+        token if token in POLARITY_WORDS else _stem(token)
+        for token in TOKEN_PATTERN.findall(query.lower())
+        if token not in STOPWORDS
+    )
+
+
+def _token_hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash(tokens: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [_token_hash(token) for token in tokens]
+    return tuple(min((a * h + b) % MINHASH_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+class SimilarMatch:
+    def __init__(self, key: str, query: str, similarity: float):
+        self.key = key
+        self.query = query
+        self.similarity = similarity
+
+
+class _Entry:
+    __slots__ = ("facets", "tokens", "key", "query", "bands")
+
+    def __init__(self, facets: tuple, tokens: FrozenSet[str], key: str, query: str, bands: list):
+        self.facets = facets
+        self.tokens = tokens
+        self.key = key
+        self.query = query
+        self.bands = bands
+
+
+class SemanticIndex:
+    """Near-duplicate lookup of past queries via MinHash + LSH banding.
+
+    Queries are reduced to a set of normalized word tokens; entries only
+    match within identical ``facets`` (language, complexity, style, ...),
+    and never when one query has a negation or contrast word (``not``,
+    ``without``, ``reverse``, ...) the other lacks.
+    LSH bands shortlist candidates in O(bands) dict lookups and the exact
+    Jaccard similarity of the shortlist decides the match, so lookup cost
+    depends on the shortlist rather than the index size (~0.1 ms at 200k
+    entries with a realistic vocabulary). Each entry points at
+    an exact response-cache key rather than holding the response itself.
+    Entries are persisted to SQLite and reloaded on a background thread.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = CACHE_PATH,
+        threshold: float = SIMILARITY_THRESHOLD,
+        max_entries: int = SIMILARITY_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS similar_queries (
+                    key TEXT PRIMARY KEY,
+                    facets TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    created REAL NOT NULL
+                )
+            """)
+            self._db.commit()
+            threading.Thread(target=self._load, name="semantic-index-load", daemon=True).start()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, facets: tuple, query: str, key: str, persist: bool = True) -> None:
+        tokens = normalize_query(query)
+        if not tokens:
+            return
+        signature = minhash(tokens)
+        bands = [
+            hash((facets, band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+            for band in range(MINHASH_BANDS)
+        ]
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(facets, tokens, key, query, bands)
+            for band_key in bands:
+                self._buckets.setdefault(band_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            if persist and self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO similar_queries (key, facets, query, created) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(facets), query, time.time())
+                )
+                self._db.commit()
+
+    def lookup(self, facets: tuple, query: str) -> Optional[SimilarMatch]:
+        tokens = normalize_query(query)
+        if not tokens:
+            return None
+        signature = minhash(tokens)
+        best = None
+        seen = set()
+        with self._lock:
+            for band in range(MINHASH_BANDS):
+                band_key = hash((facets, band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]))
+                for key in self._buckets.get(band_key, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    entry_tokens = self._entries[key].tokens
+                    if (tokens ^ entry_tokens) & POLARITY_WORDS:
+                        continue
+                    shared = len(tokens & entry_tokens)
+                    similarity = shared / (len(tokens) + len(entry_tokens) - shared)
+                    if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                        best = SimilarMatch(key, self._entries[key].query, similarity)
+                if best is not None and best.similarity == 1.0:
+                    break
+            if best is not None:
+                self._entries.move_to_end(best.key)
+        return best
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            if self._db is not None:
+                self._db.execute("DELETE FROM similar_queries WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry.bands:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _load(self) -> None:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, facets, query FROM similar_queries ORDER BY created DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+        for key, facets, query in reversed(rows):
+            if key not in self._entries:
+                self.add(tuple(json.loads(facets)), query, key, persist=False)
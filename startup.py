@@ -0,0 +1,121 @@
+"""Cold-start profiling: lazy imports, startup milestones and a timing report.
+
+    python startup.py --budget 1.0
+
+Prints the import cost of the heavy dependencies (each measured in a fresh
+interpreter) and the milestones of the app's first script run, and exits
+non-zero when the app isn't ready within the budget, so start-up
+regressions show up in CI. The app itself logs the same milestones once
+per process.
+"""
+import argparse
+import importlib
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Dict, List, Optional
+
+STARTUP_BUDGET = float(os.getenv("ASTRACODE_STARTUP_BUDGET", 1.0))  # seconds until the first run is done
+STARTUP_MODULES = ["streamlit", "groq", "httpx", "streamlit_tags", "pygments", "core", "themes"]
+
+
+class StartupProfile:
+    """Time since this module was first imported, i.e. since the script started."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.milestones: Dict[str, float] = {}
+        self.reported = False
+        self._lock = threading.Lock()
+
+    def mark(self, name: str) -> None:
+        with self._lock:
+            self.milestones.setdefault(name, time.perf_counter() - self.started)
+
+    def record_import(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.imports.setdefault(name, seconds)
+
+    def report(self) -> str:
+        with self._lock:
+            milestones = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.milestones.items())
+            imports = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.imports.items())
+        return f"startup: {milestones or 'no milestones'} | lazy imports: {imports or 'none'}"
+
+    def log_once(self) -> None:
+        with self._lock:
+            if self.reported:
+                return
+            self.reported = True
+        print(f"[astracode] {self.report()}", file=sys.stderr)
+
+
+STARTUP = StartupProfile()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import ``name`` on first use, recording how long the import took."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    STARTUP.record_import(name, time.perf_counter() - started)
+    return module
+
+
+def measure_import(module: str) -> Optional[float]:
+    # Cumulative import time in a fresh interpreter, from -X importtime
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    if result.returncode != 0:
+        return None
+    for line in reversed(result.stderr.splitlines()):
+        match = re.match(r"import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)$", line)
+        if match and match.group(2) == module:
+            return int(match.group(1)) / 1e6
+    return None
+
+
+def profile_first_run(app_path: str) -> StartupProfile:
+    from streamlit.testing.v1 import AppTest
+
+    # Only used to build a client; the first run makes no requests
+    os.environ.setdefault("GROQ_API_KEY", "startup-profile")
+    AppTest.from_file(app_path, default_timeout=60).run()
+    return sys.modules["startup"].STARTUP
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Report AstraCode Pro cold-start timings.")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                        help="seconds the first script run may take")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"),
+                        help="path of the Streamlit script")
+    args = parser.parse_args(argv)
+
+    print("import times (fresh interpreter, cumulative):")
+    for module in STARTUP_MODULES:
+        seconds = measure_import(module)
+        print(f"  {module:<16} {'unavailable' if seconds is None else f'{seconds:.3f}s'}")
+
+    profile = profile_first_run(args.app)
+    print(profile.report())
+    ready = profile.milestones.get("ready")
+    if ready is None or ready > args.budget:
+        print(f"first run not ready within {args.budget:.3f}s budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
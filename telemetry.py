@@ -0,0 +1,337 @@
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Telemetry Configuration
+METRICS_PORT = int(os.getenv("ASTRACODE_METRICS_PORT", 0))  # 0 disables the /metrics endpoint
+METRICS_HOST = os.getenv("ASTRACODE_METRICS_HOST", "127.0.0.1")  # 0.0.0.0 exposes it on every interface
+METRICS_RECENT_CALLS = 500  # calls kept for the admin panel
+METRICS_SHARD_SWEEP = 64  # new per-thread shards between folds of dead threads' shards
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+QUEUE_WAIT_BUCKETS = (0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+METRIC_HELP = {
+    "astracode_llm_calls_total": ("counter", "LLM calls by action, complexity, model, cache outcome and result"),
+    "astracode_llm_tokens_total": ("counter", "Tokens used by upstream calls"),
+    "astracode_llm_latency_seconds": ("histogram", "End-to-end latency of LLM calls"),
+    "astracode_llm_ttft_seconds": ("histogram", "Time to first token of upstream calls"),
+    "astracode_llm_queue_wait_seconds": ("histogram", "Time upstream calls waited for the rate limiter"),
+    "astracode_llm_finish_reasons_total": ("counter", "Finish reasons reported by the model"),
+    "astracode_llm_fallbacks_total": ("counter", "Upstream calls served by a model other than the one requested"),
+    "astracode_prefetch_total": ("counter", "Speculative prefetches by action and outcome (started, hit, late, miss, wasted, ...)"),
+    "astracode_prefetch_wasted_tokens_total": ("counter", "Estimated output tokens of prefetches that were never used")
+}
+
+
+class CallTrace:
+    """Everything recorded about one LLM call.
+
+    The caller fills in the cache outcome and end-to-end latency; when the
+    call goes upstream, the producer fills in the served model, queue wait,
+    time to first token, usage and finish reason. The trace is recorded
+    once both sides are done, whichever finishes last.
+    """
+
+    def __init__(self, action: str, complexity: Optional[str], requested_model: str):
+        self.action = action
+        self.complexity = complexity or ""
+        self.requested_model = requested_model
+        self.model: Optional[str] = None
+        self.cache = "miss"
+        self.outcome = "ok"
+        self.started = time.monotonic()
+        self.timestamp = time.time()
+        self.queue_wait: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.completion_tokens: Optional[int] = None
+        self.finish_reason: Optional[str] = None
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    @property
+    def fallback(self) -> bool:
+        return self.model is not None and self.model != self.requested_model
+
+    def lead(self) -> None:
+        # This call owns the upstream request: wait for the producer as well
+        with self._lock:
+            self._pending += 1
+
+    def first_token(self, model: str, queue_wait: Optional[float]) -> None:
+        # With hedging, the attempt that streams first is the one that's served
+        with self._lock:
+            if self.ttft is None:
+                self.ttft = time.monotonic() - self.started
+                self.model = model
+                self.queue_wait = queue_wait
+
+    def done(self) -> bool:
+        with self._lock:
+            self._pending -= 1
+            return self._pending == 0
+
+    def as_dict(self) -> dict:
+        return {
+            "time": self.timestamp,
+            "action": self.action,
+            "complexity": self.complexity,
+            "model": self.model or self.requested_model,
+            "cache": self.cache,
+            "outcome": self.outcome,
+            "fallback": self.fallback,
+            "queue_wait": self.queue_wait,
+            "ttft": self.ttft,
+            "latency": self.latency,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "finish_reason": self.finish_reason
+        }
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other: "_Histogram") -> None:
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        self.count += other.count
+
+
+class _Shard:
+    def __init__(self, thread: threading.Thread):
+        self.thread = thread
+        self.counters: Dict[tuple, float] = {}
+        self.histograms: Dict[tuple, _Histogram] = {}
+
+
+class Metrics:
+    """Process-wide counters and histograms, exported in Prometheus text format.
+
+    Updates go to a shard owned by the calling thread, so recording never
+    takes a lock; a scrape sums the shards. Shards of threads that have
+    exited are folded into a retired shard so short-lived worker threads
+    don't accumulate. The most recent calls are also kept for the admin
+    panel.
+    """
+
+    def __init__(self, recent_calls: int = METRICS_RECENT_CALLS):
+        self.recent: deque = deque(maxlen=recent_calls)
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(threading.main_thread())
+        self._new_shards = 0
+        self._lock = threading.Lock()
+        self._gauges: Dict[str, Tuple[str, Callable[[], Dict[Labels, float]]]] = {}
+
+    def inc(self, name: str, labels: Labels, amount: float = 1.0) -> None:
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0.0) + amount
+
+    def observe(self, name: str, labels: Labels, value: float, buckets: tuple) -> None:
+        histograms = self._shard().histograms
+        key = (name, labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(buckets)
+        histogram.observe(value)
+
+    def register_gauge(self, name: str, help_text: str, collect: Callable[[], Dict[Labels, float]]) -> None:
+        with self._lock:
+            self._gauges[name] = (help_text, collect)
+
+    def record_call(self, trace: CallTrace) -> None:
+        model = trace.model or trace.requested_model
+        call = (("action", trace.action), ("complexity", trace.complexity), ("model", model))
+        self.inc("astracode_llm_calls_total", call + (("cache", trace.cache), ("outcome", trace.outcome)))
+        if trace.latency is not None:
+            self.observe(
+                "astracode_llm_latency_seconds",
+                (("action", trace.action), ("cache", trace.cache)),
+                trace.latency,
+                LATENCY_BUCKETS
+            )
+        if trace.ttft is not None:
+            self.observe("astracode_llm_ttft_seconds", (("action", trace.action), ("model", model)),
+                         trace.ttft, TTFT_BUCKETS)
+        if trace.queue_wait is not None:
+            self.observe("astracode_llm_queue_wait_seconds", (("model", model),), trace.queue_wait, QUEUE_WAIT_BUCKETS)
+        if trace.prompt_tokens:
+            self.inc("astracode_llm_tokens_total", call + (("type", "prompt"),), trace.prompt_tokens)
+        if trace.completion_tokens:
+            self.inc("astracode_llm_tokens_total", call + (("type", "completion"),), trace.completion_tokens)
+        if trace.finish_reason:
+            self.inc("astracode_llm_finish_reasons_total", (("model", model), ("reason", trace.finish_reason)))
+        if trace.fallback:
+            self.inc("astracode_llm_fallbacks_total", (("requested", trace.requested_model), ("served", model)))
+        self.recent.append(trace.as_dict())
+
+    def totals(self) -> Tuple[Dict[tuple, float], Dict[tuple, _Histogram], dict]:
+        with self._lock:
+            self._sweep()
+            shards = [self._retired] + self._shards
+            counters: Dict[tuple, float] = {}
+            histograms: Dict[tuple, _Histogram] = {}
+            for shard in shards:
+                # Copies, since the owning threads keep writing while we read
+                for key, value in list(shard.counters.items()):
+                    counters[key] = counters.get(key, 0.0) + value
+                for key, histogram in list(shard.histograms.items()):
+                    merged = histograms.get(key)
+                    if merged is None:
+                        merged = histograms[key] = _Histogram(histogram.buckets)
+                    merged.merge(histogram)
+            gauges = dict(self._gauges)
+        return counters, histograms, gauges
+
+    def render(self) -> str:
+        counters, histograms, gauges = self.totals()
+        lines = []
+        for name, (kind, help_text) in METRIC_HELP.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value:g}")
+                continue
+            for (metric, labels), histogram in sorted(histograms.items(), key=lambda item: item[0]):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:g}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        for name, (help_text, collect) in sorted(gauges.items()):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in sorted(collect().items()):
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def tokens_per_minute(self, window: float = 60.0) -> Dict[str, float]:
+        # Upstream tokens per minute by complexity over the last `window` seconds
+        cutoff = time.time() - window
+        totals: Dict[str, float] = {}
+        for call in list(self.recent):
+            if call["time"] >= cutoff:
+                tokens = (call["prompt_tokens"] or 0) + (call["completion_tokens"] or 0)
+                totals[call["complexity"] or "n/a"] = totals.get(call["complexity"] or "n/a", 0) + tokens
+        return {complexity: tokens * 60.0 / window for complexity, tokens in totals.items()}
+
+    def action_summary(self) -> Dict[str, dict]:
+        # Latency and TTFT percentiles per action over the recent calls
+        by_action: Dict[str, List[dict]] = {}
+        for call in list(self.recent):
+            by_action.setdefault(call["action"], []).append(call)
+        summary = {}
+        for action, calls in sorted(by_action.items()):
+            latencies = sorted(call["latency"] for call in calls if call["latency"] is not None)
+            ttfts = sorted(call["ttft"] for call in calls if call["ttft"] is not None)
+            summary[action] = {
+                "calls": len(calls),
+                "cache_hits": sum(1 for call in calls if call["cache"] in ("hit", "coalesced")),
+                "errors": sum(1 for call in calls if call["outcome"] == "error"),
+                "p50_latency": _percentile(latencies, 0.5),
+                "p95_latency": _percentile(latencies, 0.95),
+                "p50_ttft": _percentile(ttfts, 0.5),
+                "p95_ttft": _percentile(ttfts, 0.95)
+            }
+        return summary
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._shards.append(shard)
+                self._new_shards += 1
+                if self._new_shards >= METRICS_SHARD_SWEEP:
+                    self._sweep()
+        return shard
+
+    def _sweep(self) -> None:
+        # Called with the lock held; a dead thread's shard is never written again
+        self._new_shards = 0
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+                continue
+            for key, value in shard.counters.items():
+                self._retired.counters[key] = self._retired.counters.get(key, 0.0) + value
+            for key, histogram in shard.histograms.items():
+                retired = self._retired.histograms.get(key)
+                if retired is None:
+                    retired = self._retired.histograms[key] = _Histogram(histogram.buckets)
+                retired.merge(histogram)
+        self._shards = alive
+
+
+def _percentile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    metrics: Metrics
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def serve_metrics(metrics: Metrics, port: int = METRICS_PORT, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` for Prometheus on a daemon thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"metrics": metrics})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,271 @@
+import re
+from functools import lru_cache
+from typing import Dict
+
+from highlight import style_definitions
+
+THEMES = ["Neon", "Cyberpunk", "Solarized", "Dracula", "Monokai", "Nord", "Ocean", "Matrix"]
+
+# Color palette for each theme
+THEME_PROPERTIES = {
+    "Neon": {
+        "primary": "#4fffb0",
+        "secondary": "#ff4fd8",
+        "bg": "#1a1a2e",
+        "text": "#ffffff",
+        "accent": "#00ff88",
+        "gradient": "linear-gradient(135deg, #1a1a2e 0%, #16213e 100%)"
+    },
+    "Cyberpunk": {
+        "primary": "#ff2a6d",
+        "secondary": "#05d9e8",
+        "bg": "#1a1a2e",
+        "text": "#d1f7ff",
+        "accent": "#ff9a00",
+        "gradient": "linear-gradient(135deg, #1a1a2e 0%, #0d1b2a 100%)"
+    },
+    "Solarized": {
+        "primary": "#268bd2",
+        "secondary": "#d33682",
+        "bg": "#fdf6e3",
+        "text": "#073642",
+        "accent": "#cb4b16",
+        "gradient": "linear-gradient(135deg, #fdf6e3 0%, #eee8d5 100%)"
+    },
+    "Dracula": {
+        "primary": "#bd93f9",
+        "secondary": "#ff79c6",
+        "bg": "#282a36",
+        "text": "#f8f8f2",
+        "accent": "#50fa7b",
+        "gradient": "linear-gradient(135deg, #282a36 0%, #44475a 100%)"
+    },
+    "Monokai": {
+        "primary": "#a6e22e",
+        "secondary": "#fd971f",
+        "bg": "#272822",
+        "text": "#f8f8f2",
+        "accent": "#f92672",
+        "gradient": "linear-gradient(135deg, #272822 0%, #1e1f1c 100%)"
+    },
+    "Nord": {
+        "primary": "#81a1c1",
+        "secondary": "#d08770",
+        "bg": "#2e3440",
+        "text": "#d8dee9",
+        "accent": "#5e81ac",
+        "gradient": "linear-gradient(135deg, #2e3440 0%, #3b4252 100%)"
+    },
+    "Ocean": {
+        "primary": "#7fdbff",
+        "secondary": "#ff851b",
+        "bg": "#001f3f",
+        "text": "#ffffff",
+        "accent": "#2ecc40",
+        "gradient": "linear-gradient(135deg, #001f3f 0%, #0074d9 100%)"
+    },
+    "Matrix": {
+        "primary": "#00ff41",
+        "secondary": "#008f11",
+        "bg": "#000000",
+        "text": "#00ff41",
+        "accent": "#00ff41",
+        "gradient": "linear-gradient(135deg, #000000 0%, #003b00 100%)"
+    }
+}
+
+
+# Pygments style used for server-side code highlighting in each theme
+THEME_PYGMENTS_STYLES = {
+    "Neon": "fruity",
+    "Cyberpunk": "paraiso-dark",
+    "Solarized": "solarized-dark",
+    "Dracula": "dracula",
+    "Monokai": "monokai",
+    "Nord": "nord",
+    "Ocean": "material",
+    "Matrix": "rrt"
+}
+
+
+# Custom CSS for Modern Theme with advanced styling
+def render_stylesheet(colors: Dict[str, str]) -> str:
+    return f"""
+        /* Base styles */
+        .main {{
+            background: {colors['gradient']} !important;
+            color: {colors['text']} !important;
+        }}
+        
+        /* Input fields */
+        .stTextInput input, .stSelectbox select, .stTextArea textarea {{
+            color: {colors['primary']} !important;
+            background: rgba(0,0,0,0.2) !important;
+            border-radius: 12px !important;
+            border: 1px solid {colors['secondary']} !important;
+            padding: 10px 15px !important;
+            box-shadow: 0 2px 10px rgba(0,0,0,0.1) !important;
+            transition: all 0.3s ease !important;
+        }}
+        
+        .stTextInput input:focus, .stSelectbox select:focus, .stTextArea textarea:focus {{
+            border-color: {colors['accent']} !important;
+            box-shadow: 0 0 0 2px {colors['accent']}33 !important;
+        }}
+        
+        /* Buttons */
+        .stButton>button {{
+            background: rgba(0,0,0,0.3) !important;
+            border: 2px solid {colors['primary']} !important;
+            color: {colors['primary']} !important;
+            border-radius: 12px !important;
+            padding: 8px 16px !important;
+            transition: all 0.3s ease !important;
+            font-weight: 600 !important;
+            box-shadow: 0 4px 6px rgba(0,0,0,0.1) !important;
+        }}
+        
+        .stButton>button:hover {{
+            background: {colors['primary']}22 !important;
+            transform: translateY(-2px) !important;
+            box-shadow: 0 6px 12px {colors['primary']}33 !important;
+        }}
+        
+        /* Code blocks */
+        .code-block {{
+            border: 2px solid {colors['secondary']};
+            border-radius: 15px;
+            padding: 1rem;
+            background: rgba(0,0,0,0.3);
+            margin-bottom: 1rem;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.2);
+        }}
+        
+        /* Server-side highlighted code (token colors are appended per theme) */
+        .astra-highlight {{
+            border: 1px solid {colors['secondary']}55;
+            border-radius: 12px;
+            margin-bottom: 1rem;
+            overflow-x: auto;
+        }}
+        
+        .astra-highlight pre {{
+            margin: 0;
+            padding: 1rem;
+            background: transparent;
+            font-size: 14px;
+            line-height: 1.5;
+        }}
+        
+        /* Sidebar */
+        .sidebar .sidebar-content {{
+            background: rgba(0,0,0,0.3) !important;
+            backdrop-filter: blur(10px) !important;
+            border-right: 1px solid {colors['secondary']}33 !important;
+        }}
+        
+        /* Headers */
+        h1, h2, h3, h4, h5, h6 {{
+            color: {colors['primary']} !important;
+            text-shadow: 0 2px 4px rgba(0,0,0,0.3);
+        }}
+        
+        /* Expander */
+        .st-expander {{
+            background: rgba(0,0,0,0.2) !important;
+            border: 1px solid {colors['secondary']} !important;
+            border-radius: 12px !important;
+        }}
+        
+        .st-expander .st-expanderHeader {{
+            color: {colors['primary']} !important;
+            font-weight: 600 !important;
+        }}
+        
+        /* Progress bar */
+        .stProgress > div > div > div {{
+            background: {colors['accent']} !important;
+        }}
+        
+        /* Custom scrollbar */
+        ::-webkit-scrollbar {{
+            width: 8px;
+            height: 8px;
+        }}
+        
+        ::-webkit-scrollbar-track {{
+            background: rgba(0,0,0,0.1);
+        }}
+        
+        ::-webkit-scrollbar-thumb {{
+            background: {colors['secondary']};
+            border-radius: 4px;
+        }}
+        
+        ::-webkit-scrollbar-thumb:hover {{
+            background: {colors['primary']};
+        }}
+        
+        /* Custom cards */
+        .custom-card {{
+            background: rgba(0,0,0,0.2) !important;
+            border-radius: 16px !important;
+            padding: 20px !important;
+            border: 1px solid {colors['secondary']}33 !important;
+            box-shadow: 0 8px 16px rgba(0,0,0,0.1) !important;
+            margin-bottom: 20px !important;
+        }}
+        
+        /* Tooltips */
+        .stTooltip {{
+            background: {colors['bg']} !important;
+            color: {colors['text']} !important;
+            border: 1px solid {colors['secondary']} !important;
+            border-radius: 8px !important;
+        }}
+        
+        /* Tabs */
+        .stTabs [data-baseweb="tab-list"] {{
+            gap: 8px;
+        }}
+        
+        .stTabs [data-baseweb="tab"] {{
+            background: rgba(0,0,0,0.2) !important;
+            border-radius: 12px !important;
+            padding: 8px 16px !important;
+            transition: all 0.3s ease !important;
+        }}
+        
+        .stTabs [aria-selected="true"] {{
+            background: {colors['primary']}22 !important;
+            color: {colors['primary']} !important;
+            font-weight: 600 !important;
+            border: 1px solid {colors['primary']} !important;
+        }}
+    """
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+class CompiledTheme:
+    def __init__(self, name: str, css: str):
+        self.name = name
+        self.css = css
+
+
+@lru_cache(maxsize=None)
+def compiled_theme(name: str) -> CompiledTheme:
+    """The minified stylesheet of theme ``name`` (unknown names get the first theme).
+
+    Compiled on first use and kept for the life of the process; reruns only
+    pick the precomputed stylesheet.
+    """
+    if name not in THEME_PROPERTIES:
+        name = THEMES[0]
+    css = render_stylesheet(THEME_PROPERTIES[name]) + style_definitions(THEME_PYGMENTS_STYLES[name])
+    return CompiledTheme(name, minify_css(css))
@@ -0,0 +1,59 @@
+import ast
+from typing import List, Optional
+
+from pygments.token import Error, Operator, Punctuation, Text
+
+from codeblock import open_fence
+from highlight import get_lexer
+
+BRACKETS = {")": "(", "]": "[", "}": "{"}
+OPENERS = set(BRACKETS.values())
+
+
+def _line_of(code: str, position: int) -> int:
+    return code.count("\n", 0, position) + 1
+
+
+def check_tokens(code: str, language: str, final: bool = True) -> Optional[str]:
+    """First structural error the language's Pygments lexer finds in ``code``, or None.
+
+    Errors are lexer error tokens and mismatched brackets (strings and
+    comments are skipped by the lexer). With ``final=False`` the code is a
+    streamed prefix: only complete lines are checked and unclosed brackets
+    are expected.
+    """
+    limit = len(code) if final else code.rfind("\n") + 1
+    stack: List[str] = []
+    for position, token_type, value in get_lexer(language).get_tokens_unprocessed(code[:limit]):
+        if token_type in Error:
+            return f"unexpected {value.strip()[:20]!r} on line {_line_of(code, position)}"
+        if token_type in Punctuation or token_type in Operator or token_type in Text:
+            for offset, char in enumerate(value):
+                if char in OPENERS:
+                    stack.append(char)
+                elif char in BRACKETS:
+                    if not stack or stack.pop() != BRACKETS[char]:
+                        return f"unmatched {char!r} on line {_line_of(code, position + offset)}"
+    if final and stack:
+        return f"unclosed {stack[-1]!r}"
+    return None
+
+
+def validate_code(code: str, language: str, raw: Optional[str] = None) -> Optional[str]:
+    """Why finished ``code`` is unusable (empty, truncated, not parseable), or None if it looks valid.
+
+    ``raw`` is the full response the code was extracted from; a code fence
+    left open in it means the answer was cut off. Python is parsed with
+    ``ast``; other languages get the lexer checks of ``check_tokens``.
+    """
+    if not code.strip():
+        return "no code in the response"
+    if raw is not None and open_fence(raw):
+        return "code block was cut off"
+    if language == "Python":
+        try:
+            ast.parse(code)
+        except SyntaxError as e:
+            return f"{e.msg} on line {e.lineno}"
+        return None
+    return check_tokens(code, language)